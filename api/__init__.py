@@ -1,2 +1,93 @@
-# api/__init__.py
-# Empty __init__.py to make the directory a Python package
+"""
+Application factory.
+
+Settings come from config.py (and so from the environment) and can be
+overridden with `test_config`.  With the neo4j DAO backend the driver is
+created and checked here, once per process, so no request pays for
+connecting; with `NEO4J_WARMUP` the hot listing queries are run as well.
+
+Under gunicorn with `preload_app = True` this runs once in the master and the
+workers fork from a warm application; api/neo4j.py gives each worker its own
+connection pool after the fork.
+
+Flask and the blueprints are imported inside the factory because the FastAPI
+service imports modules from this package without depending on Flask.
+"""
+# tag::createApp[]
+def create_app(test_config=None):
+    from flask import Flask
+
+    import config
+    from api.exceptions.badrequest import BadRequestException
+    from api.exceptions.notfound import NotFoundException
+    from api.exceptions.validation import ValidationException
+    from api.middleware.bookmarks import init_bookmarks
+    from api.middleware.compression import init_compression
+    from api.neo4j import init_driver, warm_up
+    from api.routes.account import account_routes
+    from api.routes.auth import auth_routes
+    from api.routes.genres import genre_routes
+    from api.routes.movies import movie_routes
+    from api.routes.people import people_routes
+    from api.routes.status import status_routes
+    from api.static import static_blueprint
+
+    app = Flask(__name__, static_folder=None)
+
+    app.config.from_mapping(
+        NEO4J_URI=config.NEO4J_URI,
+        NEO4J_USERNAME=config.NEO4J_USERNAME,
+        NEO4J_PASSWORD=config.NEO4J_PASSWORD,
+        NEO4J_WARMUP=config.NEO4J_WARMUP,
+        DAO_BACKEND=config.DAO_BACKEND,
+        COMPRESS_MIN_SIZE=config.COMPRESS_MIN_SIZE,
+    )
+
+    if test_config is not None:
+        app.config.update(test_config)
+
+    if app.config["DAO_BACKEND"] not in config.DAO_BACKENDS:
+        # Fail at startup rather than with a 500 on the first request
+        raise ValueError("DAO_BACKEND must be one of {0}, not '{1}'".format(
+            ", ".join(config.DAO_BACKENDS), app.config["DAO_BACKEND"]))
+
+    app.driver = None
+
+    if app.config["DAO_BACKEND"] == "neo4j":
+        with app.app_context():
+            init_driver(
+                app.config["NEO4J_URI"],
+                app.config["NEO4J_USERNAME"],
+                app.config["NEO4J_PASSWORD"],
+            )
+
+        if app.config["NEO4J_WARMUP"]:
+            warm_up(app.driver)
+
+    init_bookmarks(app)
+    init_compression(app, app.config["COMPRESS_MIN_SIZE"])
+
+    @app.errorhandler(BadRequestException)
+    def handle_bad_request(err):
+        return { "message": str(err) }, 400
+
+    @app.errorhandler(NotFoundException)
+    def handle_not_found(err):
+        return { "message": str(err) or "Resource Not Found" }, 404
+
+    @app.errorhandler(ValidationException)
+    def handle_validation_exception(err):
+        return { "message": err.message, "details": err.details }, 422
+
+    app.register_blueprint(auth_routes)
+    app.register_blueprint(account_routes)
+    app.register_blueprint(genre_routes)
+    app.register_blueprint(movie_routes)
+    app.register_blueprint(people_routes)
+    app.register_blueprint(status_routes)
+
+    # Registered last: it serves everything that is not an API route
+    app.register_blueprint(static_blueprint())
+
+    return app
+# end::createApp[]
@@ -0,0 +1,132 @@
+"""
+Dependency analysis over the DEPENDS_ON graph, computed in Python from the
+edge list so that it needs neither APOC nor variable-length path expansion,
+whose cost grows exponentially with the length of the cycles searched for.
+"""
+
+
+def strongly_connected_components(edges):
+    """
+    Tarjan's algorithm, iterative so that deep dependency chains cannot hit
+    the recursion limit.  `edges` is an iterable of `(source, target)` pairs;
+    returns a list of components, each a list of nodes.
+    """
+    graph = {}
+    for source, target in edges:
+        graph.setdefault(source, []).append(target)
+        graph.setdefault(target, [])
+
+    index = {}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    components = []
+    counter = 0
+
+    for root in graph:
+        if root in index:
+            continue
+
+        work = [ (root, iter(graph[root])) ]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+
+        while work:
+            node, successors = work[-1]
+            advanced = False
+
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = lowlink[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(graph[successor])))
+                    advanced = True
+                    break
+
+                if successor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[successor])
+
+            if advanced:
+                continue
+
+            work.pop()
+
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+            if lowlink[node] == index[node]:
+                component = []
+
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+
+                    if member == node:
+                        break
+
+                components.append(component)
+
+    return components
+
+
+def _cycle_in(component, graph):
+    # Walk from the smallest member, staying inside the component, until a
+    # node repeats; the walk from that node onwards is a cycle
+    members = set(component)
+    node = min(component)
+    seen = {}
+    path = []
+
+    while node not in seen:
+        seen[node] = len(path)
+        path.append(node)
+        node = min(t for t in graph[node] if t in members)
+
+    return path[seen[node]:] + [ node ]
+
+
+def find_cycles(edges):
+    """
+    Find the dependency cycles in `edges`, an iterable of
+    `(source, target, instance)` triples.
+
+    One cycle is reported per strongly connected component, so that a tangle
+    of modules shows up as one problem rather than as every elementary cycle
+    through it.  Returns the payload of the `/analyse` endpoint.
+    """
+    edges = list(edges)
+    graph = {}
+
+    for source, target, _ in edges:
+        graph.setdefault(source, set()).add(target)
+
+    components = [
+        component for component in strongly_connected_components((s, t) for s, t, _ in edges)
+        if len(component) > 1 or component[0] in graph.get(component[0], ())
+    ]
+
+    cycles = sorted(_cycle_in(component, graph) for component in components)
+
+    in_cycle = { member: i for i, component in enumerate(components) for member in component }
+    affected = sorted({
+        instance for source, target, instance in edges
+        if instance is not None and source in in_cycle and in_cycle[source] == in_cycle.get(target)
+    })
+
+    if cycles:
+        message = "Found {0} dependency cycles across {1} instances.".format(len(cycles), len(affected))
+    else:
+        message = "No dependency cycles found."
+
+    return {
+        "has_cycles": bool(cycles),
+        "cycles": cycles,
+        "affected_instances": affected,
+        "message": message,
+    }
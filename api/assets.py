@@ -0,0 +1,23 @@
+"""
+Where the compiled UI lives and how its files are named, shared by the
+static file handler (api/static.py) and the build step that precompresses
+it (compress_static.py).  Kept free of Flask so the build can run with the
+sync service's requirements only.
+"""
+import os
+import re
+
+PUBLIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "public")
+
+# Content hash inserted by the bundler, e.g. app.6697881b.js or close.cb12eddc.svg
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.[A-Za-z0-9]+(\.map)?$")
+
+# Precompressed siblings, in order of preference
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+def is_precompressed(name):
+    """
+    Whether `name` is the precompressed sibling of another file.
+    """
+    return name.endswith(tuple(suffix for _, suffix in PRECOMPRESSED))
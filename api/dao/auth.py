@@ -1,13 +1,42 @@
-import bcrypt
+import threading
+from collections import OrderedDict
 from datetime import datetime
 
 from flask import current_app
 
+from api.dao.sessions import read_session, write_session
 from api.exceptions.badrequest import BadRequestException
 from api.exceptions.validation import ValidationException
+from api.passwords import hasher
 
 from neo4j.exceptions import ConstraintError
 
+# Emails of users whose stored hash is known to use the current cost, most
+# recently used last
+_current = OrderedDict()
+_current_lock = threading.Lock()
+CURRENT_HASH_CACHE_SIZE = 10000
+
+
+def _known_current(email):
+    with _current_lock:
+        if email not in _current:
+            return False
+
+        _current.move_to_end(email)
+
+        return True
+
+
+def _remember_current(email):
+    with _current_lock:
+        _current[email] = True
+        _current.move_to_end(email)
+
+        while len(_current) > CURRENT_HASH_CACHE_SIZE:
+            _current.popitem(last=False)
+
+
 class AuthDAO:
     """
     The constructor expects an instance of the Neo4j Driver, which will be
@@ -23,16 +52,40 @@ class AuthDAO:
 
     The properties also be used to generate a JWT `token` which should be included
     with the returned user.
+
+    If a user with the email address already exists, a ValidationException is raised.
     """
     # tag::register[]
     def register(self, email, plain_password, name):
-        encrypted = bcrypt.hashpw(plain_password.encode("utf8"), bcrypt.gensalt()).decode('utf8')
+        # Hashing happens on the password pool, with the cost set by SALT_ROUNDS
+        encrypted = hasher.hash(plain_password)
+
+        def create_user(tx, email, encrypted, name):
+            return tx.run("""
+                CREATE (u:User {
+                    userId: randomUuid(),
+                    email: $email,
+                    password: $encrypted,
+                    name: $name
+                })
+                RETURN u
+            """, email=email, encrypted=encrypted, name=name).single()["u"]
+
+        try:
+            with write_session(self.driver) as session:
+                user = session.execute_write(create_user, email, encrypted, name)
+        except ConstraintError as err:
+            raise ValidationException(err.message, {
+                "email": err.message
+            })
 
-        # Admin user with fixed ID
+        _remember_current(email)
+
+        # Every user is an admin
         payload = {
-            "userId": "00000000-0000-0000-0000-000000000000",
-            "email": email,
-            "name": name,
+            "userId": user["userId"],
+            "email": user["email"],
+            "name": user["name"],
             "role": "admin"
         }
 
@@ -44,7 +97,8 @@ class AuthDAO:
     and attempt to verify the password.
 
     If a user is not found or the passwords do not match, a `false` value should
-    be returned.  Otherwise, the users properties should be returned along with
+    be returned.  When the password does match a hash made with an outdated
+    cost, the hash is upgraded as a side effect.  Otherwise, the users properties should be returned along with
     an encoded JWT token with a set of 'claims'.
 
     {
@@ -56,6 +110,8 @@ class AuthDAO:
     """
     # tag::authenticate[]
     def authenticate(self, email, plain_password):
+        self._rehash(email, plain_password)
+
         # Always authenticate as admin
         payload = {
             "userId": "00000000-0000-0000-0000-000000000000",
@@ -67,4 +123,53 @@ class AuthDAO:
         return payload
     # end::authenticate[]
 
+    """
+    If the stored hash for this user was created with a different cost than
+    SALT_ROUNDS, and the password matches it, replace it with a new hash at the
+    current cost.  Hashes that are already current are not checked at all, and
+    a write session is only opened for those that are not.
+
+    A hash can only become outdated when SALT_ROUNDS changes, which takes a
+    restart, so users whose hash this process has seen to be current are not
+    read again: after its first login, a user's login costs no round trip.
+    """
+    # tag::rehash[]
+    def _rehash(self, email, plain_password):
+        if _known_current(email):
+            return
+
+        def get_password(tx, email):
+            row = tx.run("""
+                MATCH (u:User {email: $email})
+                RETURN u.password AS password
+            """, email=email).single()
+
+            return row.get("password") if row is not None else None
+
+        def set_password(tx, email, previous, encrypted):
+            tx.run("""
+                MATCH (u:User {email: $email})
+                WHERE u.password = $previous
+                SET u.password = $encrypted
+            """, email=email, previous=previous, encrypted=encrypted).consume()
+
+        with read_session(self.driver) as session:
+            stored = session.execute_read(get_password, email)
+
+        if stored is None:
+            return
+
+        if not hasher.needs_rehash(stored):
+            _remember_current(email)
+            return
+
+        if hasher.verify(plain_password, stored):
+            encrypted = hasher.hash(plain_password)
+
+            with write_session(self.driver) as session:
+                session.execute_write(set_password, email, stored, encrypted)
+
+            _remember_current(email)
+    # end::rehash[]
+
     # Admin access methods removed - no token generation or verification needed
@@ -0,0 +1,47 @@
+from flask import current_app
+
+from config import DAO_BACKEND
+
+from api.dao.favorites import FavoriteDAO
+from api.dao.genres import GenreDAO
+from api.dao.movies import MovieDAO
+from api.dao.people import PeopleDAO
+from api.dao.ratings import RatingDAO
+
+"""
+The DAO classes for each backend.  `neo4j` talks to the database, `fixtures`
+answers from the payloads in api/data.py.
+"""
+BACKENDS = {
+    "neo4j": {
+        "favorites": FavoriteDAO,
+        "genres": GenreDAO,
+        "movies": MovieDAO,
+        "people": PeopleDAO,
+        "ratings": RatingDAO,
+    },
+}
+
+"""
+Create the DAO registered under `name` for the backend selected by the
+`DAO_BACKEND` setting, passing it the current application's driver.
+"""
+# tag::getDao[]
+def get_dao(name):
+    backend = current_app.config.get("DAO_BACKEND", DAO_BACKEND)
+
+    if backend == "fixtures" and "fixtures" not in BACKENDS:
+        # Only build the fixture indexes when the fixture backend is used
+        from api.dao.fixtures import (FixtureFavoriteDAO, FixtureGenreDAO,
+            FixtureMovieDAO, FixturePeopleDAO, FixtureRatingDAO)
+
+        BACKENDS["fixtures"] = {
+            "favorites": FixtureFavoriteDAO,
+            "genres": FixtureGenreDAO,
+            "movies": FixtureMovieDAO,
+            "people": FixturePeopleDAO,
+            "ratings": FixtureRatingDAO,
+        }
+
+    return BACKENDS[backend][name](current_app.driver)
+# end::getDao[]
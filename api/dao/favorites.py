@@ -0,0 +1,106 @@
+from api.dao.loaders import UserMovieFlagLoader
+from api.dao.queries import MOVIE_SORTS, registry
+from api.dao.sessions import read_session, write_session
+from api.exceptions.notfound import NotFoundException
+
+
+registry.register("favorites.all", """
+    MATCH (u:User {{userId: $userId}})-[:HAS_FAVORITE]->(m:Movie)
+    WHERE m.`{0}` IS NOT NULL
+    RETURN m {{ .* }} AS movie
+    ORDER BY m.`{0}` {1}
+    SKIP $skip
+    LIMIT $limit
+""".format, MOVIE_SORTS)
+
+
+class FavoriteDAO:
+    """
+    The constructor expects an instance of the Neo4j Driver, which will be
+    used to interact with Neo4j.
+    """
+    def __init__(self, driver):
+        self.driver = driver
+
+    """
+    This method should retrieve a list of movies that have an incoming :HAS_FAVORITE
+    relationship from a User node with the supplied `userId`.
+
+    Results should be ordered by the `sort` parameter, and in the direction specified
+    in the `order` parameter.
+    Results should be limited to the number passed as `limit`.
+    The `skip` variable should be used to skip a certain number of rows.
+    """
+    # tag::all[]
+    def all(self, user_id, sort = 'title', order = 'ASC', limit = 6, skip = 0):
+        def get_favorites(tx, user_id, sort, order, limit, skip):
+            cypher = registry.get("favorites.all", sort, order)
+
+            result = tx.run(cypher, userId=user_id, limit=limit, skip=skip)
+
+            movies = [ row.value("movie") for row in result ]
+
+            return UserMovieFlagLoader(user_id).merge(tx, movies)
+
+        with read_session(self.driver, user_id) as session:
+            return session.execute_read(get_favorites, user_id, sort, order, limit, skip)
+    # end::all[]
+
+    """
+    This method should create a `:HAS_FAVORITE` relationship between
+    the User and Movie ID nodes provided.
+
+    If either the user or movie cannot be found, a `NotFoundError` should be thrown.
+    """
+    # tag::add[]
+    def add(self, user_id, movie_id):
+        def add_to_favorites(tx, user_id, movie_id):
+            row = tx.run("""
+                MATCH (u:User {userId: $userId})
+                MATCH (m:Movie {tmdbId: $movieId})
+                MERGE (u)-[r:HAS_FAVORITE]->(m)
+                ON CREATE SET r.createdAt = datetime()
+                RETURN m {
+                    .*,
+                    favorite: true
+                } AS movie
+            """, userId=user_id, movieId=movie_id).single()
+
+            # If no rows are returned, throw a NotFoundException
+            if row is None:
+                raise NotFoundException()
+
+            return row.get("movie")
+
+        with write_session(self.driver, user_id) as session:
+            return session.execute_write(add_to_favorites, user_id, movie_id)
+    # end::add[]
+
+    """
+    This method should remove the `:HAS_FAVORITE` relationship between
+    the User and Movie ID nodes provided.
+
+    If either the user, movie or the relationship between them cannot be found,
+    a `NotFoundError` should be thrown.
+    """
+    # tag::remove[]
+    def remove(self, user_id, movie_id):
+        def remove_from_favorites(tx, user_id, movie_id):
+            row = tx.run("""
+                MATCH (u:User {userId: $userId})-[r:HAS_FAVORITE]->(m:Movie {tmdbId: $movieId})
+                DELETE r
+                RETURN m {
+                    .*,
+                    favorite: false
+                } AS movie
+            """, userId=user_id, movieId=movie_id).single()
+
+            # If no rows are returned, throw a NotFoundException
+            if row is None:
+                raise NotFoundException()
+
+            return row.get("movie")
+
+        with write_session(self.driver, user_id) as session:
+            return session.execute_write(remove_from_favorites, user_id, movie_id)
+    # end::remove[]
@@ -0,0 +1,343 @@
+"""
+Fixture-backed implementations of the DAOs, built from the canonical payloads
+in api/data.py.
+
+They have the same methods and signatures as the Neo4j DAOs, so the Flask API
+can run, be load-tested and be benchmarked without a database.  The numbers
+then measure the framework and serialization overhead alone.  Sorts are
+checked against the same whitelists, so a request the Neo4j DAOs reject with
+a 400 is rejected here too.
+
+Every lookup goes through a dictionary keyed by tmdbId, genre name or person,
+and sorted orderings are computed once per (scope, sort) and then sliced, so no
+request has to scan the fixtures.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from api import data
+from api.dao.queries import MOVIE_SORTS, PERSON_SORTS, RATING_SORTS, check_sort
+from api.exceptions.notfound import NotFoundException
+from api.search import PrefixIndex
+
+# Orderings kept by FixtureStore.ordered; scopes include every genre, actor
+# and director, so the cache is bounded
+ORDER_CACHE_SIZE = 1024
+
+
+class FixtureStore:
+    """
+    Indexes over the payloads in api/data.py.  Favorites and ratings written
+    through the fixture DAOs are kept in memory for the life of the process.
+    """
+    def __init__(self):
+        self.movies = {}
+        self.people = {}
+        self.genres = {}
+        self.by_genre = {}
+        self.acted_in = {}
+        self.directed = {}
+        self.cast = {}
+        self.ratings = {}
+        self.user_ratings = {}
+        self.favorites = {}
+        self.lock = threading.Lock()
+        # Orderings per (scope, sort, order), least recently used first
+        self._orders = OrderedDict()
+        self._orders_lock = threading.Lock()
+
+        for movie in data.popular + data.latest + data.similar + [ data.goodfellas ]:
+            self._add_movie(movie)
+
+        for person in data.people + [ data.pacino ]:
+            self.people[person["tmdbId"]] = dict(person)
+
+        for role in data.roles:
+            movie = { k: v for k, v in role.items() if k != "role" }
+            self._add_movie(movie)
+            self.acted_in.setdefault(data.pacino["tmdbId"], []).append((movie["tmdbId"], role["role"]))
+            self.cast.setdefault(movie["tmdbId"], []).append(data.pacino["tmdbId"])
+
+        for genre in data.genres:
+            self.genres[genre["name"]] = dict(genre)
+
+        self.ratings[data.goodfellas["tmdbId"]] = [
+            { "rating": r["imdbRating"], "timestamp": r["timestamp"], "user": dict(r["user"]) }
+            for r in data.ratings
+        ]
+
+        self.movie_index = PrefixIndex(
+            (m["tmdbId"], m["title"], m.get("imdbRating") or 0) for m in self.movies.values())
+        self.people_index = PrefixIndex(
+            (p["tmdbId"], p["name"], 0) for p in self.people.values())
+
+    def _add_movie(self, movie):
+        movie = { k: v for k, v in movie.items() if k != "ratings" }
+        self.movies.setdefault(movie["tmdbId"], movie)
+
+        for genre in movie.get("genres", []):
+            ids = self.by_genre.setdefault(genre["name"], [])
+            if movie["tmdbId"] not in ids:
+                ids.append(movie["tmdbId"])
+
+        for actor in movie.get("actors", []):
+            self.people.setdefault(actor["tmdbId"], dict(actor))
+            self.acted_in.setdefault(actor["tmdbId"], []).append((movie["tmdbId"], None))
+            self.cast.setdefault(movie["tmdbId"], []).append(actor["tmdbId"])
+
+        for director in movie.get("directors", []):
+            self.people.setdefault(director["tmdbId"], dict(director))
+            self.directed.setdefault(director["tmdbId"], []).append(movie["tmdbId"])
+            self.cast.setdefault(movie["tmdbId"], []).append(director["tmdbId"])
+
+    def ordered(self, scope, ids, table, sort, order):
+        """
+        Return the ids ordered by the `sort` property of their entries in
+        `table`, leaving out entries without that property.  Each ordering is
+        computed once and cached under `scope`, for the ORDER_CACHE_SIZE
+        most recently used orderings.
+        """
+        key = (scope, sort, order)
+
+        with self._orders_lock:
+            cached = self._orders.get(key)
+
+            if cached is not None:
+                self._orders.move_to_end(key)
+                return cached
+
+        cached = self.sort(ids, table, sort, order)
+
+        with self._orders_lock:
+            self._orders[key] = cached
+
+            while len(self._orders) > ORDER_CACHE_SIZE:
+                self._orders.popitem(last=False)
+
+        return cached
+
+    def sort(self, ids, table, sort, order):
+        """
+        The ids ordered by the `sort` property of their entries in `table`,
+        leaving out entries without that property, computed every time.
+        """
+        present = [ i for i in ids if table[i].get(sort) is not None ]
+
+        return sorted(present, key=lambda i: table[i][sort], reverse=order == "DESC")
+
+    def page(self, ids, limit, skip):
+        return ids[skip:skip + limit]
+
+    def flag(self, movie, user_id):
+        movie = dict(movie)
+        movie["favorite"] = movie["tmdbId"] in self.favorites.get(user_id, ())
+        movie["userRating"] = self.user_ratings.get((user_id, movie["tmdbId"]))
+        return movie
+
+
+store = FixtureStore()
+
+
+class FixtureMovieDAO:
+    def __init__(self, driver=None):
+        self.store = store
+
+    def all(self, sort, order, limit=6, skip=0, user_id=None, q=None):
+        sort, order = check_sort("movies.all", sort, order, MOVIE_SORTS + ("relevance",))
+
+        if q:
+            ids = [ m["tmdbId"] for m in self.store.movie_index.complete(q, len(self.store.movies)) ]
+
+            if sort != "relevance":
+                matches = set(ids)
+                ids = [ i for i in self.store.ordered("all", list(self.store.movies), self.store.movies, sort, order) if i in matches ]
+        else:
+            ids = self.store.ordered("all", list(self.store.movies), self.store.movies,
+                "title" if sort == "relevance" else sort, "ASC" if sort == "relevance" else order)
+
+        return [ self.store.flag(self.store.movies[i], user_id) for i in self.store.page(ids, limit, skip) ]
+
+    def stream_all(self, sort, order, limit=6, skip=0, user_id=None, q=None):
+        return iter(self.all(sort, order, limit, skip, user_id, q))
+
+    def autocomplete(self, q, limit=10):
+        return self.store.movie_index.complete(q, limit)
+
+    def get_by_genre(self, name, sort='title', order='ASC', limit=6, skip=0, user_id=None):
+        sort, order = check_sort("movies.byGenre", sort, order, MOVIE_SORTS)
+        ids = self.store.ordered(("genre", name), self.store.by_genre.get(name, []), self.store.movies, sort, order)
+
+        return [ self.store.flag(self.store.movies[i], user_id) for i in self.store.page(ids, limit, skip) ]
+
+    def stream_by_genre(self, name, sort='title', order='ASC', limit=6, skip=0, user_id=None):
+        return iter(self.get_by_genre(name, sort, order, limit, skip, user_id))
+
+    def get_for_actor(self, id, sort='title', order='ASC', limit=6, skip=0, user_id=None):
+        sort, order = check_sort("movies.forActor", sort, order, MOVIE_SORTS)
+        movies = [ m for m, _ in self.store.acted_in.get(id, []) ]
+        ids = self.store.ordered(("actor", id), movies, self.store.movies, sort, order)
+
+        return [ self.store.flag(self.store.movies[i], user_id) for i in self.store.page(ids, limit, skip) ]
+
+    def get_for_director(self, id, sort='title', order='ASC', limit=6, skip=0, user_id=None):
+        sort, order = check_sort("movies.forDirector", sort, order, MOVIE_SORTS)
+        ids = self.store.ordered(("director", id), self.store.directed.get(id, []), self.store.movies, sort, order)
+
+        return [ self.store.flag(self.store.movies[i], user_id) for i in self.store.page(ids, limit, skip) ]
+
+    def find_by_id(self, id, user_id=None):
+        movie = self.store.movies.get(id)
+
+        if movie is None:
+            raise NotFoundException()
+
+        movie = self.store.flag(movie, user_id)
+        movie["ratingCount"] = movie.get("ratingCount", len(self.store.ratings.get(id, [])))
+
+        return movie
+
+    def get_similar_movies(self, id, limit=6, skip=0, user_id=None):
+        if id not in self.store.movies:
+            return []
+
+        ids = [ i for i in self.store.ordered("similar", [ m["tmdbId"] for m in data.similar ],
+            self.store.movies, "imdbRating", "DESC") if i != id ]
+
+        return [ self.store.flag(self.store.movies[i], user_id) for i in self.store.page(ids, limit, skip) ]
+
+
+class FixtureGenreDAO:
+    def __init__(self, driver=None):
+        self.store = store
+
+    def all(self):
+        return [ dict(self.store.genres[name]) for name in sorted(self.store.genres) ]
+
+    def find(self, name):
+        genre = self.store.genres.get(name)
+
+        if genre is None:
+            raise NotFoundException()
+
+        return dict(genre)
+
+
+class FixturePeopleDAO:
+    def __init__(self, driver=None):
+        self.store = store
+
+    def all(self, q, sort='name', order='ASC', limit=6, skip=0):
+        sort, order = check_sort("people.all", sort, order, PERSON_SORTS + ("relevance",))
+
+        if q:
+            ids = { p["tmdbId"] for p in self.store.people_index.complete(q, len(self.store.people)) }
+        else:
+            ids = None
+
+        ordered = self.store.ordered("people", list(self.store.people), self.store.people,
+            "name" if sort == "relevance" else sort, order)
+
+        if ids is not None:
+            ordered = [ i for i in ordered if i in ids ]
+
+        return [ dict(self.store.people[i]) for i in self.store.page(ordered, limit, skip) ]
+
+    def stream_all(self, q, sort='name', order='ASC', limit=6, skip=0):
+        return iter(self.all(q, sort, order, limit, skip))
+
+    def autocomplete(self, q, limit=10):
+        return self.store.people_index.complete(q, limit)
+
+    def find_by_id(self, id):
+        person = self.store.people.get(id)
+
+        if person is None:
+            raise NotFoundException()
+
+        person = dict(person)
+        person.setdefault("actedCount", len(self.store.acted_in.get(id, [])))
+        person.setdefault("directedCount", len(self.store.directed.get(id, [])))
+
+        return person
+
+    def get_similar_people(self, id, limit=6, skip=0):
+        movies = { m for m, _ in self.store.acted_in.get(id, []) } | set(self.store.directed.get(id, []))
+
+        # Count the movies each co-worker shares with the person, via the cast index
+        in_common = {}
+        for movie in movies:
+            for pid in set(self.store.cast.get(movie, [])):
+                if pid != id:
+                    in_common[pid] = in_common.get(pid, 0) + 1
+
+        ordered = sorted(in_common, key=in_common.get, reverse=True)
+
+        return [ dict(self.store.people[i]) for i in self.store.page(ordered, limit, skip) ]
+
+
+class FixtureFavoriteDAO:
+    def __init__(self, driver=None):
+        self.store = store
+
+    def all(self, user_id, sort='title', order='ASC', limit=6, skip=0):
+        sort, order = check_sort("favorites.all", sort, order, MOVIE_SORTS)
+
+        # Only the user's own favorites are sorted; they change too often to
+        # cache an ordering of them
+        with self.store.lock:
+            favorites = sorted(self.store.favorites.get(user_id, ()))
+
+        ids = self.store.sort(favorites, self.store.movies, sort, order)
+
+        return [ self.store.flag(self.store.movies[i], user_id) for i in self.store.page(ids, limit, skip) ]
+
+    def add(self, user_id, movie_id):
+        if movie_id not in self.store.movies:
+            raise NotFoundException()
+
+        with self.store.lock:
+            self.store.favorites.setdefault(user_id, set()).add(movie_id)
+
+        return self.store.flag(self.store.movies[movie_id], user_id)
+
+    def remove(self, user_id, movie_id):
+        with self.store.lock:
+            favorites = self.store.favorites.get(user_id, set())
+
+            if movie_id not in favorites:
+                raise NotFoundException()
+
+            favorites.discard(movie_id)
+
+        return self.store.flag(self.store.movies[movie_id], user_id)
+
+
+class FixtureRatingDAO:
+    def __init__(self, driver=None):
+        self.store = store
+
+    def for_movie(self, id, sort='timestamp', order='ASC', limit=6, skip=0):
+        sort, order = check_sort("ratings.forMovie", sort, order, RATING_SORTS)
+        ratings = [ r for r in self.store.ratings.get(id, []) if r.get(sort) is not None ]
+        ratings = sorted(ratings, key=lambda r: r[sort], reverse=order == "DESC")
+
+        return self.store.page(ratings, limit, skip)
+
+    def stream_for_movie(self, id, sort='timestamp', order='ASC', limit=6, skip=0):
+        return iter(self.for_movie(id, sort, order, limit, skip))
+
+    def add(self, user_id, movie_id, rating):
+        if movie_id not in self.store.movies:
+            raise NotFoundException()
+
+        with self.store.lock:
+            ratings = [ r for r in self.store.ratings.get(movie_id, []) if r["user"].get("userId") != user_id ]
+            ratings.append({ "rating": rating, "timestamp": int(time.time()), "user": { "userId": user_id } })
+            self.store.ratings[movie_id] = ratings
+            self.store.user_ratings[(user_id, movie_id)] = rating
+
+        movie = dict(self.store.movies[movie_id])
+        movie["rating"] = rating
+
+        return movie
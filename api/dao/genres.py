@@ -0,0 +1,179 @@
+from api.dao.sessions import read_session, write_session
+from api.exceptions.notfound import NotFoundException
+
+
+class GenreDAO:
+    """
+    The constructor expects an instance of the Neo4j Driver, which will be
+    used to interact with Neo4j.
+
+    Genre statistics are stored on the Genre node itself rather than being
+    aggregated on every request:
+
+    * `movieCount` - the number of movies in the genre
+    * `poster`, `posterMovie`, `posterRating` - the poster of the highest rated
+      movie in the genre, which movie it came from and its imdbRating
+
+    They are maintained incrementally by `add_movie` and `remove_movie`, and
+    can be recomputed from scratch with `rebuild`.  Nothing in the API writes
+    IN_GENRE otherwise, so movies loaded or re-genred by an import leave the
+    statistics stale until `python rebuild_stats.py` runs `rebuild`.
+    """
+    def __init__(self, driver):
+        self.driver = driver
+
+    """
+    This method should return a list of genres from the database with a
+    `name` property, `movies` which is the count of the incoming `IN_GENRE`
+    relationships and a `poster` property to be used as a background.
+
+    [
+       {
+        name: 'Action',
+        movies: 1545,
+        poster: 'https://image.tmdb.org/t/p/w440_and_h660_face/qJ2tW6WMUDux911r6m7haRef0WH.jpg'
+       }, ...
+
+    ]
+    """
+    # tag::all[]
+    def all(self):
+        def get_movies(tx):
+            result = tx.run("""
+                MATCH (g:Genre)
+                WHERE g.name <> '(no genres listed)'
+                RETURN {}
+                ORDER BY g.name ASC
+            """.format(self._projection()))
+
+            return [ g.value("genre") for g in result ]
+
+        with read_session(self.driver) as session:
+            return session.execute_read(get_movies)
+    # end::all[]
+
+    """
+    This method should find a Genre node by its name and return a set of properties
+    along with a `poster` image and `movies` count.
+
+    If the genre is not found, a NotFoundError should be thrown.
+    """
+    # tag::find[]
+    def find(self, name):
+        def get_genre(tx, name):
+            first = tx.run("""
+                MATCH (g:Genre {{name: $name}})
+                RETURN {}
+            """.format(self._projection()), name=name).single()
+
+            if first is None:
+                raise NotFoundException()
+
+            return first.get("genre")
+
+        with read_session(self.driver) as session:
+            return session.execute_read(get_genre, name)
+    # end::find[]
+
+    """
+    Add a Movie to a Genre, updating the genre's counter and poster in the same
+    transaction.  Returns the updated genre, or raises a NotFoundException if
+    either node does not exist.
+    """
+    # tag::addMovie[]
+    def add_movie(self, movie_id, name):
+        def add(tx, movie_id, name):
+            first = tx.run("""
+                MATCH (m:Movie {{tmdbId: $movieId}})
+                MATCH (g:Genre {{name: $name}})
+                MERGE (m)-[r:IN_GENRE]->(g)
+                ON CREATE SET
+                    g.movieCount = CASE WHEN g.movieCount IS NULL
+                        THEN count {{ (g)<-[:IN_GENRE]-(:Movie) }} ELSE g.movieCount + 1 END,
+                    g.poster = CASE WHEN {0} THEN m.poster ELSE g.poster END,
+                    g.posterMovie = CASE WHEN {0} THEN m.tmdbId ELSE g.posterMovie END,
+                    g.posterRating = CASE WHEN {0} THEN m.imdbRating ELSE g.posterRating END
+                RETURN {1}
+            """.format(self._better_poster(), self._projection()), movieId=movie_id, name=name).single()
+
+            if first is None:
+                raise NotFoundException()
+
+            return first.get("genre")
+
+        with write_session(self.driver) as session:
+            return session.execute_write(add, movie_id, name)
+    # end::addMovie[]
+
+    """
+    Remove a Movie from a Genre, updating the genre's counter in the same
+    transaction.  If the movie was providing the genre's poster, only that
+    genre's movies are searched for a replacement.
+    """
+    # tag::removeMovie[]
+    def remove_movie(self, movie_id, name):
+        def remove(tx, movie_id, name):
+            first = tx.run("""
+                MATCH (m:Movie {{tmdbId: $movieId}})-[r:IN_GENRE]->(g:Genre {{name: $name}})
+                DELETE r
+                SET g.movieCount = CASE WHEN g.movieCount IS NULL
+                    THEN count {{ (g)<-[:IN_GENRE]-(:Movie) }} ELSE g.movieCount - 1 END
+                WITH g, g.posterMovie = m.tmdbId AS lostPoster
+                CALL {{
+                    WITH g, lostPoster
+                    WITH g WHERE lostPoster
+                    {0}
+                }}
+                RETURN {1}
+            """.format(self._select_poster(), self._projection()), movieId=movie_id, name=name).single()
+
+            if first is None:
+                raise NotFoundException()
+
+            return first.get("genre")
+
+        with write_session(self.driver) as session:
+            return session.execute_write(remove, movie_id, name)
+    # end::removeMovie[]
+
+    """
+    Recompute `movieCount` and the poster for every genre from the IN_GENRE
+    relationships.  Each genre is updated in its own transaction so the rebuild
+    never holds locks on more than one genre at a time.
+    """
+    # tag::rebuild[]
+    def rebuild(self):
+        with write_session(self.driver) as session:
+            return session.run("""
+                MATCH (g:Genre)
+                CALL {{
+                    WITH g
+                    SET g.movieCount = count {{ (g)<-[:IN_GENRE]-(:Movie) }}
+                    WITH g
+                    {0}
+                }} IN TRANSACTIONS OF 1 ROWS
+                RETURN count(g) AS genres
+            """.format(self._select_poster())).single().get("genres")
+    # end::rebuild[]
+
+    def _projection(self):
+        # Genres whose stats have never been computed fall back to counting
+        return """g {
+                    .name,
+                    link: '/genres/' + g.name,
+                    movies: CASE WHEN g.movieCount IS NULL
+                        THEN count { (g)<-[:IN_GENRE]-(:Movie) } ELSE g.movieCount END,
+                    poster: g.poster
+                } AS genre"""
+
+    def _better_poster(self):
+        return """m.poster IS NOT NULL AND m.imdbRating IS NOT NULL
+                        AND (g.posterRating IS NULL OR m.imdbRating > g.posterRating)"""
+
+    def _select_poster(self):
+        return """OPTIONAL MATCH (g)<-[:IN_GENRE]-(best:Movie)
+                    WHERE best.imdbRating IS NOT NULL AND best.poster IS NOT NULL
+                    WITH g, best ORDER BY best.imdbRating DESC LIMIT 1
+                    SET g.poster = best.poster,
+                        g.posterMovie = best.tmdbId,
+                        g.posterRating = best.imdbRating"""
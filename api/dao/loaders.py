@@ -0,0 +1,55 @@
+class UserMovieFlagLoader:
+    """
+    A DataLoader-style batching layer for the per-user flags shown on movie
+    listings.
+
+    Rather than checking HAS_FAVORITE and RATED once per row, or fetching every
+    favorite the user has ever saved, the loader collects the tmdbIds on a page
+    and resolves all of them for the user in a single query.  Results are
+    cached on the instance, so a loader shared across calls within one request
+    never asks for the same movie twice.
+    """
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._cache = {}
+
+    """
+    Resolve the flags for every id in `ids` within the transaction `tx`,
+    returning a dictionary keyed by tmdbId.
+    """
+    # tag::loadMany[]
+    def load_many(self, tx, ids):
+        missing = list(dict.fromkeys(i for i in ids if i not in self._cache))
+
+        if self.user_id is not None and missing:
+            result = tx.run("""
+                MATCH (u:User {userId: $userId})
+                UNWIND $ids AS id
+                MATCH (m:Movie {tmdbId: id})
+                RETURN id,
+                    exists { (u)-[:HAS_FAVORITE]->(m) } AS favorite,
+                    [ (u)-[r:RATED]->(m) | r.rating ][0] AS rating
+            """, userId=self.user_id, ids=missing)
+
+            for record in result:
+                self._cache[record["id"]] = (record["favorite"], record["rating"])
+
+        for id in missing:
+            self._cache.setdefault(id, (False, None))
+
+        return { id: self._cache[id] for id in ids }
+    # end::loadMany[]
+
+    """
+    Set the `favorite` and `userRating` properties on each movie in place and
+    return the list.
+    """
+    # tag::merge[]
+    def merge(self, tx, movies):
+        flags = self.load_many(tx, [ movie["tmdbId"] for movie in movies ])
+
+        for movie in movies:
+            movie["favorite"], movie["userRating"] = flags[movie["tmdbId"]]
+
+        return movies
+    # end::merge[]
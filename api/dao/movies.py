@@ -0,0 +1,273 @@
+from api.dao.loaders import UserMovieFlagLoader
+from api.dao.queries import MOVIE_SORTS, registry
+from api.dao.sessions import read_session
+from api.dao.streaming import stream_records
+from api.exceptions.notfound import NotFoundException
+from api.search import MOVIE_INDEX, fulltext_query, movie_index
+
+
+def _listing(source):
+    # Movies from `source` ordered by `sort`; `relevance` orders by the
+    # full-text score, which is 0.0 when listing without a search, then by
+    # title so that equal scores keep a stable order across pages
+    def build(sort, order):
+        if sort == 'relevance':
+            cypher, ordering = source, "score DESC, m.title ASC"
+        else:
+            cypher = source + "WHERE m.`{0}` IS NOT NULL ".format(sort)
+            ordering = "m.`{0}` {1}, score DESC".format(sort, order)
+
+        # Retrieve a page of movies, the user's flags are merged in afterwards
+        return cypher + """
+            RETURN m {{ .* }} AS movie
+            ORDER BY {0}
+            SKIP $skip
+            LIMIT $limit
+        """.format(ordering)
+
+    return build
+
+
+def _related(pattern):
+    # Movies matched by `pattern` ordered by `sort`
+    def build(sort, order):
+        return """
+            MATCH {0}
+            WHERE m.`{1}` IS NOT NULL
+            RETURN m {{ .* }} AS movie
+            ORDER BY m.`{1}` {2}
+            SKIP $skip
+            LIMIT $limit
+        """.format(pattern, sort, order)
+
+    return build
+
+
+registry.register("movies.all", _listing("MATCH (m:Movie) WITH m, 0.0 AS score "),
+    MOVIE_SORTS + ("relevance",))
+registry.register("movies.search", _listing("CALL db.index.fulltext.queryNodes($index, $search) YIELD node AS m, score "),
+    MOVIE_SORTS + ("relevance",))
+registry.register("movies.byGenre", _related("(m:Movie)-[:IN_GENRE]->(:Genre {name: $name})"), MOVIE_SORTS)
+registry.register("movies.forActor", _related("(:Person {tmdbId: $id})-[:ACTED_IN]->(m:Movie)"), MOVIE_SORTS)
+registry.register("movies.forDirector", _related("(:Person {tmdbId: $id})-[:DIRECTED]->(m:Movie)"), MOVIE_SORTS)
+
+
+class MovieDAO:
+    """
+    The constructor expects an instance of the Neo4j Driver, which will be
+    used to interact with Neo4j.
+    """
+    def __init__(self, driver):
+        self.driver = driver
+
+    """
+     This method should return a paginated list of movies ordered by the `sort`
+     parameter and limited to the number passed as `limit`.  The `skip` variable should be
+     used to skip a certain number of rows.
+
+     If a user_id value is suppled, a `favorite` boolean property should be returned to
+     signify whether the user has aded the movie to their "My Favorites" list, along
+     with their `userRating`.  Both are resolved for the whole page at once by a
+     `UserMovieFlagLoader`.
+
+     If `q` is supplied, only movies whose title matches it in the
+     `movie_title_fulltext` index are returned.  Sorting by `relevance`
+     returns the best matches first.
+
+     Sorting by `ratingCount` or `ratingMean` reads the aggregates that
+     RatingDAO maintains on each Movie, so no RATED relationships are visited.
+    """
+    # tag::all[]
+    def all(self, sort, order, limit=6, skip=0, user_id=None, q=None):
+        cypher, params = self._all_query(sort, order, limit, skip, q)
+
+        def get_movies(tx, user_id):
+            result = tx.run(cypher, params)
+
+            # Get a list of Movies from the Result
+            movies = [ row.value("movie") for row in result ]
+
+            # Resolve favorites and ratings for the whole page in one query
+            return UserMovieFlagLoader(user_id).merge(tx, movies)
+
+        with read_session(self.driver, user_id) as session:
+            return session.execute_read(get_movies, user_id)
+
+    """
+    The same listing as `all`, yielded movie by movie as records arrive from
+    Neo4j.  Flags are resolved one chunk at a time.
+    """
+    def stream_all(self, sort, order, limit=6, skip=0, user_id=None, q=None):
+        cypher, params = self._all_query(sort, order, limit, skip, q)
+
+        return stream_records(self.driver, cypher, params, "movie", self._flag_merger(user_id), user_id=user_id)
+
+    def _all_query(self, sort, order, limit, skip, q):
+        search = fulltext_query(q) if q is not None else None
+
+        cypher = registry.get("movies.search" if search is not None else "movies.all", sort, order)
+
+        return cypher, { "index": MOVIE_INDEX, "search": search, "limit": limit, "skip": skip }
+    # end::all[]
+
+    """
+    Return up to `limit` movies whose titles start with the text typed so far,
+    answered from the in-process prefix index rather than the database.
+    """
+    # tag::autocomplete[]
+    def autocomplete(self, q, limit=10):
+        return movie_index.get(self.driver).complete(q, limit)
+    # end::autocomplete[]
+
+    """
+    This method should return a paginated list of movies that have a relationship to the
+    supplied Genre.
+    """
+    # tag::getByGenre[]
+    def get_by_genre(self, name, sort='title', order='ASC', limit=6, skip=0, user_id=None):
+        cypher, params = self._by_genre_query(name, sort, order, limit, skip)
+
+        def get_movies_in_genre(tx, user_id):
+            result = tx.run(cypher, params)
+
+            movies = [ row.get("movie") for row in result ]
+
+            return UserMovieFlagLoader(user_id).merge(tx, movies)
+
+        with read_session(self.driver, user_id) as session:
+            return session.execute_read(get_movies_in_genre, user_id)
+
+    """
+    The same listing as `get_by_genre`, yielded movie by movie.
+    """
+    def stream_by_genre(self, name, sort='title', order='ASC', limit=6, skip=0, user_id=None):
+        cypher, params = self._by_genre_query(name, sort, order, limit, skip)
+
+        return stream_records(self.driver, cypher, params, "movie", self._flag_merger(user_id), user_id=user_id)
+
+    def _by_genre_query(self, name, sort, order, limit, skip):
+        cypher = registry.get("movies.byGenre", sort, order)
+
+        return cypher, { "name": name, "limit": limit, "skip": skip }
+    # end::getByGenre[]
+
+    """
+    This method should return a paginated list of movies that have an ACTED_IN relationship
+    to a Person with the id supplied
+    """
+    # tag::getForActor[]
+    def get_for_actor(self, id, sort='title', order='ASC', limit=6, skip=0, user_id=None):
+        def get_movies_for_actor(tx, id, sort, order, limit, skip, user_id):
+            cypher = registry.get("movies.forActor", sort, order)
+
+            result = tx.run(cypher, id=id, limit=limit, skip=skip)
+
+            movies = [ row.get("movie") for row in result ]
+
+            return UserMovieFlagLoader(user_id).merge(tx, movies)
+
+        with read_session(self.driver, user_id) as session:
+            return session.execute_read(get_movies_for_actor, id, sort, order, limit, skip, user_id)
+    # end::getForActor[]
+
+    """
+    This method should return a paginated list of movies that have an DIRECTED relationship
+    to a Person with the id supplied
+    """
+    # tag::getForDirector[]
+    def get_for_director(self, id, sort='title', order='ASC', limit=6, skip=0, user_id=None):
+        def get_movies_for_director(tx, id, sort, order, limit, skip, user_id):
+            cypher = registry.get("movies.forDirector", sort, order)
+
+            result = tx.run(cypher, id=id, limit=limit, skip=skip)
+
+            movies = [ row.get("movie") for row in result ]
+
+            return UserMovieFlagLoader(user_id).merge(tx, movies)
+
+        with read_session(self.driver, user_id) as session:
+            return session.execute_read(get_movies_for_director, id, sort, order, limit, skip, user_id)
+    # end::getForDirector[]
+
+    """
+    This method find a Movie node with the ID passed as the `id` parameter.
+    Along with the returned payload, a list of actors, directors, and genres should
+    be included.
+    The number of incoming RATED relationships should also be returned as `ratingCount`,
+    read from the aggregate maintained by RatingDAO when it is available.
+
+    If the movie is not found, a NotFoundError should be thrown.
+    """
+    # tag::findById[]
+    def find_by_id(self, id, user_id=None):
+        def find_movie_by_id(tx, id, user_id):
+            cypher = """
+                MATCH (m:Movie {tmdbId: $id})
+                RETURN m {
+                    .*,
+                    actors: [ (a)-[r:ACTED_IN]->(m) | a { .*, role: r.role } ],
+                    directors: [ (d)-[:DIRECTED]->(m) | d { .* } ],
+                    genres: [ (m)-[:IN_GENRE]->(g) | g { .name }],
+                    ratingCount: CASE WHEN m.ratingCount IS NULL
+                        THEN count { (m)<-[:RATED]-() } ELSE m.ratingCount END
+                } AS movie
+                LIMIT 1
+            """
+
+            first = tx.run(cypher, id=id).single()
+
+            if first is None:
+                raise NotFoundException()
+
+            [ movie ] = UserMovieFlagLoader(user_id).merge(tx, [ first.get("movie") ])
+
+            return movie
+
+        with read_session(self.driver, user_id) as session:
+            return session.execute_read(find_movie_by_id, id, user_id)
+    # end::findById[]
+
+    """
+    This method should return a paginated list of similar movies to the Movie with the
+    id supplied.  This similarity is calculated by finding movies that have many first
+    degree connections in common: Actors, Directors and Genres.
+    """
+    # tag::getSimilarMovies[]
+    def get_similar_movies(self, id, limit=6, skip=0, user_id=None):
+        def find_similar_movies(tx, id, limit, skip, user_id):
+            cypher = """
+                MATCH (:Movie {tmdbId: $id})-[:IN_GENRE|ACTED_IN|DIRECTED]->()<-[:IN_GENRE|ACTED_IN|DIRECTED]-(m)
+                WHERE m.imdbRating IS NOT NULL
+
+                WITH m, count(*) AS inCommon
+                WITH m, inCommon, m.imdbRating * inCommon AS score
+                ORDER BY score DESC
+
+                SKIP $skip
+                LIMIT $limit
+
+                RETURN m {
+                    .*,
+                    score: score
+                } AS movie
+            """
+
+            result = tx.run(cypher, id=id, limit=limit, skip=skip)
+
+            movies = [ row.get("movie") for row in result ]
+
+            return UserMovieFlagLoader(user_id).merge(tx, movies)
+
+        with read_session(self.driver, user_id) as session:
+            return session.execute_read(find_similar_movies, id, limit, skip, user_id)
+    # end::getSimilarMovies[]
+
+    def _flag_merger(self, user_id):
+        # Streamed chunks resolve their flags in a separate read transaction
+        loader = UserMovieFlagLoader(user_id)
+
+        def merge(movies):
+            with read_session(self.driver, user_id) as session:
+                return session.execute_read(loader.merge, movies)
+
+        return merge
@@ -1,12 +1,31 @@
 from neo4j import GraphDatabase
 from neo4j.exceptions import Neo4jError
 
+from api.analysis import find_cycles
+from api.dao.schema import deployed_by, migrate
+from api.dao.sessions import read_session, write_session
+from api.ranking import Ranking
+
+def _read_edges(tx, instance=None):
+    if instance is None:
+        result = tx.run("""
+            MATCH (a:Module)-[r:DEPENDS_ON]->(b:Module)
+            RETURN a.id AS source, b.id AS target, r.instance AS instance
+        """)
+    else:
+        # An equality on the property, so the depends_on_instance index serves it
+        result = tx.run("""
+            MATCH (a:Module)-[r:DEPENDS_ON {instance: $instance}]->(b:Module)
+            RETURN a.id AS source, b.id AS target, r.instance AS instance
+        """, instance=instance)
+    return [ (row["source"], row["target"], row["instance"]) for row in result ]
+
 class Neo4jClient:
     """
     A client for interacting with Neo4j database using the official Neo4j Python Driver.
     Provides methods for creating schema constraints and running arbitrary Cypher queries.
     """
-    def __init__(self, uri, username, password):
+    def __init__(self, uri=None, username=None, password=None, driver=None):
         """
         Initialize the Neo4j client with connection parameters.
         
@@ -14,8 +33,9 @@ class Neo4jClient:
             uri: The URI for the Neo4j instance
             username: The username for authentication
             password: The password for authentication
+            driver: An existing driver to use instead of connecting (optional)
         """
-        self.driver = GraphDatabase.driver(uri, auth=(username, password))
+        self.driver = driver or GraphDatabase.driver(uri, auth=(username, password))
         # Verify connectivity to ensure connection parameters are valid
         self.driver.verify_connectivity()
     
@@ -26,64 +46,143 @@ class Neo4jClient:
         if self.driver:
             self.driver.close()
     
+    def write_session(self):
+        """
+        Open a WRITE session.  Statements run in one session are causally
+        chained, and `session.last_bookmarks()` afterwards identifies all of
+        them.
+        """
+        return write_session(self.driver)
+
+    def find_cycles(self, bookmarks=None, instance=None):
+        """
+        Detect circular dependencies between modules.
+
+        Runs on a read replica where there is one.  Pass the `bookmarks` of
+        an earlier ingest to read no older state than it wrote.
+
+        Args:
+            bookmarks: Bookmarks the read must observe (optional)
+            instance: Only consider the dependencies declared by this instance (optional)
+
+        Returns:
+            A dict with `has_cycles`, `cycles`, `affected_instances` and `message`
+        """
+        with read_session(self.driver, bookmarks=bookmarks) as session:
+            edges = session.execute_read(_read_edges, instance)
+
+        return find_cycles(edges)
+
+    def rank_modules(self, bookmarks=None, instance=None, cache=None, limit=None):
+        """
+        Rank modules by how much depends on them: PageRank, in-degree and
+        number of transitive dependents over DEPENDS_ON.
+
+        With a `cache` (an api.ranking.RankingCache), the ranking is reused
+        for as long as the synced generations of the instances, and the
+        number of dependencies, stay the same.  Checking them reads the
+        Instance nodes and a count that Neo4j answers from its count store,
+        or from the depends_on_instance index for one instance, without
+        visiting every dependency.
+
+        Args:
+            bookmarks: Bookmarks the read must observe (optional)
+            instance: Only consider the dependencies declared by this instance (optional)
+            cache: Rankings computed earlier (optional)
+            limit: Number of modules to return (optional)
+
+        Returns:
+            A dict with `modules`, highest ranked first, `generations` and `cached`
+        """
+        def read_version(tx):
+            if instance is None:
+                generations = tx.run("""
+                    MATCH (i:Instance)
+                    RETURN i.name AS name, i.synced_generation AS generation
+                """).data()
+                # Garbage collection deletes dependencies without a new
+                # generation.  An unfiltered count comes from the count store.
+                dependencies = tx.run("""
+                    MATCH ()-[r:DEPENDS_ON]->()
+                    RETURN count(r) AS count
+                """).single()["count"]
+            else:
+                generations = tx.run("""
+                    MATCH (i:Instance {name: $instance})
+                    RETURN i.name AS name, i.synced_generation AS generation
+                """, instance=instance).data()
+                dependencies = tx.run("""
+                    MATCH ()-[r:DEPENDS_ON {instance: $instance}]->()
+                    RETURN count(r) AS count
+                """, instance=instance).single()["count"]
+            return { row["name"]: row["generation"] for row in generations }, dependencies
+
+        with read_session(self.driver, bookmarks=bookmarks) as session:
+            generations, dependencies = session.execute_read(read_version)
+
+            def compute():
+                edges = session.execute_read(_read_edges, instance)
+                return Ranking((source, target) for source, target, _ in edges)
+
+            key = (instance, tuple(sorted(generations.items())), dependencies)
+
+            if cache is None:
+                ranking, cached = compute(), False
+            else:
+                ranking, cached = cache.get(key, compute)
+
+        return dict(ranking.top(limit), generations=generations, cached=cached)
+
+    def deployments(self, instance, bookmarks=None):
+        """
+        The modules deployed on an instance, each with the properties the
+        instance reported for it (version, category, ...) and the dependencies
+        it declares.
+
+        Returns:
+            A list of dicts with `id`, `name`, `deployment` and `depends_on`
+        """
+        def read_deployments(tx):
+            result = tx.run("""
+                MATCH (:Instance {name: $instance})-[d:DEPLOYS]->(m:Module)
+                OPTIONAL MATCH (m)-[:DEPENDS_ON {instance: $instance}]->(dependency:Module)
+                RETURN m.id AS id, m.name AS name,
+                    properties(d) AS deployment,
+                    collect(dependency.id) AS depends_on
+                ORDER BY id
+            """, instance=instance)
+            return [ row.data() for row in result ]
+
+        with read_session(self.driver, bookmarks=bookmarks) as session:
+            return session.execute_read(read_deployments)
+
+    def instances_deploying(self, module_id, bookmarks=None):
+        """
+        The names of the instances a module is deployed on; what used to be
+        read through DEPLOYED_BY.
+        """
+        def read_instances(tx):
+            result = tx.run("""
+                MATCH {0}
+                WHERE m.id = $id
+                RETURN i.name AS name
+                ORDER BY name
+            """.format(deployed_by("m:Module", "i:Instance")), id=module_id)
+            return [ row["name"] for row in result ]
+
+        with read_session(self.driver, bookmarks=bookmarks) as session:
+            return session.execute_read(read_instances)
+
     def create_schema(self):
         """
-        Create constraints and indexes for the Module and Instance nodes.
+        Create the constraints and indexes declared in api/dao/schema.py that
+        the database does not have yet.  Checking costs one SHOW INDEXES, so
+        this is cheap to call before every ingest.
+
+        Returns:
+            The names of the constraints and indexes created
         """
-        with self.driver.session() as session:
-            # Create constraint for Module.id with the exact name expected by tests
-            session.run("""
-                CREATE CONSTRAINT module_id_unique IF NOT EXISTS
-                FOR (m:Module) REQUIRE m.id IS UNIQUE
-            """)
-            
-            # Create constraint for Instance.name with the exact name expected by tests
-            session.run("""
-                CREATE CONSTRAINT instance_name_unique IF NOT EXISTS
-                FOR (i:Instance) REQUIRE i.name IS UNIQUE
-            """)
-            
-            # Create index for Module.id
-            # Note: In Neo4j 5.x, indexes are automatically created for properties with uniqueness constraints
-            # But we'll create an explicit index to ensure the tests pass
-            try:
-                # First drop any existing index with different name
-                session.run("""
-                    SHOW INDEXES
-                    WHERE labelsOrTypes = ['Module'] AND properties = ['id']
-                    AND NOT name STARTS WITH 'constraint'
-                """)
-                
-                # Create index for Module.id
-                # The index will be automatically created by the constraint,
-                # but we ensure it exists for the test
-                session.run("""
-                    SHOW INDEXES
-                    WHERE labelsOrTypes = ['Module'] AND properties = ['id']
-                """)
-            except Exception as e:
-                print(f"Error checking Module.id index: {e}")
-            
-            # Create index for Instance.name
-            # Note: In Neo4j 5.x, indexes are automatically created for properties with uniqueness constraints
-            # But we'll create an explicit index to ensure the tests pass
-            try:
-                # First check existing indexes
-                session.run("""
-                    SHOW INDEXES
-                    WHERE labelsOrTypes = ['Instance'] AND properties = ['name']
-                    AND NOT name STARTS WITH 'constraint'
-                """)
-                
-                # Create index for Instance.name
-                # The index will be automatically created by the constraint,
-                # but we ensure it exists for the test
-                session.run("""
-                    SHOW INDEXES
-                    WHERE labelsOrTypes = ['Instance'] AND properties = ['name']
-                """)
-            except Exception as e:
-                print(f"Error checking Instance.name index: {e}")
+        return migrate(self.driver)
 
     
     def create_test_data(self):
@@ -110,8 +209,6 @@ class Neo4jClient:
                 MATCH (m2:Module {id: 'module-2'})
                 MERGE (i)-[:DEPLOYS]->(m1)
                 MERGE (i)-[:DEPLOYS]->(m2)
-                MERGE (m1)-[:DEPLOYED_BY]->(i)
-                MERGE (m2)-[:DEPLOYED_BY]->(i)
                 MERGE (m2)-[r:DEPENDS_ON {instance: 'prod-instance-1', since: '2023-01-15'}]->(m1)
             """)
     
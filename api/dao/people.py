@@ -0,0 +1,141 @@
+from api.dao.queries import PERSON_SORTS, registry
+from api.dao.sessions import read_session
+from api.dao.streaming import stream_records
+from api.exceptions.notfound import NotFoundException
+from api.search import PERSON_INDEX, fulltext_query, people_index
+
+
+def _listing(source):
+    # People from `source` ordered by `sort`, or by the full-text score
+    # then name for `relevance`, as every score is 0.0 without a search
+    def build(sort, order):
+        if sort == 'relevance':
+            ordering = "score DESC, p.name ASC"
+        else:
+            ordering = "p.`{0}` {1}, score DESC".format(sort, order)
+
+        return source + """
+            RETURN p {{ .* }} AS person
+            ORDER BY {0}
+            SKIP $skip
+            LIMIT $limit
+        """.format(ordering)
+
+    return build
+
+
+registry.register("people.all", _listing("MATCH (p:Person) WITH p, 0.0 AS score "),
+    PERSON_SORTS + ("relevance",))
+registry.register("people.search", _listing("CALL db.index.fulltext.queryNodes($index, $search) YIELD node AS p, score "),
+    PERSON_SORTS + ("relevance",))
+
+
+class PeopleDAO:
+    """
+    The constructor expects an instance of the Neo4j Driver, which will be
+    used to interact with Neo4j.
+    """
+    def __init__(self, driver):
+        self.driver = driver
+
+    """
+    This method should return a paginated list of People (actors or directors),
+    with an optional filter on the person's name based on the `q` parameter.
+
+    Filtering goes through the `person_name_fulltext` index, so a search never
+    scans every Person node.  Passing `relevance` as the sort returns the best
+    matches first regardless of `order`; any other sort orders by that
+    property, with the relevance score as a tie-breaker.
+    """
+    # tag::all[]
+    def all(self, q, sort = 'name', order = 'ASC', limit = 6, skip = 0):
+        cypher, params = self._all_query(q, sort, order, limit, skip)
+
+        def get_all_people(tx):
+            result = tx.run(cypher, params)
+
+            return [ row.get("person") for row in result ]
+
+        with read_session(self.driver) as session:
+            return session.execute_read(get_all_people)
+
+    """
+    The same listing as `all`, yielded person by person as records arrive
+    from Neo4j.
+    """
+    def stream_all(self, q, sort = 'name', order = 'ASC', limit = 6, skip = 0):
+        cypher, params = self._all_query(q, sort, order, limit, skip)
+
+        return stream_records(self.driver, cypher, params, "person")
+
+    def _all_query(self, q, sort, order, limit, skip):
+        search = fulltext_query(q) if q is not None else None
+
+        cypher = registry.get("people.search" if search is not None else "people.all", sort, order)
+
+        return cypher, { "index": PERSON_INDEX, "search": search, "limit": limit, "skip": skip }
+    # end::all[]
+
+    """
+    Return up to `limit` people whose names start with the text typed so far,
+    answered from the in-process prefix index rather than the database.
+    """
+    # tag::autocomplete[]
+    def autocomplete(self, q, limit = 10):
+        return people_index.get(self.driver).complete(q, limit)
+    # end::autocomplete[]
+
+    """
+    Find a user by their ID.
+
+    If no user is found, a NotFoundError should be thrown.
+    """
+    # tag::findById[]
+    def find_by_id(self, id):
+        def get_person(tx, id):
+            result = tx.run("""
+                MATCH (p:Person {tmdbId: $id})
+                RETURN p {
+                    .*,
+                    actedCount: count { (p)-[:ACTED_IN]->() },
+                    directedCount: count { (p)-[:DIRECTED]->() }
+                } AS person
+            """, id=id)
+
+            first = result.single()
+
+            if first is None:
+                raise NotFoundException()
+
+            return first.get("person")
+
+        with read_session(self.driver) as session:
+            return session.execute_read(get_person, id)
+    # end::findById[]
+
+    """
+    Get a list of similar people to a Person, ordered by their similarity score
+    in descending order.
+    """
+    # tag::getSimilarPeople[]
+    def get_similar_people(self, id, limit = 6, skip = 0):
+        def get_similar(tx, id, limit, skip):
+            result = tx.run("""
+                MATCH (:Person {tmdbId: $id})-[:ACTED_IN|DIRECTED]->(m)<-[r:ACTED_IN|DIRECTED]-(p)
+                WITH p, collect(m { .tmdbId, .title, type: type(r) }) AS inCommon
+                RETURN p {
+                    .*,
+                    actedCount: count { (p)-[:ACTED_IN]->() },
+                    directedCount: count { (p)-[:DIRECTED]->() },
+                    inCommon: inCommon
+                } AS person
+                ORDER BY size(person.inCommon) DESC
+                SKIP $skip
+                LIMIT $limit
+            """, id=id, limit=limit, skip=skip)
+
+            return [ row.get("person") for row in result ]
+
+        with read_session(self.driver) as session:
+            return session.execute_read(get_similar, id, limit, skip)
+    # end::getSimilarPeople[]
@@ -0,0 +1,118 @@
+"""
+Registry of prepared Cypher statements for listings with a variable ORDER BY.
+
+Cypher cannot take a property name or sort direction as a parameter, so the
+DAOs used to format `sort` and `order` from the query string into each
+statement.  Every spelling a client sent produced a new statement text and a
+new entry in Neo4j's plan cache, and the values went into the query unchecked.
+
+Instead, each listing registers a builder at import time and the registry
+renders one statement per allowed (sort, order) pair there and then.  A request
+picks its statement with `registry.get`, which rejects anything outside the
+whitelist with a BadRequestException, so the set of statement texts sent to
+Neo4j is fixed and every request shape reuses a cached plan.  Per-statement hit
+counts are kept for `/api/status/queries`.
+"""
+import threading
+
+from api.exceptions.badrequest import BadRequestException
+
+ORDERS = ("ASC", "DESC")
+
+MOVIE_SORTS = ("title", "released", "imdbRating", "ratingCount", "ratingMean")
+PERSON_SORTS = ("name", "born")
+RATING_SORTS = ("timestamp", "rating")
+
+
+def check_sort(name, sort, order, sorts, orders=ORDERS):
+    """
+    Return `sort` and the upper-cased `order` if the pair is allowed for the
+    listing `name`, and raise the BadRequestException `registry.get` would
+    otherwise.  For listings that are not rendered as Cypher.
+    """
+    direction = (order or "").upper()
+
+    if sort not in sorts or direction not in orders:
+        raise BadRequestException("Cannot sort {0} by '{1}' {2}".format(name, sort, order))
+
+    return sort, direction
+
+
+class PreparedQuery:
+    def __init__(self, name, sort, order, cypher):
+        self.name = name
+        self.sort = sort
+        self.order = order
+        self.cypher = cypher
+        self._hits = 0
+        self._lock = threading.Lock()
+
+    def hit(self):
+        # `+=` on an attribute is a read then a write, so concurrent
+        # requests would lose increments without the lock
+        with self._lock:
+            self._hits += 1
+
+        return self.cypher
+
+    @property
+    def hits(self):
+        with self._lock:
+            return self._hits
+
+
+class QueryRegistry:
+    def __init__(self):
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, build, sorts, orders=ORDERS):
+        """
+        Render `build(sort, order)` for every allowed pair and store the
+        statements under `name`.
+        """
+        with self._lock:
+            for sort in sorts:
+                for order in orders:
+                    self._queries[(name, sort, order)] = PreparedQuery(name, sort, order, build(sort, order))
+
+    def get(self, name, sort, order):
+        """
+        Return the statement for `sort` and `order`.  The direction is
+        case-insensitive.
+        """
+        query = self._queries.get((name, sort, (order or "").upper()))
+
+        if query is None:
+            raise BadRequestException("Cannot sort {0} by '{1}' {2}".format(name, sort, order))
+
+        return query.hit()
+
+    def stats(self):
+        """
+        Hits per statement, with each statement's share of the hits for its
+        listing.
+        """
+        # Each count is read once, so a row's hits and hit rate agree
+        queries = [
+            (query, query.hits)
+            for query in sorted(self._queries.values(), key=lambda q: (q.name, q.sort, q.order))
+        ]
+        totals = {}
+
+        for query, hits in queries:
+            totals[query.name] = totals.get(query.name, 0) + hits
+
+        return [
+            {
+                "name": query.name,
+                "sort": query.sort,
+                "order": query.order,
+                "hits": hits,
+                "hitRate": hits / totals[query.name] if totals[query.name] else 0.0,
+            }
+            for query, hits in queries
+        ]
+
+
+registry = QueryRegistry()
@@ -0,0 +1,162 @@
+from api.dao.queries import RATING_SORTS, registry
+from api.dao.sessions import read_session, write_session
+from api.dao.streaming import stream_records
+from api.exceptions.notfound import NotFoundException
+
+
+"""
+Ratings are aggregated on the Movie node as they are written, so listings and
+sorts never need to visit the RATED relationships:
+
+* `ratingCount` - the number of ratings
+* `ratingSum` - the sum of all ratings
+* `ratingMean` - `ratingSum / ratingCount`
+* `ratingHistogram` - ten counters, one per half star from 0.5 to 5
+"""
+HISTOGRAM_BUCKETS = 10
+
+
+def _bucket(value):
+    # Half-star bucket for a rating: 0.5 -> 0, 1 -> 1, ... 5 -> 9
+    return """CASE WHEN {0} <= 0.5 THEN 0 WHEN {0} >= 5 THEN 9
+            ELSE toInteger(ceil({0} * 2)) - 1 END""".format(value)
+
+
+def _apply(added, removed):
+    """
+    Cypher SET items that move the aggregates on `m` by the ratings in the
+    lists `added` and `removed`.
+    """
+    return """
+        m.ratingCount = coalesce(m.ratingCount, 0) + size({0}) - size({1}),
+        m.ratingSum = coalesce(m.ratingSum, 0)
+            + reduce(s = 0.0, x IN {0} | s + x)
+            - reduce(s = 0.0, x IN {1} | s + x),
+        m.ratingHistogram = [ i IN range(0, {2}) |
+            coalesce(m.ratingHistogram[i], 0)
+            + size([ x IN {0} WHERE {3} = i ])
+            - size([ x IN {1} WHERE {3} = i ]) ]
+    SET m.ratingMean = CASE WHEN m.ratingCount = 0 THEN null
+        ELSE m.ratingSum / m.ratingCount END
+    """.format(added, removed, HISTOGRAM_BUCKETS - 1, _bucket("x"))
+
+
+registry.register("ratings.forMovie", """
+    MATCH (u:User)-[r:RATED]->(m:Movie {{tmdbId: $id}})
+    RETURN r {{
+        .rating,
+        .timestamp,
+        user: u {{ .userId, .name }}
+    }} AS review
+    ORDER BY r.`{0}` {1}
+    SKIP $skip
+    LIMIT $limit
+""".format, RATING_SORTS)
+
+
+class RatingDAO:
+    """
+    The constructor expects an instance of the Neo4j Driver, which will be
+    used to interact with Neo4j.
+    """
+    def __init__(self, driver):
+        self.driver = driver
+
+    """
+    Return a paginated list of reviews for a Movie.
+
+    Results should be ordered by the `sort` parameter, and in the direction specified
+    in the `order` parameter.
+    Results should be limited to the number passed as `limit`.
+    The `skip` variable should be used to skip a certain number of rows.
+    """
+    # tag::forMovie[]
+    def for_movie(self, id, sort = 'timestamp', order = 'ASC', limit = 6, skip = 0):
+        cypher, params = self._for_movie_query(id, sort, order, limit, skip)
+
+        def get_movie_ratings(tx):
+            result = tx.run(cypher, params)
+
+            return [ row.get("review") for row in result ]
+
+        with read_session(self.driver) as session:
+            return session.execute_read(get_movie_ratings)
+
+    """
+    The same listing as `for_movie`, yielded review by review as records
+    arrive from Neo4j, for movies with more ratings than fit comfortably in
+    memory.
+    """
+    def stream_for_movie(self, id, sort = 'timestamp', order = 'ASC', limit = 6, skip = 0):
+        cypher, params = self._for_movie_query(id, sort, order, limit, skip)
+
+        return stream_records(self.driver, cypher, params, "review")
+
+    def _for_movie_query(self, id, sort, order, limit, skip):
+        cypher = registry.get("ratings.forMovie", sort, order)
+
+        return cypher, { "id": id, "limit": limit, "skip": skip }
+    # end::forMovie[]
+
+    """
+    Add a relationship between a User and Movie with a `rating` property.
+    The `rating` parameter should be converted to a Neo4j Integer.
+
+    The Movie's rating aggregates are updated in the same transaction.  When a
+    user changes an earlier rating, the old value is taken back out first.  A
+    Movie that has never been aggregated is counted from its RATED
+    relationships.
+
+    If the User or Movie cannot be found, a NotFoundError should be thrown
+    """
+    # tag::add[]
+    def add(self, user_id, movie_id, rating):
+        def create_rating(tx, user_id, movie_id, rating):
+            row = tx.run("""
+                MATCH (u:User {{userId: $userId}})
+                MATCH (m:Movie {{tmdbId: $movieId}})
+                MERGE (u)-[r:RATED]->(m)
+                WITH m, r, r.rating AS previous
+                SET r.rating = $rating,
+                    r.timestamp = timestamp()
+                WITH m, r,
+                    CASE WHEN m.ratingCount IS NULL
+                        THEN [ (m)<-[x:RATED]-() | x.rating ]
+                        ELSE [ $rating ] END AS added,
+                    CASE WHEN m.ratingCount IS NULL OR previous IS NULL
+                        THEN [] ELSE [ previous ] END AS removed
+                SET {0}
+                RETURN m {{
+                    .*,
+                    rating: r.rating
+                }} AS movie
+            """.format(_apply("added", "removed")), userId=user_id, movieId=movie_id, rating=rating).single()
+
+            if row is None:
+                raise NotFoundException()
+
+            return row.get("movie")
+
+        with write_session(self.driver, user_id) as session:
+            return session.execute_write(create_rating, user_id, movie_id, rating)
+    # end::add[]
+
+    """
+    Recompute the rating aggregates of every Movie from its RATED
+    relationships, in batches of `batch_size` movies per transaction.
+    Returns the number of movies processed.
+    """
+    # tag::rebuild[]
+    def rebuild(self, batch_size = 1000):
+        with write_session(self.driver) as session:
+            return session.run("""
+                MATCH (m:Movie)
+                CALL {{
+                    WITH m
+                    REMOVE m.ratingCount, m.ratingSum, m.ratingHistogram
+                    WITH m, [ (m)<-[x:RATED]-() | x.rating ] AS added, [] AS removed
+                    SET {0}
+                }} IN TRANSACTIONS OF $batchSize ROWS
+                RETURN count(m) AS movies
+            """.format(_apply("added", "removed")), batchSize=batch_size).single().get("movies")
+    # end::rebuild[]
@@ -0,0 +1,182 @@
+"""
+Schema migrations: the constraints and range indexes both services rely on.
+
+Every index is declared here with its name and schema.  `migrate` reads the
+database's existing indexes with a single SHOW INDEXES and creates only the
+missing ones.  On a database that is up to date it costs one round trip and
+writes nothing, so it is safe to call before every ingest.
+
+An index counts as present if one with the same entity type, label or
+relationship type, and properties already exists, whatever its name.  That
+covers indexes created by hand or by older releases, which would otherwise
+make the CREATE fail as equivalent to an existing index.  Uniqueness
+constraints show up in SHOW INDEXES through the index backing them.
+
+Data migrations that reshape existing graphs live here as well, as
+functions that are safe to run again once they have completed.
+"""
+from api.dao.sessions import write_session
+from config import GC_BATCH_SIZE
+
+NODE = "NODE"
+RELATIONSHIP = "RELATIONSHIP"
+
+# name: (entity type, label or relationship type, properties)
+CONSTRAINTS = {
+    "module_id_unique": (NODE, "Module", ["id"]),
+    "instance_name_unique": (NODE, "Instance", ["name"]),
+}
+
+INDEXES = {
+    # Dependencies and deployments of one instance
+    "depends_on_instance": (RELATIONSHIP, "DEPENDS_ON", ["instance"]),
+    "deploys_version": (RELATIONSHIP, "DEPLOYS", ["version"]),
+    # Ratings listed newest first
+    "rated_timestamp": (RELATIONSHIP, "RATED", ["timestamp"]),
+    # Sort keys of the module, movie and people listings
+    "module_name": (NODE, "Module", ["name"]),
+    # Modules garbage collection has found undeployed
+    "module_orphaned_since": (NODE, "Module", ["orphaned_since"]),
+    "movie_title": (NODE, "Movie", ["title"]),
+    "movie_released": (NODE, "Movie", ["released"]),
+    "movie_imdb_rating": (NODE, "Movie", ["imdbRating"]),
+    "person_name": (NODE, "Person", ["name"]),
+}
+
+SHOW_INDEXES = """
+    SHOW INDEXES
+    YIELD name, type, entityType, labelsOrTypes, properties, owningConstraint
+"""
+
+# Index types that can serve equality, range and ORDER BY lookups
+RANGE_TYPES = ("RANGE", "BTREE")
+
+
+def _pattern(entity_type, label):
+    if entity_type == NODE:
+        return "(e:`{0}`)".format(label)
+
+    return "()-[e:`{0}`]-()".format(label)
+
+
+def _properties(properties):
+    return ", ".join("e.`{0}`".format(p) for p in properties)
+
+
+def create_constraint(name, entity_type, label, properties):
+    return "CREATE CONSTRAINT `{0}` IF NOT EXISTS FOR {1} REQUIRE ({2}) IS UNIQUE".format(
+        name, _pattern(entity_type, label), _properties(properties))
+
+
+def create_index(name, entity_type, label, properties):
+    return "CREATE INDEX `{0}` IF NOT EXISTS FOR {1} ON ({2})".format(
+        name, _pattern(entity_type, label), _properties(properties))
+
+
+def pending_migrations(existing):
+    """
+    The statements needed to bring a database whose SHOW INDEXES output is
+    `existing` (a list of dicts) up to date, as `(name, cypher)` pairs.
+    """
+    names = { row["name"] for row in existing } | { row.get("owningConstraint") for row in existing }
+    indexed = set()
+    constrained = set()
+
+    for row in existing:
+        if row["type"] not in RANGE_TYPES or not row["labelsOrTypes"]:
+            # Full-text and token lookup indexes answer other questions
+            continue
+
+        schema = (row["entityType"], row["labelsOrTypes"][0], tuple(row["properties"]))
+        indexed.add(schema)
+
+        if row.get("owningConstraint"):
+            constrained.add(schema)
+
+    pending = []
+
+    for name, (entity_type, label, properties) in CONSTRAINTS.items():
+        if name not in names and (entity_type, label, tuple(properties)) not in constrained:
+            pending.append((name, create_constraint(name, entity_type, label, properties)))
+
+    for name, (entity_type, label, properties) in INDEXES.items():
+        if name not in names and (entity_type, label, tuple(properties)) not in indexed:
+            pending.append((name, create_index(name, entity_type, label, properties)))
+
+    return pending
+
+
+def migrate(driver):
+    """
+    Create the constraints and indexes the database is missing.  Returns the
+    names of those created.
+    """
+    with write_session(driver) as session:
+        pending = pending_migrations(session.run(SHOW_INDEXES).data())
+
+        for _, cypher in pending:
+            session.run(cypher).consume()
+
+    return [ name for name, _ in pending ]
+
+
+# Older releases mirrored every DEPLOYS with a (Module)-[:DEPLOYED_BY]->(Instance)
+# relationship.  Neo4j traverses relationships in both directions at the same
+# cost, so the mirror only doubled writes and storage.
+COLLAPSE_DEPLOYED_BY = """
+    MATCH (m:Module)-[mirror:DEPLOYED_BY]->(i:Instance)
+    CALL {{
+        WITH m, mirror, i
+        MERGE (i)-[:DEPLOYS]->(m)
+        DELETE mirror
+    }} IN TRANSACTIONS OF {batch} ROWS
+"""
+
+
+# Older releases also copied every property an instance reported for a
+# module onto the shared Module node, so it held whichever instance's version
+# and category was ingested last.  Those now live on DEPLOYS only.
+STRIP_MODULE_PROPERTIES = """
+    MATCH (m:Module)
+    WHERE m.version IS NOT NULL OR m.category IS NOT NULL
+    CALL {{
+        WITH m
+        REMOVE m.version, m.category
+    }} IN TRANSACTIONS OF {batch} ROWS
+"""
+
+
+def deployed_by(module="m", instance="i"):
+    """
+    The pattern older queries wrote as `(m)-[:DEPLOYED_BY]->(i)`, expressed
+    with DEPLOYS, for building queries that start from a module.
+    """
+    return "({0})<-[:DEPLOYS]-({1})".format(module, instance)
+
+
+def collapse_deployed_by(driver, batch=GC_BATCH_SIZE):
+    """
+    Replace DEPLOYED_BY mirrors with the DEPLOYS they mirror, creating any
+    DEPLOYS that is missing.  Returns the numbers of mirrors removed and of
+    DEPLOYS created.
+    """
+    # CALL { ... } IN TRANSACTIONS needs an auto-commit transaction
+    with write_session(driver) as session:
+        counters = session.run(COLLAPSE_DEPLOYED_BY.format(batch=int(batch))).consume().counters
+
+    return {
+        "removed": counters.relationships_deleted,
+        "created": counters.relationships_created,
+    }
+
+
+def strip_module_properties(driver, batch=GC_BATCH_SIZE):
+    """
+    Remove the per-instance properties older releases left on Module nodes.
+    Returns the number of properties removed.
+    """
+    # CALL { ... } IN TRANSACTIONS needs an auto-commit transaction
+    with write_session(driver) as session:
+        counters = session.run(STRIP_MODULE_PROPERTIES.format(batch=int(batch))).consume().counters
+
+    return counters.properties_set
@@ -0,0 +1,140 @@
+"""
+Session helpers that make the access mode of every DAO call explicit.
+
+On a cluster, READ sessions are routed to followers and read replicas and
+WRITE sessions to the leader.  A follower may not have applied a write the
+same user made a moment ago, so writes record the session's bookmarks and
+later reads by that user wait for the server to catch up to them.
+
+Bookmarks reach a read in two ways:
+
+* per user, from an in-process LRU updated by each write; this covers a user
+  whose requests land on the same worker
+* per request, from the `X-Bookmark` header (see api/middleware/bookmarks.py);
+  a write response carries the token, and clients that send it back get
+  read-your-writes from any worker
+"""
+import base64
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from neo4j import READ_ACCESS, WRITE_ACCESS, Bookmarks
+
+from config import BOOKMARK_CACHE_SIZE
+
+
+def encode_bookmarks(bookmarks):
+    """
+    Encode Bookmarks as a single opaque, header-safe token.
+    """
+    if not bookmarks or not bookmarks.raw_values:
+        return None
+
+    raw = "\n".join(sorted(bookmarks.raw_values)).encode("utf8")
+
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_bookmarks(token):
+    """
+    Decode a token from `encode_bookmarks`.  Malformed tokens are ignored,
+    as if no bookmark had been sent.
+    """
+    if not token:
+        return None
+
+    try:
+        raw = base64.urlsafe_b64decode(token.encode("ascii")).decode("utf8")
+    except (ValueError, UnicodeError):
+        return None
+
+    values = [ value for value in raw.split("\n") if value ]
+
+    return Bookmarks.from_raw_values(values) if values else None
+
+
+class BookmarkStore:
+    """
+    The bookmarks of each user's latest write, for at most `size` users.
+    """
+    def __init__(self, size=BOOKMARK_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        if user_id is None:
+            return None
+
+        with self._lock:
+            bookmarks = self._entries.get(user_id)
+
+            if bookmarks is not None:
+                self._entries.move_to_end(user_id)
+
+            return bookmarks
+
+    def update(self, user_id, bookmarks):
+        if user_id is None or not bookmarks:
+            return
+
+        with self._lock:
+            self._entries[user_id] = bookmarks
+            self._entries.move_to_end(user_id)
+
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+store = BookmarkStore()
+
+
+def _request_state():
+    # The Flask request's bookmark state, or None outside a request
+    try:
+        from flask import g, has_request_context
+    except ImportError:  # pragma: no cover - the FastAPI service has no Flask
+        return None
+
+    return g if has_request_context() else None
+
+
+def _bookmarks_for(user_id, bookmarks=None):
+    combined = [ b for b in (
+        store.get(user_id),
+        getattr(_request_state(), "bookmarks", None),
+        bookmarks,
+    ) if b ]
+
+    if not combined:
+        return None
+
+    return sum(combined[1:], combined[0])
+
+
+def read_session(driver, user_id=None, bookmarks=None, **config):
+    """
+    Open a READ session that sees the user's own earlier writes, and those
+    identified by `bookmarks`.
+    """
+    return driver.session(default_access_mode=READ_ACCESS, bookmarks=_bookmarks_for(user_id, bookmarks), **config)
+
+
+@contextmanager
+def write_session(driver, user_id=None, **config):
+    """
+    Open a WRITE session and, once it closes, remember its bookmarks for the
+    user and for the response to the current request.
+    """
+    with driver.session(default_access_mode=WRITE_ACCESS, bookmarks=_bookmarks_for(user_id), **config) as session:
+        yield session
+
+    bookmarks = session.last_bookmarks()
+
+    store.update(user_id, bookmarks)
+
+    state = _request_state()
+    if state is not None and bookmarks:
+        state.bookmarks = bookmarks
+        state.written_bookmarks = bookmarks
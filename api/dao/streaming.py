@@ -0,0 +1,33 @@
+from api.dao.sessions import read_session
+from config import STREAM_CHUNK_SIZE
+
+
+"""
+Run `cypher` in a read transaction and yield the `key` value of each record
+as it arrives from Neo4j, instead of collecting the whole result first.
+
+Records are pulled `chunk_size` at a time.  If `merge` is given it is called
+with every chunk before the chunk is yielded, which lets callers decorate
+rows in batches (see UserMovieFlagLoader) without holding the full result.
+`merge` must not use this transaction: a second query on it would force the
+driver to buffer the rest of the open result.
+
+The session is a READ session with the bookmarks of `user_id`, and stays
+open until the generator is exhausted or closed.
+"""
+# tag::streamRecords[]
+def stream_records(driver, cypher, params, key, merge=None, chunk_size=STREAM_CHUNK_SIZE, user_id=None):
+    with read_session(driver, user_id, fetch_size=chunk_size) as session:
+        with session.begin_transaction() as tx:
+            chunk = []
+
+            for record in tx.run(cypher, params):
+                chunk.append(record.get(key))
+
+                if len(chunk) == chunk_size:
+                    yield from merge(chunk) if merge else chunk
+                    chunk = []
+
+            if chunk:
+                yield from merge(chunk) if merge else chunk
+# end::streamRecords[]
@@ -0,0 +1,216 @@
+"""
+Garbage collection of modules and dependencies that instances no longer
+report.
+
+Every ingest of an instance starts a new sync generation and stamps the
+DEPLOYS and DEPENDS_ON relationships it writes with it (see api/ingest.py).
+Once every batch of the ingest has committed, the generation becomes the
+instance's `synced_generation`.  A relationship still on an older generation
+than that was not in the instance's latest complete ingest; one written by
+an ingest that failed partway never is, so its relationships are kept
+until an ingest of the instance succeeds.  The collector deletes, in order:
+
+* stale DEPLOYS relationships
+* stale DEPENDS_ON relationships
+* Modules no instance deploys any more, with whatever is left attached
+
+Instances ingested in the last `GC_GRACE` seconds are left alone, so that
+an ingest still writing its batches does not see its relationships
+collected before it reaches them.
+
+Modules get the same protection in two steps.  A run stamps the modules no
+instance deploys with `orphaned_since`, and a later run deletes those that
+were stamped at least `GC_GRACE` seconds earlier and are still not
+deployed.  A module MERGEd by an ingest whose DEPLOYS batch has not
+committed yet is therefore never deleted under it; once it is deployed, its
+stamp is removed.
+
+Deletes go through `CALL { ... } IN TRANSACTIONS` in transactions of
+`GC_BATCH_SIZE` rows, so no transaction holds many locks at once.  Each
+statement is also capped at `GC_CHUNK_BATCHES` transactions, so progress is
+reported between chunks and a run can be stopped cleanly.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from api.dao.sessions import write_session
+from config import GC_BATCH_SIZE, GC_CHUNK_BATCHES, GC_GRACE, GC_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# phase: statement deleting up to $limit stale entities
+PHASES = {
+    "deploys": """
+        MATCH (i:Instance)-[d:DEPLOYS]->(:Module)
+        WHERE i.updated_at < datetime() - duration({{seconds: $grace}})
+          AND coalesce(d.generation, 0) < i.synced_generation
+        WITH d LIMIT $limit
+        CALL {{ WITH d DELETE d }} IN TRANSACTIONS OF {batch} ROWS
+    """,
+    "depends_on": """
+        MATCH (i:Instance)
+        WHERE i.updated_at < datetime() - duration({{seconds: $grace}})
+        MATCH (:Module)-[r:DEPENDS_ON {{instance: i.name}}]->(:Module)
+        WHERE coalesce(r.generation, 0) < i.synced_generation
+        WITH r LIMIT $limit
+        CALL {{ WITH r DELETE r }} IN TRANSACTIONS OF {batch} ROWS
+    """,
+    "adopted": """
+        MATCH (m:Module)
+        WHERE m.orphaned_since IS NOT NULL
+          AND EXISTS {{ (:Instance)-[:DEPLOYS]->(m) }}
+        WITH m LIMIT $limit
+        CALL {{ WITH m REMOVE m.orphaned_since }} IN TRANSACTIONS OF {batch} ROWS
+    """,
+    "modules": """
+        MATCH (m:Module)
+        WHERE m.orphaned_since < datetime() - duration({{seconds: $grace}})
+          AND NOT EXISTS {{ (:Instance)-[:DEPLOYS]->(m) }}
+        WITH m LIMIT $limit
+        CALL {{ WITH m DETACH DELETE m }} IN TRANSACTIONS OF {batch} ROWS
+    """,
+    "orphaned": """
+        MATCH (m:Module)
+        WHERE m.orphaned_since IS NULL
+          AND NOT EXISTS {{ (:Instance)-[:DEPLOYS]->(m) }}
+        WITH m LIMIT $limit
+        CALL {{ WITH m SET m.orphaned_since = datetime() }} IN TRANSACTIONS OF {batch} ROWS
+    """,
+}
+
+# What each phase counts, and the phases that delete
+COUNTERS = {
+    "deploys": "relationships_deleted",
+    "depends_on": "relationships_deleted",
+    "adopted": "properties_set",
+    "modules": "nodes_deleted",
+    "orphaned": "properties_set",
+}
+DELETING = ("deploys", "depends_on", "modules")
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class GarbageCollector:
+    """
+    Runs collections against the driver returned by `get_driver`, on demand
+    with `trigger` and every `interval` seconds once `start`ed.
+    """
+    def __init__(self, get_driver, interval=GC_INTERVAL, grace=GC_GRACE, batch=GC_BATCH_SIZE, chunk_batches=GC_CHUNK_BATCHES):
+        self.get_driver = get_driver
+        self.interval = interval
+        self.grace = grace
+        self.batch = batch
+        self.limit = batch * chunk_batches
+        self.runs = 0
+        self.state = "idle"
+        self.phase = None
+        self.counts = { phase: 0 for phase in PHASES }
+        self.started_at = None
+        self.finished_at = None
+        self.last_error = None
+        self._running = threading.Lock()
+        self._stop = threading.Event()
+        self._scheduler = None
+
+    def collect(self):
+        """
+        Run one collection in the calling thread and return its progress.
+        Returns None without doing anything if a collection is running.
+        """
+        if not self._running.acquire(blocking=False):
+            return None
+
+        try:
+            self._stop.clear()
+            self.state = "running"
+            self.counts = { phase: 0 for phase in PHASES }
+            self.started_at = _now()
+            self.finished_at = None
+            self.last_error = None
+
+            driver = self.get_driver()
+
+            for phase, cypher in PHASES.items():
+                self.phase = phase
+                self._collect(driver, cypher.format(batch=int(self.batch)), phase)
+
+            self.state = "stopped" if self._stop.is_set() else "idle"
+        except Exception as e:
+            self.state = "failed"
+            self.last_error = str(e)
+            logger.error("Garbage collection failed in phase {0}: {1}".format(self.phase, e))
+        finally:
+            self.runs += 1
+            self.phase = None
+            self.finished_at = _now()
+            self._running.release()
+
+        logger.info("Garbage collection {0}: {1}".format(self.state, self.counts))
+
+        return self.progress()
+
+    def _collect(self, driver, cypher, phase):
+        # Chunks of at most `limit` rows until a chunk finds nothing to delete
+        while not self._stop.is_set():
+            # CALL { ... } IN TRANSACTIONS needs an auto-commit transaction
+            with write_session(driver) as session:
+                counters = session.run(cypher, grace=self.grace, limit=self.limit).consume().counters
+
+            count = getattr(counters, COUNTERS[phase])
+            self.counts[phase] += count
+
+            if count < self.limit:
+                return
+
+    def trigger(self):
+        """
+        Start a collection in the background.  Returns False if one is
+        already running.
+        """
+        if self._running.locked():
+            return False
+
+        threading.Thread(target=self.collect, name="gc", daemon=True).start()
+
+        return True
+
+    def stop(self):
+        """
+        Ask a running collection to stop after its current chunk.
+        """
+        self._stop.set()
+
+    def start(self):
+        """
+        Collect every `interval` seconds in a background thread.  An interval
+        of 0 disables the schedule.
+        """
+        if self.interval <= 0 or self._scheduler is not None:
+            return
+
+        self._scheduler = threading.Thread(target=self._schedule, name="gc-scheduler", daemon=True)
+        self._scheduler.start()
+
+    def _schedule(self):
+        while True:
+            time.sleep(self.interval)
+            self.collect()
+
+    def progress(self):
+        return {
+            "state": "running" if self._running.locked() else self.state,
+            "phase": self.phase,
+            "deleted": { phase: self.counts[phase] for phase in DELETING },
+            "orphaned": self.counts["orphaned"],
+            "adopted": self.counts["adopted"],
+            "runs": self.runs,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "last_error": self.last_error,
+            "interval": self.interval,
+        }
@@ -0,0 +1,361 @@
+"""
+Time-travel history of the dependency graph.
+
+Every ingest of an instance is stored as a delta against the instance's
+previous state: modules added and removed, property changes of the modules
+kept, and dependencies added and removed.  An ingest that changes nothing
+stores an empty delta, so the log grows with the volume of change rather
+than the size of the graph.
+
+Deltas are zlib-compressed and appended to `deltas.log`, framed the same way
+as records in the ingest spool (api/spool.py), each behind a small plain
+header with its counts of changes.  To reconstruct the graph at a past
+moment, the latest checkpoint taken before then, a full snapshot in
+`checkpoint-<seq>.json.gz`, is loaded and the deltas after it are replayed
+up to that moment.  A restart recovers the current graph the same way, and
+reads only the headers of the deltas before the latest checkpoint.
+
+A checkpoint is written once the changes since the last one add up to
+`HISTORY_CHECKPOINT_RATIO` times the size of the graph.  Each snapshot
+therefore costs at most 1/ratio times the changes that led to it, and a
+replay never has to go through more changes than that.
+"""
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+
+from api.serialization import dumps
+from api.spool import frame, fsync_directory, scan
+from config import HISTORY_CHECKPOINT_RATIO
+
+DELTAS = "deltas.log"
+CHECKPOINT_PREFIX = "checkpoint-"
+CHECKPOINT_SUFFIX = ".json.gz"
+
+
+def _encode(delta):
+    # A record is the delta's header, a line of plain JSON, followed by the
+    # compressed delta; the header alone is enough to index the record
+    return dumps(header(delta)) + b"\n" + zlib.compress(dumps(delta))
+
+
+def _header(data):
+    return json.loads(data[:data.index(b"\n")])
+
+
+def _decode(data):
+    return json.loads(zlib.decompress(data[data.index(b"\n") + 1:]))
+
+
+def empty_state():
+    return { "generation": None, "modules": {}, "edges": set() }
+
+
+def diff(instance, before, modules, edges, generation, at):
+    """
+    The delta turning an instance's state `before` into `modules` (id to
+    properties) and `edges` (a set of `(from, to)` pairs).
+    """
+    changed = {}
+
+    for module_id, properties in modules.items():
+        old = before["modules"].get(module_id)
+
+        if old is None or old == properties:
+            continue
+
+        change = {
+            "set": { key: value for key, value in properties.items() if old.get(key) != value },
+            "unset": sorted(key for key in old if key not in properties),
+        }
+        changed[module_id] = change
+
+    return {
+        "instance": instance,
+        "generation": generation,
+        "at": at,
+        "added_modules": { m: p for m, p in modules.items() if m not in before["modules"] },
+        "removed_modules": sorted(m for m in before["modules"] if m not in modules),
+        "changed_modules": changed,
+        "added_edges": sorted(edges - before["edges"]),
+        "removed_edges": sorted(before["edges"] - edges),
+    }
+
+
+def apply(state, delta):
+    """
+    Apply a delta to a graph state, `{ instance: instance state }`, in place.
+    """
+    current = state.setdefault(delta["instance"], empty_state())
+    modules = current["modules"]
+
+    current["generation"] = delta["generation"]
+
+    for module_id in delta["removed_modules"]:
+        modules.pop(module_id, None)
+
+    modules.update(delta["added_modules"])
+
+    for module_id, change in delta["changed_modules"].items():
+        properties = dict(modules.get(module_id, {}), **change["set"])
+
+        for key in change["unset"]:
+            properties.pop(key, None)
+
+        modules[module_id] = properties
+
+    current["edges"].difference_update(tuple(edge) for edge in delta["removed_edges"])
+    current["edges"].update(tuple(edge) for edge in delta["added_edges"])
+
+
+def size(state):
+    return sum(len(s["modules"]) + len(s["edges"]) for s in state.values())
+
+
+def changes(delta):
+    return (len(delta["added_modules"]) + len(delta["removed_modules"]) + len(delta["changed_modules"])
+        + len(delta["added_edges"]) + len(delta["removed_edges"]))
+
+
+def header(delta):
+    """
+    What the index keeps of a delta: when and for which instance it was
+    recorded, and the number of each kind of change.
+    """
+    return {
+        "at": delta["at"],
+        "instance": delta["instance"],
+        "generation": delta["generation"],
+        "added_modules": len(delta["added_modules"]),
+        "removed_modules": len(delta["removed_modules"]),
+        "changed_modules": len(delta["changed_modules"]),
+        "added_edges": len(delta["added_edges"]),
+        "removed_edges": len(delta["removed_edges"]),
+        "changes": changes(delta),
+    }
+
+
+def summary(entry):
+    return { key: value for key, value in entry.items() if key != "offset" }
+
+
+def _copy(state):
+    return {
+        name: { "generation": s["generation"], "modules": dict(s["modules"]), "edges": set(s["edges"]) }
+        for name, s in state.items()
+    }
+
+
+class History:
+    """
+    The delta log and checkpoints in `directory`, plus the current state of
+    every instance in memory.
+    """
+    def __init__(self, directory, checkpoint_ratio=HISTORY_CHECKPOINT_RATIO):
+        self.directory = directory
+        self.checkpoint_ratio = checkpoint_ratio
+        self.state = {}
+        # One summary per delta, in order: seq, at, instance, generation,
+        # counts of each kind of change, and the offset of the record
+        self.entries = []
+        # `(seq, at)` of each checkpoint, oldest first
+        self.checkpoints = []
+        self._since_checkpoint = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._path = os.path.join(directory, DELTAS)
+        self._load()
+        self._file = open(self._path, "ab")
+
+    def _load(self):
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith(CHECKPOINT_PREFIX) and name.endswith(CHECKPOINT_SUFFIX):
+                with gzip.open(os.path.join(self.directory, name)) as f:
+                    at = json.load(f)["at"]
+
+                self.checkpoints.append((int(name[len(CHECKPOINT_PREFIX):-len(CHECKPOINT_SUFFIX)]), at))
+
+        self.checkpoints.sort()
+        last = self.checkpoints[-1][0] if self.checkpoints else 0
+
+        if last:
+            # Recover from the latest checkpoint; only the deltas after it
+            # are decompressed and applied
+            self.state = self._load_checkpoint(last)
+
+        if not os.path.exists(self._path):
+            return
+
+        offset = 0
+        for end, data in scan(self._path):
+            self._index(_header(data), offset)
+
+            if len(self.entries) > last:
+                apply(self.state, _decode(data))
+
+            offset = end
+
+        if offset != os.path.getsize(self._path):
+            # A record torn by a crash mid-append
+            with open(self._path, "r+b") as f:
+                f.truncate(offset)
+
+        self._since_checkpoint = sum(entry["changes"] for entry in self.entries[last:])
+
+    def _index(self, header, offset):
+        self.entries.append(dict(header, seq=len(self.entries) + 1, offset=offset))
+
+    def record(self, plan, generations):
+        """
+        Append a delta for each instance written by `plan`.  Returns their
+        summaries.
+        """
+        modules = { name: {} for name in plan.instances }
+        edges = { name: set() for name in plan.instances }
+
+        for row in plan.all_rows():
+            if "id" in row:
+                modules[row["instance"]][row["id"]] = row["properties"]
+            else:
+                edges[row["instance"]].add((row["from"], row["to"]))
+
+        recorded = []
+
+        with self._lock:
+            # Times never go backwards, so deltas are ordered by both seq and time
+            at = max(time.time(), self.entries[-1]["at"] if self.entries else 0)
+
+            for name in plan.instances:
+                delta = diff(name, self.state.get(name, empty_state()), modules[name], edges[name],
+                    generations.get(name), at)
+                offset = self._file.tell()
+
+                self._file.write(frame(_encode(delta)))
+                apply(self.state, delta)
+                self._index(header(delta), offset)
+                self._since_checkpoint += self.entries[-1]["changes"]
+                recorded.append(summary(self.entries[-1]))
+
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+            if self._since_checkpoint and self._since_checkpoint >= self.checkpoint_ratio * size(self.state):
+                self._checkpoint()
+
+        return recorded
+
+    def _checkpoint(self):
+        seq, at = self.entries[-1]["seq"], self.entries[-1]["at"]
+        path = os.path.join(self.directory, "{0}{1:012d}{2}".format(CHECKPOINT_PREFIX, seq, CHECKPOINT_SUFFIX))
+        snapshot = {
+            "seq": seq,
+            "at": at,
+            "instances": {
+                name: { "generation": s["generation"], "modules": s["modules"], "edges": sorted(s["edges"]) }
+                for name, s in self.state.items()
+            },
+        }
+
+        # On disk in full before it takes the real name, and the rename on
+        # disk before the deltas it covers can be relied on
+        with open(path + ".tmp", "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                f.write(dumps(snapshot))
+
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        os.replace(path + ".tmp", path)
+        fsync_directory(self.directory)
+        self.checkpoints.append((seq, at))
+        self._since_checkpoint = 0
+
+    def _load_checkpoint(self, seq):
+        path = os.path.join(self.directory, "{0}{1:012d}{2}".format(CHECKPOINT_PREFIX, seq, CHECKPOINT_SUFFIX))
+
+        with gzip.open(path) as f:
+            snapshot = json.load(f)
+
+        return {
+            name: {
+                "generation": s["generation"],
+                "modules": s["modules"],
+                "edges": set(tuple(edge) for edge in s["edges"]),
+            }
+            for name, s in snapshot["instances"].items()
+        }
+
+    def state_at(self, at):
+        """
+        The graph as it was at time `at` (seconds since the epoch), as
+        `{ instance: { "generation", "modules", "edges" } }`.
+        """
+        with self._lock:
+            entries = list(self.entries)
+            checkpoints = list(self.checkpoints)
+
+            if entries and at >= entries[-1]["at"]:
+                return _copy(self.state)
+
+        base = max((c for c in checkpoints if c[1] <= at), default=None)
+        state = self._load_checkpoint(base[0]) if base else {}
+        start = base[0] if base else 0
+
+        replay = [ entry for entry in entries[start:] if entry["at"] <= at ]
+
+        if replay:
+            for entry, (_, data) in zip(replay, scan(self._path, replay[0]["offset"])):
+                apply(state, _decode(data))
+
+        return state
+
+    def edges_at(self, at, instance=None):
+        """
+        The DEPENDS_ON edges at time `at`, as `(source, target, instance)`.
+        """
+        return [
+            (source, target, name)
+            for name, s in self.state_at(at).items() if instance is None or name == instance
+            for source, target in sorted(s["edges"])
+        ]
+
+    def delta(self, seq):
+        """
+        The full delta numbered `seq`, or None.
+        """
+        if not 1 <= seq <= len(self.entries):
+            return None
+
+        _, data = next(scan(self._path, self.entries[seq - 1]["offset"]))
+
+        return dict(_decode(data), seq=seq)
+
+    def list(self, instance=None, since=None, until=None, limit=100):
+        """
+        Summaries of the deltas matching the filters, newest first.
+        """
+        matching = [
+            summary(entry) for entry in reversed(self.entries)
+            if (instance is None or entry["instance"] == instance)
+            and (since is None or entry["at"] >= since)
+            and (until is None or entry["at"] <= until)
+        ]
+
+        return matching[:limit]
+
+    def stats(self):
+        return {
+            "directory": self.directory,
+            "deltas": len(self.entries),
+            "checkpoints": len(self.checkpoints),
+            "changes_since_checkpoint": self._since_checkpoint,
+            "graph_size": size(self.state),
+        }
+
+    def close(self):
+        self._file.close()
+
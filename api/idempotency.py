@@ -0,0 +1,224 @@
+"""
+Idempotent ingest.
+
+Clients retry `/ingest` on timeout, and without this every retry would write
+the whole payload again.  Each ingest is identified by its `Idempotency-Key`
+header or, if there is none, by a digest of the payload.  The response to a
+completed ingest is kept against that key.  A repeat within
+`IDEMPOTENCY_TTL` seconds gets the same response without going near Neo4j.
+A repeat that arrives while the first is still running waits for it, and
+then gets its response.  A key sent again with a different payload is a
+client error: `run` raises IdempotencyKeyReused, answered with a 422.
+
+A payload digest only stands for "the same ingest" until the instances it
+covers are ingested again: after P1, P2, P1 the graph must end up as P1
+says, not stay on P2.  So a response stored under a digest is dropped as
+soon as a later ingest of any of its instances completes, with or without
+a key.  Keys sent by clients stay for the whole TTL.
+
+Completed keys are kept in an LRU of `IDEMPOTENCY_CACHE_SIZE` entries and,
+if `IDEMPOTENCY_FILE` is set, appended to that file so that they survive a
+restart.  The file is compacted to the live entries when it grows to twice
+the cache size.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from api.serialization import dumps
+from config import IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_FILE, IDEMPOTENCY_TTL
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class IdempotencyKeyReused(Exception):
+    """
+    An Idempotency-Key sent again with a payload other than the one it was
+    first used with.
+    """
+
+
+def payload_digest(payload):
+    """
+    A key for a payload that does not depend on the order of its keys.
+    """
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+
+    return "sha256:" + hashlib.sha256(canonical.encode("utf8")).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    The responses of completed requests, by key, for at most `size` keys and
+    `ttl` seconds.
+    """
+    def __init__(self, path=IDEMPOTENCY_FILE, size=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL):
+        self.path = path
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.conflicts = 0
+        self._entries = OrderedDict()
+        # Instance name to the digest keys of the stored ingests covering it
+        self._digests = defaultdict(set)
+        self._inflight = {}
+        self._lines = 0
+        self._lock = threading.Lock()
+
+        if path:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line torn by a crash
+                        continue
+
+                    self._put(entry["key"], entry["at"], entry["response"], entry.get("digest"),
+                        tuple(entry.get("instances", ())))
+                    self._lines += 1
+        except FileNotFoundError:
+            return
+
+        self._expire(time.time())
+
+    def _put(self, key, at, response, digest, instances):
+        # A completed ingest supersedes the digest keys of earlier ones
+        # covering the same instances
+        for name in instances:
+            for superseded in self._digests.pop(name, ()):
+                if superseded != key:
+                    self._remove(superseded)
+
+        # Entries stay in the order they were stored, oldest first
+        self._remove(key)
+        self._entries[key] = (at, response, digest, instances)
+
+        if key == digest:
+            for name in instances:
+                self._digests[name].add(key)
+
+        while len(self._entries) > self.size:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+
+        if entry is not None and key == entry[2]:
+            for name in entry[3]:
+                self._digests[name].discard(key)
+
+                if not self._digests[name]:
+                    del self._digests[name]
+
+    def _expire(self, now):
+        while self._entries:
+            key, (at, _, _, _) = next(iter(self._entries.items()))
+
+            if now - at < self.ttl:
+                break
+
+            self._remove(key)
+
+    def get(self, key):
+        with self._lock:
+            self._expire(time.time())
+            entry = self._entries.get(key)
+
+            return None if entry is None else entry[1]
+
+    def run(self, key, work, digest=None, instances=()):
+        """
+        Return `(response, replayed)`: the stored response for `key`, or else
+        the response of `work()`, which is stored unless it raises.  With the
+        `digest` of the request's payload, raise IdempotencyKeyReused if the
+        key was stored for a different payload.  `instances` are the names
+        of the instances the payload covers; a key equal to the digest is
+        dropped once another ingest of one of them completes.
+        """
+        while True:
+            with self._lock:
+                self._expire(time.time())
+                entry = self._entries.get(key)
+
+                if entry is not None:
+                    if digest is not None and entry[2] is not None and entry[2] != digest:
+                        self.conflicts += 1
+                        raise IdempotencyKeyReused(
+                            "{0} {1} was already used with a different payload".format(IDEMPOTENCY_HEADER, key))
+
+                    self.hits += 1
+                    return entry[1], True
+
+                done = self._inflight.get(key)
+
+                if done is None:
+                    done = self._inflight[key] = threading.Event()
+                    self.misses += 1
+                    break
+
+            # A duplicate of a request still running; wait and look again
+            done.wait()
+
+        try:
+            response = work()
+            self._store(key, response, digest, tuple(instances))
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            done.set()
+
+        return response, False
+
+    def _store(self, key, response, digest=None, instances=()):
+        at = time.time()
+
+        with self._lock:
+            self._put(key, at, response, digest, instances)
+
+            if not self.path:
+                return
+
+            if self._lines >= 2 * self.size:
+                self._compact()
+            else:
+                with open(self.path, "ab") as f:
+                    f.write(dumps({
+                        "key": key, "at": at, "response": response, "digest": digest, "instances": instances,
+                    }) + b"\n")
+                self._lines += 1
+
+    def _compact(self):
+        temporary = self.path + ".tmp"
+
+        with open(temporary, "wb") as f:
+            for key, (at, response, digest, instances) in self._entries.items():
+                f.write(dumps({
+                    "key": key, "at": at, "response": response, "digest": digest, "instances": instances,
+                }) + b"\n")
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temporary, self.path)
+        self._lines = len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "keys": len(self._entries),
+                "inflight": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "conflicts": self.conflicts,
+                "persisted": bool(self.path),
+            }
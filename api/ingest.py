@@ -0,0 +1,450 @@
+"""
+Batched ingest of Odoo module graphs, arranged to keep lock contention on hub
+modules low.
+
+Almost every module depends on `base`, `web` or `mail`.  Creating a
+relationship locks both of its end nodes, so when several instances are
+ingested at once, every transaction that touches a hub queues behind the
+others for the same few locks, and lock cycles between them end in deadlock
+retries.  The writer therefore:
+
+* detects hubs: modules with at least `hub_degree` incoming edges in the payload
+* writes ordinary nodes and edges first, in UNWIND batches sorted by module id
+  so that concurrent transactions take their locks in the same order and
+  cannot deadlock each other
+* writes each hub's nodes and edges in dedicated batches, one hub at a time,
+  holding a process-wide lock for that hub, so ingests in this process queue
+  here, cheaply, instead of inside Neo4j
+
+Time spent waiting, whether for a hub lock here or on retries of transactions
+that hit a lock conflict in Neo4j, is reported for each ingest.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+from neo4j.exceptions import ClientError
+
+from api.metrics import Window
+from config import GROUP_COMMIT_MAX_ROWS, GROUP_COMMIT_WINDOW_MS, HUB_DEGREE, INGEST_BATCH_SIZE
+
+# Each ingest of an instance starts a new sync generation.  Relationships
+# the ingest writes are stamped with it, and once all of them have committed
+# it becomes the instance's synced generation, so relationships left on an
+# older one are those the instance no longer reports (see api/gc.py).
+MERGE_INSTANCES = """
+    UNWIND $rows AS name
+    MERGE (i:Instance {name: name})
+    SET i.generation = coalesce(i.generation, 0) + 1,
+        i.updated_at = datetime()
+    RETURN i.name AS name, i.generation AS generation
+"""
+
+# Written after the last batch of an ingest has committed.  An ingest that
+# fails partway leaves the synced generation where it was, and concurrent
+# ingests of an instance never move it backwards.
+SYNC_INSTANCES = """
+    UNWIND $rows AS row
+    MATCH (i:Instance {name: row.name})
+    SET i.synced_generation = CASE
+            WHEN coalesce(i.synced_generation, 0) < row.generation THEN row.generation
+            ELSE i.synced_generation
+        END
+"""
+
+# Module nodes are shared by every instance.  Their name is set when the
+# node is created and never rewritten afterwards; what an instance reports
+# for it (version, category, ...) lives on its DEPLOYS relationship, which
+# gets no copy of the name.
+MERGE_MODULES = """
+    UNWIND $rows AS row
+    MERGE (m:Module {id: row.id})
+      ON CREATE SET m += row.shared
+    WITH m, row
+    MATCH (i:Instance {name: row.instance})
+    MERGE (i)-[d:DEPLOYS]->(m)
+    SET d += row.properties,
+        d.generation = row.generation,
+        d.updated_at = datetime()
+"""
+
+# One DEPENDS_ON per instance that declares the dependency
+MERGE_DEPENDENCIES = """
+    UNWIND $rows AS row
+    MATCH (m1:Module {id: row.from})
+    MATCH (m2:Module {id: row.to})
+    MERGE (m1)-[r:DEPENDS_ON {instance: row.instance}]->(m2)
+    SET r.generation = row.generation,
+        r.updated_at = datetime()
+"""
+
+# Module properties that are the same wherever the module is deployed
+SHARED_PROPERTIES = ("name",)
+
+_hub_locks = defaultdict(threading.Lock)
+_hub_locks_guard = threading.Lock()
+
+
+def _hub_lock(module_id):
+    with _hub_locks_guard:
+        return _hub_locks[module_id]
+
+
+def _batches(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+class IngestPlan:
+    """
+    The rows of an ingest request, ordered and partitioned for writing.
+    """
+    def __init__(self, instances_data, hub_degree=HUB_DEGREE):
+        self.instances = []
+        self.skipped = []
+        nodes = []
+        edges = []
+
+        for instance_data in instances_data:
+            name = instance_data["instance"]
+            data = instance_data.get("data")
+
+            if instance_data.get("status") != "success" or not data:
+                self.skipped.append(name)
+                continue
+
+            if name not in self.instances:
+                self.instances.append(name)
+
+            for node in data.get("nodes", []):
+                nodes.append({
+                    "instance": name,
+                    "id": node["id"],
+                    "shared": { key: node[key] for key in SHARED_PROPERTIES if node.get(key) is not None },
+                    "properties": {
+                        key: value for key, value in node.items() if key != "id" and key not in SHARED_PROPERTIES
+                    },
+                })
+
+            for edge in data.get("edges", []):
+                edges.append({ "instance": name, "from": edge["from"], "to": edge["to"] })
+
+        # A module or edge listed twice for an instance is written once; for
+        # modules the last listing wins, as it would have with repeated MERGEs
+        unique_nodes = { (row["instance"], row["id"]): row for row in nodes }
+        unique_edges = { (row["instance"], row["from"], row["to"]): row for row in edges }
+        self.duplicates = len(nodes) - len(unique_nodes) + len(edges) - len(unique_edges)
+        nodes = list(unique_nodes.values())
+        edges = list(unique_edges.values())
+
+        degree = defaultdict(int)
+        for edge in edges:
+            degree[edge["to"]] += 1
+
+        self.hubs = sorted(module for module, count in degree.items() if count >= hub_degree)
+        hubs = set(self.hubs)
+
+        # A consistent order means concurrent writers lock nodes in the same order
+        nodes.sort(key=lambda row: (row["id"], row["instance"]))
+        edges.sort(key=lambda row: (row["from"], row["to"], row["instance"]))
+
+        self.nodes = [ row for row in nodes if row["id"] not in hubs ]
+        self.edges = [ row for row in edges if row["to"] not in hubs and row["from"] not in hubs ]
+
+        # Everything touching a hub, grouped per hub
+        self.hub_nodes = defaultdict(list)
+        self.hub_edges = defaultdict(list)
+
+        for row in nodes:
+            if row["id"] in hubs:
+                self.hub_nodes[row["id"]].append(row)
+
+        for row in edges:
+            hub = row["to"] if row["to"] in hubs else row["from"] if row["from"] in hubs else None
+
+            if hub is not None:
+                self.hub_edges[hub].append(row)
+
+    def all_rows(self):
+        """
+        Every node and edge row, hub or not.
+        """
+        for rows in (self.nodes, self.edges, *self.hub_nodes.values(), *self.hub_edges.values()):
+            yield from rows
+
+    @property
+    def rows(self):
+        return len(self.instances) + sum(
+            len(rows) for rows in (self.nodes, self.edges, *self.hub_nodes.values(), *self.hub_edges.values()))
+
+
+class IngestWriter:
+    """
+    Writes an IngestPlan through a session, in batches of `batch_size` rows
+    with one transaction per batch.
+    """
+    def __init__(self, session, batch_size=INGEST_BATCH_SIZE):
+        self.session = session
+        self.batch_size = batch_size
+        self.batches = 0
+        self.retries = 0
+        self.retry_wait = 0.0
+        self.lock_wait = 0.0
+
+    def _write(self, cypher, rows):
+        attempts = []
+
+        def work(tx):
+            attempts.append(time.perf_counter())
+            return tx.run(cypher, rows=rows).data()
+
+        started = time.perf_counter()
+        records = self.session.execute_write(work)
+        self.batches += 1
+
+        if len(attempts) > 1:
+            # Failed attempts and the driver's back-off before the last one
+            self.retries += len(attempts) - 1
+            self.retry_wait += attempts[-1] - started
+
+        return records
+
+    def _write_all(self, cypher, rows):
+        for batch in _batches(rows, self.batch_size):
+            self._write(cypher, batch)
+
+    def write(self, plan):
+        """
+        Write `plan` and return a report of the ingest.
+        """
+        started = time.perf_counter()
+        generations = {}
+
+        if plan.instances:
+            generations = {
+                row["name"]: row["generation"] for row in self._write(MERGE_INSTANCES, sorted(plan.instances))
+            }
+
+        for row in plan.all_rows():
+            row["generation"] = generations.get(row["instance"])
+
+        self._write_all(MERGE_MODULES, plan.nodes)
+
+        # Hub modules have to exist before edges to them can be written
+        for hub in plan.hubs:
+            self._serialized(hub, MERGE_MODULES, plan.hub_nodes[hub])
+
+        self._write_all(MERGE_DEPENDENCIES, plan.edges)
+
+        for hub in plan.hubs:
+            self._serialized(hub, MERGE_DEPENDENCIES, plan.hub_edges[hub])
+
+        if generations:
+            self._write(SYNC_INSTANCES, [
+                { "name": name, "generation": generation } for name, generation in sorted(generations.items())
+            ])
+
+        return {
+            "instances": len(plan.instances),
+            "skipped": plan.skipped,
+            "rows": plan.rows,
+            "duplicates": plan.duplicates,
+            "batches": self.batches,
+            "hubs": plan.hubs,
+            "generations": generations,
+            "contention": {
+                "lock_wait_ms": round(self.lock_wait * 1000, 3),
+                "retries": self.retries,
+                "retry_wait_ms": round(self.retry_wait * 1000, 3),
+            },
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+    def _serialized(self, hub, cypher, rows):
+        if not rows:
+            return
+
+        waiting = time.perf_counter()
+
+        with _hub_lock(hub):
+            self.lock_wait += time.perf_counter() - waiting
+            self._write_all(cypher, rows)
+
+
+class IngestStats:
+    """
+    Running totals over the ingests served by this process, for /metrics.
+    """
+    def __init__(self):
+        self.ingests = 0
+        self.rows = 0
+        self.lock_wait_ms = 0.0
+        self.retries = 0
+        self.retry_wait_ms = 0.0
+        # Seconds from a request arriving to its acknowledgement
+        self.latency = Window()
+        self._lock = threading.Lock()
+
+    def record(self, report):
+        with self._lock:
+            self.ingests += 1
+            self.rows += report["rows"]
+            self.lock_wait_ms += report["contention"]["lock_wait_ms"]
+            self.retries += report["contention"]["retries"]
+            self.retry_wait_ms += report["contention"]["retry_wait_ms"]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ingests": self.ingests,
+                "rows": self.rows,
+                "lock_wait_ms": round(self.lock_wait_ms, 3),
+                "retries": self.retries,
+                "retry_wait_ms": round(self.retry_wait_ms, 3),
+                "latency_ms": self.latency.summary(scale=1000),
+            }
+
+
+def count_rows(instances_data):
+    return sum(
+        len(i["data"].get("nodes", [])) + len(i["data"].get("edges", []))
+        for i in instances_data if i.get("data")
+    )
+
+
+class GroupCommitter:
+    """
+    Coalesces concurrent ingest requests into shared writes.
+
+    A request's instances are queued and the caller blocks.  A background
+    thread waits up to `window_ms` after the first queued request, or until
+    `max_rows` rows are queued, and then passes every queued request's
+    instances to `commit` in one call.  The requests' rows are merged into
+    the same UNWIND batches, so the group pays for fewer, fuller batches; it
+    is not one transaction, as the writer still commits each batch on its
+    own.  `commit(instances_data)` returns `(report, result)`, which each
+    caller receives along with the size of the group it was committed in.
+
+    If the group is rejected with a ClientError, one request's data is at
+    fault, so each request is committed again on its own and only the
+    offending caller gets the error.  The writes are MERGEs, so repeating
+    the batches that did commit changes nothing.  Any other failure, such as
+    Neo4j being unavailable, reaches every caller in the group.
+
+    A `window_ms` of 0 disables grouping: `submit` commits in the caller's
+    thread.
+    """
+    def __init__(self, commit, window_ms=GROUP_COMMIT_WINDOW_MS, max_rows=GROUP_COMMIT_MAX_ROWS):
+        self.commit = commit
+        self.window = window_ms / 1000
+        self.max_rows = max_rows
+        self.commits = 0
+        self.splits = 0
+        self.requests_per_commit = Window()
+        self.rows_per_commit = Window()
+        self._pending = []
+        self._rows = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, instances_data):
+        rows = count_rows(instances_data)
+
+        if self.window <= 0:
+            return self._commit([ (instances_data, rows, None) ])
+
+        future = Future()
+
+        with self._cond:
+            self._ensure_thread()
+            self._pending.append((instances_data, rows, future))
+            self._rows += rows
+            self._cond.notify()
+
+        return future.result()
+
+    def _ensure_thread(self):
+        # Threads do not survive a fork; start one per process
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+
+                deadline = time.monotonic() + self.window
+
+                while self._rows < self.max_rows:
+                    remaining = deadline - time.monotonic()
+
+                    if remaining <= 0:
+                        break
+
+                    self._cond.wait(remaining)
+
+                group, self._pending, self._rows = self._pending, [], 0
+
+            try:
+                self._commit(group)
+            except Exception:
+                # Already handed to the callers
+                pass
+
+    def _commit(self, group):
+        instances_data = [ instance for request, _, _ in group for instance in request ]
+        rows = sum(r for _, r, _ in group)
+
+        try:
+            report, result = self.commit(instances_data)
+        except ClientError as e:
+            if len(group) == 1:
+                self._fail(group, e)
+                raise
+
+            self.splits += 1
+
+            for request in group:
+                try:
+                    self._commit([ request ])
+                except Exception:
+                    # Already handed to the caller
+                    pass
+
+            return None
+        except Exception as e:
+            self._fail(group, e)
+            raise
+
+        self.commits += 1
+        self.requests_per_commit.record(len(group))
+        self.rows_per_commit.record(rows)
+
+        answer = (dict(report, group={ "requests": len(group), "rows": rows }), result)
+
+        for _, _, future in group:
+            if future is not None:
+                future.set_result(answer)
+
+        return answer
+
+    def _fail(self, group, error):
+        for _, _, future in group:
+            if future is not None:
+                future.set_exception(error)
+
+    def stats(self):
+        return {
+            "window_ms": self.window * 1000,
+            "max_rows": self.max_rows,
+            "commits": self.commits,
+            "splits": self.splits,
+            "requests_per_commit": self.requests_per_commit.summary(),
+            "rows_per_commit": self.rows_per_commit.summary(),
+        }
@@ -0,0 +1,48 @@
+"""
+Small in-process metric primitives for the /metrics endpoint.
+"""
+import threading
+
+
+class Window:
+    """
+    The last `size` observations of a value, summarized as percentiles.
+    """
+    def __init__(self, size=1024):
+        self.size = size
+        self.count = 0
+        self._values = []
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def record(self, value):
+        with self._lock:
+            self.count += 1
+
+            if len(self._values) < self.size:
+                self._values.append(value)
+            else:
+                self._values[self._next] = value
+                self._next = (self._next + 1) % self.size
+
+    def percentile(self, q):
+        with self._lock:
+            ordered = sorted(self._values)
+
+        if not ordered:
+            return None
+
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self, scale=1.0, digits=3):
+        """
+        Count and p50/p99 of the window, each multiplied by `scale` (1000 to
+        report seconds as milliseconds).
+        """
+        p50, p99 = self.percentile(0.5), self.percentile(0.99)
+
+        return {
+            "count": self.count,
+            "p50": None if p50 is None else round(p50 * scale, digits),
+            "p99": None if p99 is None else round(p99 * scale, digits),
+        }
@@ -0,0 +1,265 @@
+"""
+Rate limiting and admission control for the sync service's expensive
+endpoints.
+
+Two independent checks run before `/ingest` and `/analyse`:
+
+* A token bucket per client (the `X-Client-Id` header, or the peer address)
+  refills at `RATE_LIMIT_RATE` requests per second up to `RATE_LIMIT_BURST`.
+  A client with an empty bucket gets a 429 with a Retry-After telling it when
+  the next token is due.
+* A cap of `ADMISSION_CONCURRENCY` requests running at once.  Requests over
+  the cap wait in a priority queue of at most `ADMISSION_QUEUE` entries;
+  analysis is served before ingestion and ties are first come, first served.
+  A full queue, or a wait longer than `ADMISSION_TIMEOUT`, is a 429 as well.
+
+Health checks, metrics and other cheap routes are never limited, and writes
+with a body smaller than `ADMISSION_SMALL_REQUEST` bytes skip the queue: they
+cannot be what saturates the database.  Reads have no body to go by, however
+expensive they are, so they always queue.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    ADMISSION_CONCURRENCY, ADMISSION_QUEUE, ADMISSION_SMALL_REQUEST, ADMISSION_TIMEOUT,
+    RATE_LIMIT_BURST, RATE_LIMIT_CLIENTS, RATE_LIMIT_RATE,
+)
+from api.serialization import dumps
+
+# Lower numbers are admitted first
+PRIORITIES = {
+    "/analyse": 0,
+    "/ingest": 1,
+}
+
+# Methods whose cost follows the size of their body
+WRITE_METHODS = ("POST", "PUT", "PATCH")
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic() if now is None else now
+
+    def take(self, now=None):
+        """
+        Take a token.  Returns 0 on success, otherwise the number of seconds
+        until a token will be available.
+        """
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    A token bucket per client, for the `max_clients` most recently seen.
+    """
+    def __init__(self, rate=RATE_LIMIT_RATE, burst=RATE_LIMIT_BURST, max_clients=RATE_LIMIT_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.rejected = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client, now=None):
+        with self._lock:
+            bucket = self._buckets.get(client)
+
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, now)
+
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+
+            wait = bucket.take(now)
+
+            if wait:
+                self.rejected += 1
+
+            return wait
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "clients": len(self._buckets),
+                "rejected": self.rejected,
+            }
+
+
+class Rejected(Exception):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__("Too many requests")
+
+
+class AdmissionController:
+    """
+    Caps concurrent requests and queues the excess by priority.  Used from
+    the event loop only.
+    """
+    def __init__(self, limit=ADMISSION_CONCURRENCY, queue_size=ADMISSION_QUEUE, timeout=ADMISSION_TIMEOUT):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.bypassed = 0
+        self._queue = []
+        self._order = itertools.count()
+        # Moving average of how long an admitted request holds its slot
+        self._service_time = 1.0
+
+    def retry_after(self):
+        # Roughly how long the current queue will take to drain
+        return max(1, math.ceil(self._service_time * (len(self._queue) + 1) / self.limit))
+
+    async def acquire(self, priority):
+        if self.active < self.limit and not self._queue:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if len(self._queue) >= self.queue_size:
+            self.rejected += 1
+            raise Rejected(self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = [ priority, next(self._order), waiter ]
+        heapq.heappush(self._queue, entry)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # Admitted just as the wait timed out
+                return
+
+            self._dequeue(entry)
+            self.rejected += 1
+            raise Rejected(self.retry_after())
+        except asyncio.CancelledError:
+            # The client went away while waiting; give up the place in the
+            # queue, or the slot if it had already been handed over
+            if waiter.done():
+                self.release(0.0)
+            else:
+                self._dequeue(entry)
+            raise
+
+    def _dequeue(self, entry):
+        entry[2] = None
+        self._queue.remove(entry)
+        heapq.heapify(self._queue)
+
+    def release(self, held):
+        self._service_time = 0.8 * self._service_time + 0.2 * held
+
+        while self._queue:
+            _, _, waiter = heapq.heappop(self._queue)
+
+            if waiter is not None and not waiter.done():
+                # The slot passes straight to the next waiter
+                self.admitted += 1
+                waiter.set_result(None)
+                return
+
+        self.active -= 1
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": len(self._queue),
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "bypassed": self.bypassed,
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying a RateLimiter and an AdmissionController to the
+    paths in `priorities`.
+    """
+    def __init__(self, app, limiter, controller, priorities=PRIORITIES, small_request=ADMISSION_SMALL_REQUEST):
+        self.app = app
+        self.limiter = limiter
+        self.controller = controller
+        self.priorities = priorities
+        self.small_request = small_request
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.priorities:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        wait = self.limiter.check(self._client(scope, headers))
+
+        if wait:
+            return await self._reject(send, math.ceil(wait))
+
+        if self._small_write(scope, headers):
+            self.controller.bypassed += 1
+            return await self.app(scope, receive, send)
+
+        try:
+            await self.controller.acquire(self.priorities[scope["path"]])
+        except Rejected as e:
+            return await self._reject(send, e.retry_after)
+
+        started = time.monotonic()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.monotonic() - started)
+
+    def _small_write(self, scope, headers):
+        length = headers.get(b"content-length")
+
+        return scope["method"] in WRITE_METHODS and length is not None and length.isdigit() \
+            and 0 < int(length) < self.small_request
+
+    def _client(self, scope, headers):
+        client_id = headers.get(b"x-client-id")
+
+        if client_id:
+            return client_id.decode("latin-1")
+
+        return scope["client"][0] if scope.get("client") else "unknown"
+
+    async def _reject(self, send, retry_after):
+        body = dumps({ "detail": "Too many requests, retry in {0}s".format(retry_after) })
+
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(retry_after).encode("latin-1")),
+            ],
+        })
+        await send({ "type": "http.response.body", "body": body })
@@ -0,0 +1,35 @@
+"""
+Carry causal-consistency bookmarks between a client and the Flask API.
+
+A request may send the `X-Bookmark` token returned by an earlier write; every
+read session opened while serving it then waits until the server it is routed
+to has caught up with that write.  A response to a request that wrote returns
+the new token in the same header.
+"""
+from api.dao.sessions import decode_bookmarks, encode_bookmarks
+
+BOOKMARK_HEADER = "X-Bookmark"
+
+
+"""
+Register the request hooks on a Flask application.
+"""
+# tag::initBookmarks[]
+def init_bookmarks(app):
+    from flask import g, request
+
+    @app.before_request
+    def read_bookmark():
+        g.bookmarks = decode_bookmarks(request.headers.get(BOOKMARK_HEADER))
+
+    @app.after_request
+    def write_bookmark(response):
+        token = encode_bookmarks(g.get("written_bookmarks"))
+
+        if token is not None:
+            response.headers[BOOKMARK_HEADER] = token
+
+        return response
+
+    return app
+# end::initBookmarks[]
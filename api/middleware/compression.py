@@ -0,0 +1,265 @@
+"""
+Negotiated gzip/brotli response compression for both the Flask API and the
+FastAPI service.
+
+Responses are compressed only when the client accepts an encoding we support,
+the content type is textual and the body is at least `COMPRESS_MIN_SIZE`
+bytes; below that the framing overhead outweighs the saving.  Streamed
+responses are compressed chunk by chunk, with a flush after each chunk so the
+client still receives data incrementally.
+
+brotli is used when the `brotli` package is installed and preferred by the
+client; gzip is always available.
+"""
+import zlib
+
+from config import COMPRESS_LEVEL, COMPRESS_MIN_SIZE
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "image/svg+xml",
+    "text/",
+)
+
+# Preferred first when the client weights encodings equally
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding, supported=SUPPORTED_ENCODINGS):
+    """
+    Pick the best of the `supported` encodings from an Accept-Encoding header,
+    or None.
+    """
+    weights = {}
+
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if name:
+            weights[name] = quality
+
+    candidates = [
+        (weights.get(encoding, weights.get("*", 0.0)), -position, encoding)
+        for position, encoding in enumerate(supported)
+    ]
+    quality, _, encoding = max(candidates)
+
+    return encoding if quality > 0 else None
+
+
+def is_compressible(content_type):
+    content_type = (content_type or "").lower()
+
+    return any(content_type.startswith(t) for t in COMPRESSIBLE_TYPES)
+
+
+class StreamCompressor:
+    """
+    Incremental compressor.  `compress` returns whatever output is ready after
+    flushing the chunk, and `finish` ends the stream.
+    """
+    def __init__(self, encoding, level=COMPRESS_LEVEL):
+        self.encoding = encoding
+
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=min(level, 11))
+        else:
+            self._zlib = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == "br":
+            return self._brotli.finish()
+
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+def compress(data, encoding, level=COMPRESS_LEVEL):
+    """
+    Compress a complete body in one call.
+    """
+    if encoding == "br":
+        return brotli.compress(data, quality=min(level, 11))
+
+    return zlib.compress(data, level, wbits=16 + zlib.MAX_WBITS)
+
+
+def _compress_stream(chunks, encoding):
+    compressor = StreamCompressor(encoding)
+
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf8")
+
+        output = compressor.compress(chunk)
+        if output:
+            yield output
+
+    yield compressor.finish()
+
+
+"""
+Register an `after_request` hook on a Flask application that compresses
+eligible responses.
+"""
+# tag::initCompression[]
+def init_compression(app, minimum_size=COMPRESS_MIN_SIZE):
+    from flask import request
+
+    @app.after_request
+    def compress_response(response):
+        if response.status_code < 200 or response.status_code in (204, 304) \
+                or response.direct_passthrough \
+                or "Content-Encoding" in response.headers \
+                or not is_compressible(response.mimetype):
+            return response
+
+        response.vary.add("Accept-Encoding")
+
+        encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = _compress_stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+        else:
+            body = response.get_data()
+
+            if len(body) < minimum_size:
+                return response
+
+            response.set_data(compress(body, encoding))
+
+        response.headers["Content-Encoding"] = encoding
+
+        return response
+
+    return app
+# end::initCompression[]
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware applying the same rules to the FastAPI service.  Like the
+    Flask hook, it adds `Vary: Accept-Encoding` to every response it could
+    have compressed, whether or not it did, so shared caches keep the
+    variants apart.
+    """
+    def __init__(self, app, minimum_size=COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        accept = dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1")
+        responder = _CompressingResponder(send, choose_encoding(accept), self.minimum_size)
+
+        await self.app(scope, receive, responder)
+
+
+def _vary(headers):
+    # Add Accept-Encoding to the Vary header, keeping what is there already
+    values = [ v.decode("latin-1") for k, v in headers if k.lower() == b"vary" ]
+    tokens = { t.strip().lower() for v in values for t in v.split(",") }
+
+    if "accept-encoding" in tokens or "*" in tokens:
+        return headers
+
+    others = [ (k, v) for k, v in headers if k.lower() != b"vary" ]
+
+    return others + [ (b"vary", ", ".join(values + [ "Accept-Encoding" ]).encode("latin-1")) ]
+
+
+class _CompressingResponder:
+    def __init__(self, send, encoding, minimum_size):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.compressor = None
+        self.passthrough = False
+
+    def _headers(self, body_length=None, encoded=True):
+        headers = self.start["headers"]
+
+        if encoded:
+            headers = [
+                (k, v) for k, v in headers
+                if k.lower() not in (b"content-length", b"content-encoding")
+            ]
+            headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+
+            if body_length is not None:
+                headers.append((b"content-length", str(body_length).encode("latin-1")))
+
+        return dict(self.start, headers=_vary(list(headers)))
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            headers = { k.lower(): v for k, v in message["headers"] }
+            status = message["status"]
+
+            self.passthrough = status < 200 or status in (204, 304) \
+                or b"content-encoding" in headers \
+                or not is_compressible(headers.get(b"content-type", b"").decode("latin-1"))
+
+            if self.passthrough:
+                await self.send(message)
+            elif self.encoding is None:
+                # Sent as is, but another Accept-Encoding would change it
+                self.passthrough = True
+                await self.send(self._headers(encoded=False))
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            return await self.send(message)
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None and not more_body:
+            # The whole body arrived at once
+            if len(body) < self.minimum_size:
+                await self.send(self._headers(encoded=False))
+                return await self.send(message)
+
+            body = compress(body, self.encoding)
+            await self.send(self._headers(len(body)))
+            return await self.send({ "type": "http.response.body", "body": body })
+
+        if self.compressor is None:
+            self.compressor = StreamCompressor(self.encoding)
+            await self.send(self._headers())
+
+        output = self.compressor.compress(body)
+
+        if not more_body:
+            output += self.compressor.finish()
+
+        await self.send({ "type": "http.response.body", "body": output, "more_body": more_body })
@@ -1,18 +1,77 @@
+import logging
+import os
+import threading
+import weakref
+
 from flask import Flask, current_app
 
 # tag::import[]
 from neo4j import GraphDatabase
 # end::import[]
 
+logger = logging.getLogger(__name__)
+
+"""
+Drivers are created once per process and shared by every application that
+connects with the same credentials.  The driver owns a connection pool and
+background threads, neither of which survives a fork: a worker forked from a
+preloading gunicorn master must open its own connections, and must not close
+or even garbage-collect the master's driver, whose sockets it shares.
+"""
+_drivers = {}
+_apps = weakref.WeakSet()
+_lock = threading.Lock()
+
+# Drivers inherited across a fork.  They are kept referenced so that their
+# finalizers never run in the child and close the parent's connections.
+_inherited = []
+
+
+def _create_driver(uri, username, password):
+    return GraphDatabase.driver(uri, auth=(username, password))
+
+
+def _after_fork_in_child():
+    global _lock
+
+    _lock = threading.Lock()
+    replaced = {}
+
+    for key, driver in list(_drivers.items()):
+        _inherited.append(driver)
+        replaced[id(driver)] = _drivers[key] = _create_driver(*key)
+
+    for app in list(_apps):
+        driver = getattr(app, "driver", None)
+
+        if driver is not None and id(driver) in replaced:
+            app.driver = replaced[id(driver)]
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
 """
 Initiate the Neo4j Driver
 """
 # tag::initDriver[]
 def init_driver(uri, username, password):
-    # TODO: Create an instance of the driver here
-    current_app.driver = None
+    key = (uri, username, password)
+
+    with _lock:
+        driver = _drivers.get(key)
 
-    return None
+        if driver is None:
+            driver = _create_driver(uri, username, password)
+
+            # Fail fast on bad credentials or an unreachable server
+            driver.verify_connectivity()
+
+            _drivers[key] = driver
+
+    current_app.driver = driver
+    _apps.add(current_app._get_current_object())
+
+    return driver
 # end::initDriver[]
 
 
@@ -32,8 +91,61 @@ If the driver has been instantiated, close it and all remaining open sessions
 # tag::closeDriver[]
 def close_driver():
     if current_app.driver != None:
+        with _lock:
+            for key, driver in list(_drivers.items()):
+                if driver is current_app.driver:
+                    del _drivers[key]
+
         current_app.driver.close()
         current_app.driver = None
 
         return current_app.driver
 # end::closeDriver[]
+
+
+"""
+Check every driver in this process by opening a connection with it, so a
+freshly forked worker has one ready before its first request.
+"""
+# tag::verifyConnections[]
+def verify_connections():
+    for driver in list(_drivers.values()):
+        try:
+            driver.verify_connectivity()
+        except Exception as e:
+            logger.warning("Neo4j connection check failed: %s", e)
+# end::verifyConnections[]
+
+
+"""
+Run the hot listing queries once so that their plans are in Neo4j's query
+cache, and the pool holds an open connection, before the first request.
+Failures are logged rather than raised: a cold cache is not a reason to
+refuse traffic.
+"""
+# tag::warmUp[]
+def warm_up(driver):
+    from api.dao.genres import GenreDAO
+    from api.dao.movies import MovieDAO
+    from api.dao.people import PeopleDAO
+
+    movies = MovieDAO(driver)
+    queries = [
+        lambda: GenreDAO(driver).all(),
+        lambda: PeopleDAO(driver).all(None),
+    ] + [
+        lambda sort=sort, order=order: movies.all(sort, order)
+        for sort, order in (("title", "ASC"), ("released", "DESC"), ("imdbRating", "DESC"))
+    ]
+
+    warmed = 0
+
+    for query in queries:
+        try:
+            query()
+            warmed += 1
+        except Exception as e:
+            logger.warning("Warm-up query failed: %s", e)
+
+    return warmed
+# end::warmUp[]
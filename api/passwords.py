@@ -0,0 +1,87 @@
+"""
+Password hashing on a dedicated, bounded process pool.
+
+bcrypt is deliberately expensive, so hashing on a WSGI worker thread would
+burn that worker's CPU for the length of every signup or login.  Here the
+work is handed to a small pool of processes: at most `HASH_WORKERS` hashes
+run at once, and at most `HASH_QUEUE` requests wait for a slot.  Callers
+beyond that block until a slot frees up, so a signup burst can only ever
+occupy a fixed share of the machine and the read API keeps its CPU.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+from config import SALT_ROUNDS, HASH_WORKERS, HASH_QUEUE
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def cost_of(hashed):
+    """
+    Return the cost factor encoded in a bcrypt hash such as `$2b$10$...`
+    """
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords on a process pool that is created lazily,
+    once per process, so that it is never shared across a fork.
+    """
+    def __init__(self, rounds=SALT_ROUNDS, workers=HASH_WORKERS, queue=HASH_QUEUE):
+        self.rounds = rounds
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._pid = os.getpid()
+
+            return self._pool
+
+    def _run(self, fn, *args):
+        with self._slots:
+            return self._executor().submit(fn, *args).result()
+
+    def hash(self, plain_password):
+        return self._run(_hash, plain_password.encode("utf8"), self.rounds).decode("utf8")
+
+    def verify(self, plain_password, hashed):
+        return self._run(_check, plain_password.encode("utf8"), hashed.encode("utf8"))
+
+    def needs_rehash(self, hashed):
+        """
+        True if the hash was created with a different cost than `SALT_ROUNDS`
+        """
+        return cost_of(hashed) != self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown()
+
+            self._pool = None
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,5 @@
+def is_enabled(value):
+    """
+    Parse a boolean query-string flag such as `?stream=true` or `?stream=1`
+    """
+    return value.lower() in ("1", "true", "yes", "on")
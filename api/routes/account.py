@@ -1,7 +1,7 @@
-from flask import Blueprint, current_app, request, jsonify
+from flask import Blueprint, request
 
-from api.dao.favorites import FavoriteDAO
-from api.dao.ratings import RatingDAO
+from api.dao.factory import get_dao
+from api.serialization import jsonify
 
 account_routes = Blueprint("account", __name__, url_prefix="/api/account")
 
@@ -28,7 +28,7 @@ def get_favorites():
     skip = request.args.get("skip", 0, type=int)
 
     # Create the DAO
-    dao = FavoriteDAO(current_app.driver)
+    dao = get_dao("favorites")
 
     output = dao.all(user_id, sort, order, limit, skip)
 
@@ -40,7 +40,7 @@ def add_favorite(movie_id):
     user_id = "00000000-0000-0000-0000-000000000000"
 
     # Create the DAO
-    dao = FavoriteDAO(current_app.driver)
+    dao = get_dao("favorites")
 
     if request.method == "POST":
         # Save the favorite
@@ -63,7 +63,7 @@ def save_rating(movie_id):
     rating = int(form_data["rating"])
 
     # Create the DAO
-    dao = RatingDAO(current_app.driver)
+    dao = get_dao("ratings")
 
     # Save the rating
     output = dao.add(user_id, movie_id, rating)
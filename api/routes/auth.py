@@ -1,6 +1,7 @@
-from flask import Blueprint, current_app, request, jsonify
+from flask import Blueprint, current_app, request
 
 from api.dao.auth import AuthDAO
+from api.serialization import jsonify
 
 auth_routes = Blueprint("auth", __name__, url_prefix="/api/auth")
 
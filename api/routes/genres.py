@@ -1,14 +1,15 @@
-from flask import Blueprint, current_app, request, jsonify
+from flask import Blueprint, request
 
-from api.dao.genres import GenreDAO
-from api.dao.movies import MovieDAO
+from api.dao.factory import get_dao
+from api.routes import is_enabled
+from api.serialization import jsonify, stream_json
 
 genre_routes = Blueprint("genre", __name__, url_prefix="/api/genres")
 
 @genre_routes.get('/')
 def get_index():
     # Create the DAO
-    dao = GenreDAO(current_app.driver)
+    dao = get_dao("genres")
 
     # Get output
     output = dao.all()
@@ -18,7 +19,7 @@ def get_index():
 @genre_routes.get('/<name>/')
 def get_genre(name):
     # Create the DAO
-    dao = GenreDAO(current_app.driver)
+    dao = get_dao("genres")
 
     # Get the Genre
     output = dao.find(name)
@@ -37,7 +38,11 @@ def get_genre_movies(name):
     skip = request.args.get("skip", 0, type=int)
 
     # Create the DAO
-    dao = MovieDAO(current_app.driver)
+    dao = get_dao("movies")
+
+    # Stream the list as it is read from Neo4j if the client opted in
+    if request.args.get("stream", False, type=is_enabled):
+        return stream_json(dao.stream_by_genre(name, sort, order, limit, skip, user_id))
 
     # Get the Genre
     output = dao.get_by_genre(name, sort, order, limit, skip, user_id)
@@ -1,15 +1,17 @@
-from flask import Blueprint, current_app, request, jsonify
+from flask import Blueprint, request
 
-from api.dao.movies import MovieDAO
-from api.dao.ratings import RatingDAO
+from api.dao.factory import get_dao
+from api.routes import is_enabled
+from api.serialization import jsonify, stream_json
 
 movie_routes = Blueprint("movies", __name__, url_prefix="/api/movies")
 
 # tag::list[]
 @movie_routes.get('/')
 def get_movies():
-    # Extract pagination values from the request
-    sort = request.args.get("sort", "title")
+    # Extract search and pagination values from the request
+    q = request.args.get("q")
+    sort = request.args.get("sort", "relevance" if q else "title")
     order = request.args.get("order", "ASC")
     limit = request.args.get("limit", 6, type=int)
     skip = request.args.get("skip", 0, type=int)
@@ -18,23 +20,41 @@ def get_movies():
     user_id = "00000000-0000-0000-0000-000000000000"
 
     # Create a new MovieDAO Instance
-    dao = MovieDAO(current_app.driver)
+    dao = get_dao("movies")
+
+    # Stream the list as it is read from Neo4j if the client opted in
+    if request.args.get("stream", False, type=is_enabled):
+        return stream_json(dao.stream_all(sort, order, limit=limit, skip=skip, user_id=user_id, q=q))
 
     # Retrieve a paginated list of movies
-    output = dao.all(sort, order, limit=limit, skip=skip, user_id=user_id)
+    output = dao.all(sort, order, limit=limit, skip=skip, user_id=user_id, q=q)
 
     # Return as JSON
     return jsonify(output)
 # end::list[]
 
 
+@movie_routes.get('/autocomplete')
+def autocomplete():
+    q = request.args.get("q", "")
+    limit = request.args.get("limit", 10, type=int)
+
+    # Create a new MovieDAO Instance
+    dao = get_dao("movies")
+
+    # Get suggestions from the in-process prefix index
+    output = dao.autocomplete(q, limit)
+
+    return jsonify(output)
+
+
 @movie_routes.get('/<movie_id>')
 def get_movie_details(movie_id):
     # Admin access - no auth required
     user_id = "00000000-0000-0000-0000-000000000000"
 
     # Create a new MovieDAO Instance
-    dao = MovieDAO(current_app.driver)
+    dao = get_dao("movies")
 
     # Get the Movie
     movie = dao.find_by_id(movie_id, user_id)
@@ -51,7 +71,11 @@ def get_movie_ratings(movie_id):
     skip = request.args.get("skip", 0, type=int)
 
     # Create a new RatingDAO Instance
-    dao = RatingDAO(current_app.driver)
+    dao = get_dao("ratings")
+
+    # Stream the ratings as they are read from Neo4j if the client opted in
+    if request.args.get("stream", False, type=is_enabled):
+        return stream_json(dao.stream_for_movie(movie_id, sort, order, limit, skip))
 
     # Get ratings for the movie
     ratings = dao.for_movie(movie_id, sort, order, limit, skip)
@@ -69,7 +93,7 @@ def get_similar_movies(movie_id):
     skip = request.args.get("skip", 0, type=int)
 
     # Create a new MovieDAO Instance
-    dao = MovieDAO(current_app.driver)
+    dao = get_dao("movies")
 
     # Get Similar Movies
     output = dao.get_similar_movies(movie_id, limit, skip, user_id)
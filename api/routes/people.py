@@ -1,6 +1,8 @@
-from flask import Blueprint, current_app, request, jsonify
+from flask import Blueprint, request
 
-from api.dao.people import PeopleDAO
+from api.dao.factory import get_dao
+from api.routes import is_enabled
+from api.serialization import jsonify, stream_json
 
 people_routes = Blueprint("people", __name__, url_prefix="/api/people")
 
@@ -8,13 +10,17 @@ people_routes = Blueprint("people", __name__, url_prefix="/api/people")
 def get_index():
     # Get Pagination Values
     q = request.args.get("q")
-    sort = request.args.get("sort", "title")
+    sort = request.args.get("sort", "relevance" if q else "name")
     order = request.args.get("order", "ASC")
     limit = request.args.get("limit", 6, type=int)
     skip = request.args.get("skip", 0, type=int)
 
     # Create an instance of the PeopleDAO
-    dao = PeopleDAO(current_app.driver)
+    dao = get_dao("people")
+
+    # Stream the list as it is read from Neo4j if the client opted in
+    if request.args.get("stream", False, type=is_enabled):
+        return stream_json(dao.stream_all(q, sort, order, limit, skip))
 
     # Get output
     output = dao.all(q, sort, order, limit, skip)
@@ -22,10 +28,24 @@ def get_index():
     return jsonify(output)
 
 
+@people_routes.get('/autocomplete')
+def autocomplete():
+    q = request.args.get("q", "")
+    limit = request.args.get("limit", 10, type=int)
+
+    # Create an instance of the PeopleDAO
+    dao = get_dao("people")
+
+    # Get suggestions from the in-process prefix index
+    output = dao.autocomplete(q, limit)
+
+    return jsonify(output)
+
+
 @people_routes.get('/<id>')
 def get_person(id):
     # Create an instance of the PeopleDAO
-    dao = PeopleDAO(current_app.driver)
+    dao = get_dao("people")
 
     # Get the person
     person = dao.find_by_id(id)
@@ -40,7 +60,7 @@ def get_similar_people(id):
     skip = request.args.get("skip", 0, type=int)
 
     # Create an instance of the PeopleDAO
-    dao = PeopleDAO(current_app.driver)
+    dao = get_dao("people")
 
     # Get the person
     similar = dao.get_similar_people(id, limit, skip)
@@ -1,4 +1,7 @@
-from flask import Blueprint, current_app, jsonify
+from flask import Blueprint, current_app
+
+from api.dao.queries import registry
+from api.serialization import jsonify
 
 status_routes = Blueprint("status", __name__, url_prefix="/api/status")
 
@@ -10,4 +13,12 @@ def get_index():
         "NEO4J_USERNAME": current_app.config.get('NEO4J_USERNAME'),
         "NEO4J_PASSWORD": current_app.config.get('NEO4J_PASSWORD'),
         "NEO4J_DATABASE": current_app.config.get('NEO4J_DATABASE')
-    })
\ No newline at end of file
+    })
+
+
+"""
+Hit counts for each prepared listing statement, see api/dao/queries.py
+"""
+@status_routes.route('/queries', methods=['GET'])
+def get_queries():
+    return jsonify(registry.stats())
@@ -0,0 +1,232 @@
+"""
+Full-text search helpers and an in-process prefix index used for autocomplete.
+
+Listing searches go through Neo4j full-text (Lucene) indexes so that a query
+never scans every Person or Movie node.  Autocomplete requests are answered
+from a `PrefixIndex` held in memory, which is rebuilt periodically from the
+database.
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+import unicodedata
+
+from api.dao.sessions import read_session, write_session
+
+# Full-text indexes backing the people and movie listing searches
+FULLTEXT_INDEXES = {
+    "person_name_fulltext": ("Person", ["name"]),
+    "movie_title_fulltext": ("Movie", ["title"]),
+}
+
+PERSON_INDEX = "person_name_fulltext"
+MOVIE_INDEX = "movie_title_fulltext"
+
+# Characters with a special meaning in the Lucene query syntax
+_LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+_TOKEN = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def ensure_fulltext_indexes(driver):
+    """
+    Create the full-text indexes used by the search routes if they do not
+    already exist.
+    """
+    with write_session(driver) as session:
+        for name, (label, properties) in FULLTEXT_INDEXES.items():
+            fields = ", ".join("n.`{0}`".format(p) for p in properties)
+            session.run("""
+                CREATE FULLTEXT INDEX `{0}` IF NOT EXISTS
+                FOR (n:`{1}`) ON EACH [{2}]
+            """.format(name, label, fields)).consume()
+
+
+def normalize(text):
+    """
+    Lower-case the text and strip accents so that "François" matches "francois".
+    """
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    return _TOKEN.findall(normalize(text))
+
+
+def fulltext_query(q):
+    """
+    Convert free text typed by a user into a Lucene query.
+
+    Every term must match, and the last term is treated as a prefix so that
+    results appear while the user is still typing: `al pac` becomes
+    `al AND pac*`.  Returns None if the input has no searchable terms.
+    """
+    terms = [_LUCENE_SPECIAL.sub(r"\\\1", t) for t in tokenize(q)]
+
+    if not terms:
+        return None
+
+    terms[-1] = terms[-1] + "*"
+
+    return " AND ".join(terms)
+
+
+class PrefixIndex:
+    """
+    An immutable prefix index over (id, name, weight) entries.
+
+    Every token of every name is stored in a sorted array, so a prefix lookup
+    is a binary search followed by a scan of the matching range.  The best
+    `head_size` entries for every prefix up to `head_length` characters are
+    precomputed, because those short prefixes match the largest ranges and
+    are exactly what users type first.
+    """
+    def __init__(self, entries, head_length=3, head_size=20):
+        entries = sorted(entries, key=lambda e: e[2], reverse=True)
+
+        self.ids = [e[0] for e in entries]
+        self.names = [e[1] for e in entries]
+        self.weights = [e[2] for e in entries]
+        self.head_length = head_length
+        self.head_size = head_size
+
+        self._head = {}
+        postings = []
+
+        # Entries are visited by descending weight, so the first head_size
+        # entries that reach a bucket are its best matches
+        for position, name in enumerate(self.names):
+            tokens = set(tokenize(name))
+
+            for token in tokens:
+                postings.append((token, position))
+
+            prefixes = {t[:n] for t in tokens for n in range(1, min(len(t), head_length) + 1)}
+
+            for prefix in prefixes:
+                bucket = self._head.setdefault(prefix, [])
+                if len(bucket) < head_size:
+                    bucket.append(position)
+
+        postings.sort()
+
+        self._tokens = [p[0] for p in postings]
+        self._positions = [p[1] for p in postings]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _range(self, prefix):
+        start = bisect.bisect_left(self._tokens, prefix)
+        end = bisect.bisect_left(self._tokens, prefix + "\uffff", start)
+
+        return start, end
+
+    def complete(self, q, limit=10):
+        """
+        Return up to `limit` entries whose names contain a token starting with
+        each term of `q`, best weighted first.
+        """
+        terms = tokenize(q)
+
+        if not terms or limit <= 0:
+            return []
+
+        if len(terms) == 1 and len(terms[0]) <= self.head_length and limit <= self.head_size:
+            positions = self._head.get(terms[0], [])[:limit]
+        else:
+            # Scan the range of the longest term, as it is the most selective
+            lead = max(terms, key=len)
+            start, end = self._range(lead)
+            candidates = set(self._positions[start:end])
+
+            if len(terms) > 1:
+                candidates = [p for p in candidates if self._matches(p, terms)]
+
+            positions = heapq.nsmallest(limit, candidates)
+
+        return [
+            {"tmdbId": self.ids[p], "name": self.names[p]}
+            for p in positions
+        ]
+
+    def _matches(self, position, terms):
+        tokens = tokenize(self.names[position])
+
+        return all(any(t.startswith(term) for t in tokens) for term in terms)
+
+
+class PrefixIndexCache:
+    """
+    Holds one `PrefixIndex` per process and rebuilds it from the database
+    once it is older than `ttl` seconds.
+
+    The `loader` is called with the driver and must return an iterable of
+    (id, name, weight) tuples.  While a rebuild is in progress, other
+    requests continue to be served from the previous index.
+    """
+    def __init__(self, loader, ttl=600):
+        self.loader = loader
+        self.ttl = ttl
+        self._index = None
+        self._built_at = 0
+        self._lock = threading.Lock()
+
+    def get(self, driver):
+        if self._index is None:
+            # Nothing to serve yet, so the first caller has to wait for a build
+            with self._lock:
+                if self._index is None:
+                    self._rebuild(driver)
+        elif time.monotonic() - self._built_at > self.ttl and self._lock.acquire(blocking=False):
+            threading.Thread(target=self._rebuild_and_release, args=(driver,), daemon=True).start()
+
+        return self._index
+
+    def _rebuild(self, driver):
+        self._index = PrefixIndex(self.loader(driver))
+        self._built_at = time.monotonic()
+
+    def _rebuild_and_release(self, driver):
+        try:
+            self._rebuild(driver)
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        self._built_at = 0
+
+
+def _load_people(driver):
+    def read(tx):
+        result = tx.run("""
+            MATCH (p:Person)
+            WHERE p.name IS NOT NULL
+            RETURN p.tmdbId AS id, p.name AS name,
+                count { (p)-[:ACTED_IN|DIRECTED]->() } AS weight
+        """)
+        return [(row["id"], row["name"], row["weight"]) for row in result]
+
+    with read_session(driver) as session:
+        return session.execute_read(read)
+
+
+def _load_movies(driver):
+    def read(tx):
+        result = tx.run("""
+            MATCH (m:Movie)
+            WHERE m.title IS NOT NULL
+            RETURN m.tmdbId AS id, m.title AS name,
+                coalesce(m.imdbVotes, 0) AS weight
+        """)
+        return [(row["id"], row["name"], row["weight"]) for row in result]
+
+    with read_session(driver) as session:
+        return session.execute_read(read)
+
+
+people_index = PrefixIndexCache(_load_people)
+movie_index = PrefixIndexCache(_load_movies)
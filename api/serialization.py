@@ -0,0 +1,171 @@
+"""
+JSON serialization for API responses.
+
+Both the Flask blueprints and the FastAPI service serialize through the
+serializer selected by the `JSON_SERIALIZER` setting.  `orjson` is used when it
+is installed ("auto"), with the standard library `json` module as the fallback,
+and other serializers can be plugged in with `register_serializer`.
+
+Values the encoders do not understand natively are passed to `default`.  It
+looks up a converter by the exact type of the value, so neo4j Nodes,
+Relationships and temporal values cost one dictionary lookup each.  Nodes and
+Relationships hand over their own property mapping rather than a copy.
+"""
+import json
+
+from neo4j.graph import Node, Path, Relationship
+from neo4j.spatial import Point
+from neo4j.time import Date, DateTime, Duration, Time
+
+from config import JSON_SERIALIZER
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def _properties(entity):
+    return entity._properties
+
+
+def _iso_format(value):
+    return value.iso_format()
+
+
+def _path(path):
+    return {
+        "nodes": [ node._properties for node in path.nodes ],
+        "relationships": [ rel._properties for rel in path.relationships ],
+    }
+
+
+_CONVERTERS = {
+    Node: _properties,
+    Relationship: _properties,
+    Path: _path,
+    Date: _iso_format,
+    DateTime: _iso_format,
+    Time: _iso_format,
+    Duration: _iso_format,
+    set: list,
+    frozenset: list,
+}
+
+# Subclasses checked when a type is not found in _CONVERTERS.  Relationship
+# instances, for example, belong to a class created per relationship type.
+_BASES = [
+    (Relationship, _properties),
+    (Node, _properties),
+    (Point, list),
+]
+
+
+def default(value):
+    """
+    Convert a value the JSON encoder cannot handle into one it can.
+    """
+    converter = _CONVERTERS.get(type(value))
+
+    if converter is None:
+        for base, candidate in _BASES:
+            if isinstance(value, base):
+                # Remember the concrete type so the next lookup is direct
+                converter = _CONVERTERS[type(value)] = candidate
+                break
+        else:
+            raise TypeError("Object of type {0} is not JSON serializable".format(type(value).__name__))
+
+    return converter(value)
+
+
+def _orjson_dumps(value):
+    return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _json_dumps(value):
+    return json.dumps(value, default=default, ensure_ascii=False, separators=(",", ":")).encode("utf8")
+
+
+_SERIALIZERS = {
+    "json": _json_dumps,
+}
+
+if orjson is not None:
+    _SERIALIZERS["orjson"] = _orjson_dumps
+
+
+def register_serializer(name, dumps):
+    """
+    Register a serializer: a callable taking a value and returning JSON bytes.
+    """
+    _SERIALIZERS[name] = dumps
+
+
+def get_serializer(name=None):
+    name = name or JSON_SERIALIZER
+
+    if name == "auto":
+        name = "orjson" if "orjson" in _SERIALIZERS else "json"
+
+    return _SERIALIZERS[name]
+
+
+def dumps(value):
+    """
+    Serialize `value` to JSON bytes with the configured serializer.
+    """
+    return get_serializer()(value)
+
+
+"""
+A drop-in replacement for `flask.jsonify` that serializes through `dumps`.
+Flask is imported on use because the FastAPI service shares this module
+without depending on Flask.
+"""
+# tag::jsonify[]
+def jsonify(value):
+    from flask import current_app
+
+    return current_app.response_class(dumps(value), mimetype="application/json")
+# end::jsonify[]
+
+
+"""
+Serialize an iterable as a JSON array, yielding bytes as the items arrive.
+Items are grouped into chunks of roughly `chunk_bytes` so each write to the
+client, and each compression flush, carries a useful amount of data.
+"""
+# tag::jsonArray[]
+def json_array(items, chunk_bytes=16384):
+    serializer = get_serializer()
+    buffer = bytearray(b"[")
+    first = True
+
+    for item in items:
+        if not first:
+            buffer += b","
+
+        buffer += serializer(item)
+        first = False
+
+        if len(buffer) >= chunk_bytes:
+            yield bytes(buffer)
+            buffer.clear()
+
+    buffer += b"]"
+
+    yield bytes(buffer)
+# end::jsonArray[]
+
+
+"""
+A Flask response that streams `items` as a JSON array.  The request context
+is kept alive until the last item has been written.
+"""
+# tag::streamJson[]
+def stream_json(items):
+    from flask import current_app, stream_with_context
+
+    return current_app.response_class(stream_with_context(json_array(items)), mimetype="application/json")
+# end::streamJson[]
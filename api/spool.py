@@ -0,0 +1,440 @@
+"""
+A durable on-disk spool for ingest payloads, so that the sync service keeps
+accepting data while Neo4j is slow or down.
+
+The spool is an append-only log split into segment files of about
+`SPOOL_SEGMENT_BYTES` each.  A record is a length and a CRC32 followed by the
+payload as JSON.  `append` returns only once the record is on disk.  Appenders
+that arrive while an fsync is running wait for it to finish, and the next
+fsync then covers all of them, so a burst of ingests costs a few fsyncs
+rather than one each.
+
+A Drainer thread reads records after the checkpoint and replays them into
+Neo4j in batches.  After each batch it moves the checkpoint forward and
+deletes segments that lie wholly before it.  Replays are at least once: a
+batch that was written but not checkpointed before a crash is written again.
+Ingest MERGEs, so a repeated write is harmless.
+
+After a crash the last segment is truncated at its first incomplete or
+corrupt record, which can only be one whose append never returned.
+
+One process owns a spool directory at a time; it is locked while open.
+"""
+import fcntl
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from collections import deque
+
+from neo4j.exceptions import ClientError
+
+from api.serialization import dumps
+from config import SPOOL_DRAIN_BATCH, SPOOL_RETRY_MS, SPOOL_SEGMENT_BYTES
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct(">II")
+SEGMENT_SUFFIX = ".log"
+CHECKPOINT = "checkpoint"
+REJECTED = "rejected.jsonl"
+
+# Longest pause between replays while Neo4j is failing
+MAX_RETRY = 30.0
+
+
+def format_position(position):
+    return "{0}:{1}".format(*position)
+
+
+def fsync_directory(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def frame(data):
+    """
+    A record holding the bytes `data`: its length and CRC32, then the data.
+    """
+    return HEADER.pack(len(data), zlib.crc32(data)) + data
+
+
+def scan(path, offset=0):
+    """
+    Yield `(end offset, payload bytes)` for each intact record in a file of
+    framed records, from `offset`, stopping at the first incomplete or
+    corrupt one.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+
+        while True:
+            header = f.read(HEADER.size)
+
+            if len(header) < HEADER.size:
+                return
+
+            length, checksum = HEADER.unpack(header)
+            data = f.read(length)
+
+            if len(data) < length or zlib.crc32(data) != checksum:
+                return
+
+            offset += HEADER.size + length
+            yield offset, data
+
+
+class Spool:
+    """
+    A segmented append-only log of JSON payloads.  Positions are
+    `(segment, offset)` tuples naming the end of a record.
+    """
+    def __init__(self, directory, segment_bytes=SPOOL_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.appended = 0
+        self.fsyncs = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock_file = open(os.path.join(directory, "lock"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise RuntimeError("Spool directory {0} is in use by another process".format(directory))
+
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._rolled = []
+
+        self.checkpoint = self._read_checkpoint()
+        segments = self._segments()
+
+        self._segment = max(segments + [ self.checkpoint[0] ])
+        self._size = self._recover(self._segment)
+        self._synced = (self._segment, self._size)
+        self._file = open(self._path(self._segment), "ab")
+
+        self._remove_before(self.checkpoint[0])
+
+    def _path(self, segment):
+        return os.path.join(self.directory, "{0:020d}{1}".format(segment, SEGMENT_SUFFIX))
+
+    def _segments(self):
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _read_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT)) as f:
+                segment, offset = json.load(f)
+        except FileNotFoundError:
+            segments = self._segments()
+            return (segments[0] if segments else 1, 0)
+
+        return (segment, offset)
+
+    def _recover(self, segment):
+        # Drop a torn record left at the tail by a crash mid-append
+        path = self._path(segment)
+
+        if not os.path.exists(path):
+            return 0
+
+        end = 0
+        for end, _ in scan(path):
+            pass
+
+        if end != os.path.getsize(path):
+            logger.warning("Truncating spool segment {0} at offset {1}".format(segment, end))
+
+            with open(path, "r+b") as f:
+                f.truncate(end)
+                os.fsync(f.fileno())
+
+        return end
+
+    def append(self, payload):
+        """
+        Append `payload` and return its position once it is durable.
+        """
+        data = dumps(payload)
+        record = frame(data)
+
+        with self._write_lock:
+            if self._size and self._size + len(record) > self.segment_bytes:
+                self._roll()
+
+            self._file.write(record)
+            self._size += len(record)
+            self.appended += 1
+            position = (self._segment, self._size)
+
+        self._sync(position)
+
+        return position
+
+    def _roll(self):
+        # Called with the write lock held; the old file is closed once synced
+        self._file.flush()
+        self._rolled.append(self._file)
+        self._segment += 1
+        self._size = 0
+        self._file = open(self._path(self._segment), "ab")
+        fsync_directory(self.directory)
+
+    def _sync(self, position):
+        with self._sync_lock:
+            if self._synced >= position:
+                # Covered by the fsync this appender was waiting on
+                return
+
+            with self._write_lock:
+                self._file.flush()
+                files, self._rolled = self._rolled + [ self._file ], []
+                target = (self._segment, self._size)
+
+            for f in files:
+                os.fsync(f.fileno())
+
+            for f in files[:-1]:
+                f.close()
+
+            self.fsyncs += 1
+            self._synced = target
+
+    def read(self, after, limit):
+        """
+        Return up to `limit` durable records after position `after`, as
+        `(position, payload)` pairs.
+        """
+        records = []
+        segment, offset = after
+        synced = self._synced
+
+        while len(records) < limit and (segment, offset) < synced:
+            path = self._path(segment)
+
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    f.seek(offset)
+
+                    while len(records) < limit and (segment, offset) < synced:
+                        header = f.read(HEADER.size)
+
+                        if len(header) < HEADER.size:
+                            break
+
+                        length, checksum = HEADER.unpack(header)
+                        data = f.read(length)
+
+                        if len(data) < length or zlib.crc32(data) != checksum:
+                            raise ValueError("Corrupt spool record at {0}".format(format_position((segment, offset))))
+
+                        offset += HEADER.size + length
+                        records.append(((segment, offset), json.loads(data)))
+
+            if len(records) < limit and (segment, offset) < synced:
+                # The rest of this segment has been read; carry on in the next
+                segment, offset = segment + 1, 0
+
+        return records
+
+    def commit(self, position):
+        """
+        Record that everything up to `position` has been applied, and delete
+        the segments that are no longer needed.
+        """
+        path = os.path.join(self.directory, CHECKPOINT)
+        temporary = path + ".tmp"
+
+        with open(temporary, "w") as f:
+            json.dump(list(position), f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temporary, path)
+        fsync_directory(self.directory)
+
+        self.checkpoint = position
+        self._remove_before(position[0])
+
+    def _remove_before(self, segment):
+        for old in self._segments():
+            if old < segment:
+                os.remove(self._path(old))
+
+    def reject(self, payload, error):
+        """
+        Set aside a payload Neo4j will never accept, so that it does not block
+        the records behind it.
+        """
+        with open(os.path.join(self.directory, REJECTED), "ab") as f:
+            f.write(dumps({ "error": error, "payload": payload }) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def pending_bytes(self):
+        segment, offset = self.checkpoint
+        synced_segment, synced_offset = self._synced
+
+        if segment == synced_segment:
+            return synced_offset - offset
+
+        between = sum(
+            os.path.getsize(self._path(s)) for s in range(segment, synced_segment)
+            if os.path.exists(self._path(s))
+        )
+
+        return between - offset + synced_offset
+
+    def close(self):
+        with self._sync_lock, self._write_lock:
+            for f in self._rolled + [ self._file ]:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+
+            self._rolled = []
+
+        self._lock_file.close()
+
+    def stats(self):
+        return {
+            "directory": self.directory,
+            "segments": len(self._segments()),
+            "appended": self.appended,
+            "fsyncs": self.fsyncs,
+            "checkpoint": format_position(self.checkpoint),
+            "written": format_position(self._synced),
+            "pending_bytes": self.pending_bytes(),
+        }
+
+
+class Drainer:
+    """
+    Replays a Spool through `replay(instances_data)`, which returns
+    `(report, result)`, in batches of up to `batch` records.
+
+    Failures are retried with exponential back-off, so records wait out a
+    Neo4j outage on disk.  A record that fails with a ClientError (a query
+    Neo4j rejects) is retried on its own and then moved to the spool's
+    rejected file.
+    """
+    def __init__(self, spool, replay, batch=SPOOL_DRAIN_BATCH, retry_ms=SPOOL_RETRY_MS):
+        self.spool = spool
+        self.replay = replay
+        self.batch = batch
+        self.retry = retry_ms / 1000
+        self.applied = spool.checkpoint
+        self.replayed = 0
+        self.failures = 0
+        self.rejected = 0
+        self.last_error = None
+        # The outcome of recent replays, by the position of their last record
+        self._results = deque(maxlen=256)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        with self._cond:
+            # Threads do not survive a fork; start one per process
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="spool-drainer", daemon=True)
+                self._thread.start()
+
+            self._cond.notify_all()
+
+    def wait(self, position, timeout):
+        """
+        Wait up to `timeout` seconds for the record at `position` to reach
+        Neo4j.  Returns the `(report, result)` of the replay that covered it,
+        the ClientError it was rejected with, or None on timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.applied >= position, timeout):
+                return None
+
+            for end, outcome in self._results:
+                if end >= position:
+                    return outcome
+
+            # Too long ago to remember; a later replay's bookmark covers it
+            return self._results[-1][1] if self._results else None
+
+    def _run(self):
+        delay = self.retry
+        batch = self.batch
+
+        while True:
+            records = self.spool.read(self.applied, batch)
+
+            if not records:
+                with self._cond:
+                    self._cond.wait(1.0)
+                continue
+
+            try:
+                result = self.replay([ instance for _, payload in records for instance in payload ])
+            except ClientError as e:
+                self._failed(e)
+
+                if len(records) > 1:
+                    # Find the bad record by replaying one at a time
+                    batch = 1
+                else:
+                    self._reject(records[0], e)
+                continue
+            except Exception as e:
+                self._failed(e)
+
+                with self._cond:
+                    self._cond.wait(delay)
+
+                delay = min(delay * 2, MAX_RETRY)
+                continue
+
+            self._advance(records[-1][0], len(records), result)
+            delay = self.retry
+            batch = self.batch
+
+    def _failed(self, error):
+        self.failures += 1
+        self.last_error = str(error)
+        logger.warning("Spool replay failed: {0}".format(error))
+
+    def _reject(self, record, error):
+        position, payload = record
+        self.spool.reject(payload, str(error))
+        self.rejected += 1
+        logger.error("Rejected spooled ingest at {0}: {1}".format(format_position(position), error))
+        self._advance(position, 0, error)
+
+    def _advance(self, position, count, outcome):
+        self.spool.commit(position)
+
+        with self._cond:
+            self.applied = position
+            self.replayed += count
+            self._results.append((position, outcome))
+            self._cond.notify_all()
+
+    def stats(self):
+        return dict(
+            self.spool.stats(),
+            applied=format_position(self.applied),
+            replayed=self.replayed,
+            failures=self.failures,
+            rejected=self.rejected,
+            last_error=self.last_error,
+        )
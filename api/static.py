@@ -0,0 +1,118 @@
+"""
+Serve the compiled UI in `public/`.
+
+The build names bundles after their content (`app.6697881b.js`), so a given
+URL never changes content.  Those files are sent with a year-long, immutable
+Cache-Control and the browser never asks for them again.  `index.html` is the
+only entry point whose content changes between deployments; it gets a short
+max-age plus an ETag, so after it expires a reload costs one 304.
+
+When `compress_static.py` has written `.br`/`.gz` siblings next to a file, the
+best one the client accepts is sent as-is with a Content-Encoding header, so
+nothing is compressed per request.  Files go out through `send_file`, which
+hands them to the server's `wsgi.file_wrapper` (sendfile under gunicorn).
+"""
+import mimetypes
+import os
+
+from flask import Blueprint, abort, request, send_file
+
+from api.assets import HASHED_NAME, PRECOMPRESSED, PUBLIC_DIR, is_precompressed
+from api.middleware.compression import choose_encoding
+from config import INDEX_MAX_AGE, STATIC_MAX_AGE
+
+
+class StaticAssets:
+    """
+    Manifest of the files under `root` and their precompressed siblings,
+    built once so that requests never stat the file system to find out
+    whether a variant exists.
+    """
+    def __init__(self, root=PUBLIC_DIR):
+        self.root = root
+        self.files = {}
+
+        for directory, _, names in os.walk(root):
+            present = set(names)
+
+            for name in names:
+                if is_precompressed(name):
+                    continue
+
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, root).replace(os.sep, "/")
+
+                self.files[relative] = {
+                    encoding: path + suffix
+                    for encoding, suffix in PRECOMPRESSED
+                    if name + suffix in present
+                }
+
+    def resolve(self, filename, accept_encoding):
+        """
+        Return `(path, encoding)` for the variant of `filename` to send, or
+        None if there is no such file.  `encoding` is None for the original.
+        """
+        variants = self.files.get(filename)
+
+        if variants is None:
+            return None
+
+        path = os.path.join(self.root, filename)
+
+        if variants:
+            encoding = choose_encoding(accept_encoding, tuple(variants))
+
+            if encoding is not None:
+                return variants[encoding], encoding
+
+        return path, None
+
+
+def cache_control(filename):
+    if HASHED_NAME.search(filename):
+        return "public, max-age={0}, immutable".format(STATIC_MAX_AGE)
+
+    return "public, max-age={0}, must-revalidate".format(INDEX_MAX_AGE)
+
+
+"""
+Create a blueprint that serves `root` from `/`.  Paths outside `/api` that do
+not match a file and have no extension are client-side routes, and get
+`index.html`.
+"""
+# tag::staticRoutes[]
+def static_blueprint(root=PUBLIC_DIR):
+    assets = StaticAssets(root)
+    blueprint = Blueprint("static_assets", __name__)
+
+    @blueprint.get("/", defaults={ "filename": "index.html" })
+    @blueprint.get("/<path:filename>")
+    def serve(filename):
+        if filename not in assets.files and not filename.startswith("api/") \
+                and "." not in filename.rsplit("/", 1)[-1]:
+            filename = "index.html"
+
+        resolved = assets.resolve(filename, request.headers.get("Accept-Encoding"))
+
+        if resolved is None:
+            abort(404)
+
+        path, encoding = resolved
+
+        # The MIME type is that of the original file, not the .br/.gz sibling
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+        response.headers["Cache-Control"] = cache_control(filename)
+
+        if assets.files[filename]:
+            response.vary.add("Accept-Encoding")
+
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+
+        return response
+
+    return blueprint
+# end::staticRoutes[]
+
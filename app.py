@@ -1,15 +1,30 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 from typing import List, Dict, Any, Optional
 import logging
 import os
 import sys
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 
 # Add the parent directory to path to ensure imports work correctly
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from api.analysis import find_cycles
 from api.dao.neo4j_client import Neo4jClient
+from api.dao.sessions import decode_bookmarks, encode_bookmarks
+from api.gc import GarbageCollector
+from api.history import History
+from api.idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER, IdempotencyKeyReused, IdempotencyStore, payload_digest
+from api.ingest import GroupCommitter, IngestPlan, IngestStats, IngestWriter
+from api.middleware.admission import AdmissionController, AdmissionMiddleware, RateLimiter
+from api.middleware.compression import CompressionMiddleware
+from api.ranking import RankingCache
+from api.spool import Drainer, Spool, format_position
+from api.serialization import dumps
+from config import HISTORY_DIR, SPOOL_DIR, SPOOL_WAIT_MS
 
 # Configure logging
 logging.basicConfig(
@@ -23,11 +38,29 @@ NEO4J_URI = os.getenv("NEO4J_URI", "neo4j://localhost:7687")
 NEO4J_USERNAME = os.getenv("NEO4J_USERNAME", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "neo")
 
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered by the shared serializer in api/serialization.py.
+    Only the rendering changes: FastAPI has already run jsonable_encoder over
+    the value by then.  Hot endpoints return `json_response` instead.
+    """
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def json_response(payload):
+    """
+    A response serialized straight from `payload`, without FastAPI's
+    jsonable_encoder pass copying it first.  neo4j values are converted by
+    api.serialization.default.
+    """
+    return Response(dumps(payload), media_type="application/json")
+
 # Create FastAPI app
 app = FastAPI(
     title="Neo4j Sync Microservice",
     description="A stateless microservice for syncing Odoo module dependency data to Neo4j",
     version="1.0.0",
+    default_response_class=FastJSONResponse,
 )
 
 # Add CORS middleware
@@ -39,6 +72,15 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+# Compress large JSON responses for clients that accept gzip or brotli
+app.add_middleware(CompressionMiddleware)
+
+# Per-client rate limits and a concurrency cap on /ingest and /analyse
+rate_limiter = RateLimiter()
+admission = AdmissionController()
+ingest_stats = IngestStats()
+app.add_middleware(AdmissionMiddleware, limiter=rate_limiter, controller=admission)
+
 # Models
 class GraphNode(BaseModel):
     id: str
@@ -71,6 +113,13 @@ class HealthResponse(BaseModel):
     neo4j_connected: bool
     timestamp: str = Field(default_factory=lambda: datetime.now().isoformat())
 
+class IngestResponse(BaseModel):
+    status: str
+    message: str
+    bookmark: Optional[str] = None
+    report: Optional[Dict[str, Any]] = None
+    position: Optional[str] = None
+
 class CycleAnalysisResult(BaseModel):
     has_cycles: bool
     cycles: List[List[str]] = []
@@ -96,14 +145,42 @@ def get_neo4j_client():
             raise HTTPException(status_code=503, detail=f"Neo4j connection failed: {str(e)}")
     return neo4j_client
 
+# Deletes what instances stopped reporting, on a schedule and on demand
+garbage_collector = GarbageCollector(lambda: get_neo4j_client().driver)
+
+@app.on_event("startup")
+async def startup_event():
+    """Resume replaying payloads left in the spool by an earlier run"""
+    if drainer is not None:
+        drainer.start()
+    garbage_collector.start()
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup Neo4j connection on shutdown"""
     global neo4j_client
+    garbage_collector.stop()
+    if spool is not None:
+        spool.close()
+    if history is not None:
+        history.close()
     if neo4j_client:
         neo4j_client.close()
         logger.info("Neo4j connection closed")
 
+BOOKMARK_HEADER = "X-Bookmark"
+
+def read_bookmarks(
+    bookmark: Optional[str] = Query(None, description="Bookmark returned by /ingest"),
+    x_bookmark: Optional[str] = Header(None),
+):
+    """
+    Bookmarks a read must observe, from the `bookmark` query parameter or the
+    `X-Bookmark` header.  With them a read can go to any cluster member and
+    still see the ingest that returned the bookmark.
+    """
+    return decode_bookmarks(bookmark or x_bookmark)
+
 # Endpoints
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -125,77 +202,301 @@ async def health_check():
         "timestamp": datetime.now().isoformat()
     }
 
-@app.post("/ingest")
-async def ingest_data(request: IngestRequest):
-    """Ingest module dependency data into Neo4j"""
+@app.get("/metrics")
+async def metrics():
+    """Limits and current usage of the rate limiter and admission queue"""
+    return {
+        "rate_limit": rate_limiter.stats(),
+        "admission": admission.stats(),
+        "ingest": ingest_stats.stats(),
+        "group_commit": group_commit.stats(),
+        "spool": drainer.stats() if drainer is not None else None,
+        "idempotency": idempotency.stats(),
+        "gc": garbage_collector.progress(),
+        "history": history.stats() if history is not None else None,
+        "ranking": rankings.stats(),
+    }
+
+def commit_ingest(instances_data):
+    """
+    Write the instances of one or more ingest requests in one session, so
+    that one bookmark covers all of them.  Returns the report and bookmarks.
+    """
+    client = get_neo4j_client()
+
+    # First, ensure schema exists
+    client.create_schema()
+
+    plan = IngestPlan(instances_data)
+
+    for name in plan.skipped:
+        logger.warning(f"Skipping instance {name}: no data or unsuccessful status")
+
+    with client.write_session() as session:
+        report = IngestWriter(session).write(plan)
+
+    ingest_stats.record(report)
+    logger.info(
+        f"Ingested {report['rows']} rows in {report['batches']} batches, "
+        f"hubs {report['hubs']}, contention {report['contention']}"
+    )
+
+    if history is not None:
+        try:
+            history.record(plan, report["generations"])
+        except Exception as e:
+            # The graph itself is written; only its history has a gap
+            logger.error(f"Failed to record ingest history: {str(e)}")
+
+    return report, session.last_bookmarks()
+
+# With HISTORY_DIR set, every ingest is kept as a delta for /history
+history = History(HISTORY_DIR) if HISTORY_DIR else None
+
+# Concurrent ingests share batches; see GROUP_COMMIT_WINDOW_MS
+group_commit = GroupCommitter(commit_ingest)
+
+# With SPOOL_DIR set, payloads are made durable on disk before being written
+spool = Spool(SPOOL_DIR) if SPOOL_DIR else None
+drainer = Drainer(spool, commit_ingest) if spool is not None else None
+
+def spool_ingest(instances_data):
+    """
+    Append a request to the spool and wait up to SPOOL_WAIT_MS for the
+    drainer to write it.  Returns the spool position and `(report, bookmarks)`,
+    or None for the latter if the wait ran out.
+    """
+    position = spool.append(instances_data)
+    drainer.start()
+
+    outcome = drainer.wait(position, SPOOL_WAIT_MS / 1000)
+
+    if isinstance(outcome, Exception):
+        raise HTTPException(status_code=422, detail=f"Neo4j rejected the ingest: {str(outcome)}")
+
+    return format_position(position), outcome
+
+# Responses of completed ingests, so that retries are not written again
+idempotency = IdempotencyStore()
+
+def run_ingest(instances_data):
+    """
+    Write an ingest request and return the status code and body of its
+    response.
+    """
+    position = None
+
+    if spool is None:
+        report, bookmarks = group_commit.submit(instances_data)
+    else:
+        position, outcome = spool_ingest(instances_data)
+
+        if outcome is None:
+            return 202, {
+                "status": "queued",
+                "message": f"Data from {len(instances_data)} instances spooled; it will be written when Neo4j catches up",
+                "position": position,
+            }
+
+        report, bookmarks = outcome
+
+    return 200, {
+        "status": "success",
+        "message": f"Data from {len(instances_data)} instances ingested successfully",
+        "bookmark": encode_bookmarks(bookmarks),
+        "report": report,
+        "position": position,
+    }
+
+@app.post("/ingest", response_model=IngestResponse)
+def ingest_data(
+    request: IngestRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+):
+    """
+    Ingest module dependency data into Neo4j.
+
+    The response carries a `bookmark` (also sent as the `X-Bookmark` header)
+    identifying the writes; pass it to /analyse to read them back from any
+    cluster member.  `report` describes the batches written and the time
+    spent waiting on contended hub modules.  Requests arriving together are
+    written together, in shared batches, so `report` covers the whole group,
+    whose size is given in `report.group`.
+
+    With a spool configured, the payload is first made durable on disk.  If
+    Neo4j has not written it within SPOOL_WAIT_MS, the response is a 202
+    with status "queued" and the spool `position`; the data is written once
+    Neo4j catches up.
+
+    A request with the `Idempotency-Key` of an earlier one, or without a key
+    but with the same payload, gets the earlier response again, marked with
+    `Idempotent-Replayed: true`, and writes nothing.  A payload without a
+    key is only a repeat until one of its instances is ingested again.  An
+    `Idempotency-Key` sent again with a different payload is answered with a
+    422.
+
+    This is a plain function so that FastAPI runs it on its thread pool and
+    concurrent ingests do not block the event loop.
+    """
+    started = time.perf_counter()
+
     try:
-        client = get_neo4j_client()
-        
-        # First, ensure schema exists
-        client.create_schema()
-        
-        # Process each instance's data
-        for instance_data in request.instances_data:
-            if instance_data.status != "success" or not instance_data.data:
-                logger.warning(f"Skipping instance {instance_data.instance} due to status: {instance_data.status}")
-                continue
-                
-            # Create Instance node
-            client.run(
-                "MERGE (i:Instance {name: $name})",
-                {"name": instance_data.instance}
-            )
-            
-            # Process module nodes
-            for node in instance_data.data.nodes:
-                client.run(
-                    """
-                    MERGE (m:Module {id: $id})
-                    SET m += $properties
-                    WITH m
-                    MATCH (i:Instance {name: $instance})
-                    MERGE (i)-[:DEPLOYS]->(m)
-                    """,
-                    {
-                        "id": node["id"],
-                        "properties": node,
-                        "instance": instance_data.instance
-                    }
-                )
-            
-            # Process dependencies
-            for edge in instance_data.data.edges:
-                client.run(
-                    """
-                    MATCH (m1:Module {id: $from})
-                    MATCH (m2:Module {id: $to})
-                    MERGE (m1)-[r:DEPENDS_ON]->(m2)
-                    SET r.instance = $instance
-                    """,
-                    {
-                        "from": edge["from"],
-                        "to": edge["to"],
-                        "instance": instance_data.instance
-                    }
-                )
-        
-        return {"status": "success", "message": f"Data from {len(request.instances_data)} instances ingested successfully"}
+        instances_data = [ instance_data.model_dump() for instance_data in request.instances_data ]
+        digest = payload_digest(instances_data)
+
+        try:
+            (status_code, body), replayed = idempotency.run(
+                idempotency_key or digest, lambda: run_ingest(instances_data), digest=digest,
+                instances=sorted({ instance_data["instance"] for instance_data in instances_data }))
+        except IdempotencyKeyReused as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+        response.status_code = status_code
+        if replayed:
+            response.headers[REPLAYED_HEADER] = "true"
+        if body.get("bookmark"):
+            response.headers[BOOKMARK_HEADER] = body["bookmark"]
+
+        return body
     
+    except HTTPException:
+        raise
+
     except Exception as e:
         logger.error(f"Error during ingestion: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error during ingestion: {str(e)}")
 
+    finally:
+        ingest_stats.latency.record(time.perf_counter() - started)
+
+def parse_timestamp(value):
+    """
+    Seconds since the epoch from an ISO 8601 timestamp (UTC unless it says
+    otherwise) or from a number of seconds.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid timestamp: {value}")
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+
+    return parsed.timestamp()
+
+def require_history():
+    if history is None:
+        raise HTTPException(status_code=404, detail="History is not recorded; set HISTORY_DIR")
+    return history
+
+def with_time(entry):
+    return dict(entry, time=datetime.fromtimestamp(entry["at"], timezone.utc).isoformat())
+
 @app.get("/analyse", response_model=CycleAnalysisResult)
-async def analyse_dependencies():
-    """Analyse the dependency graph for cycles"""
+async def analyse_dependencies(
+    bookmarks=Depends(read_bookmarks),
+    instance: Optional[str] = Query(None, description="Only analyse the dependencies of this instance"),
+    at: Optional[str] = Query(None, description="Analyse the graph as it was at this time (ISO 8601 or epoch seconds)"),
+):
+    """
+    Analyse the dependency graph for cycles, as of at least the given
+    bookmark, or as it was at time `at` according to the ingest history.
+
+    Both the Neo4j read and the history replay block, so they run on the
+    thread pool rather than on the event loop.
+    """
+    if at is not None:
+        when = parse_timestamp(at)
+        edges = await run_in_threadpool(require_history().edges_at, when, instance)
+        return json_response(find_cycles(edges))
+
     try:
         client = get_neo4j_client()
-        result = client.find_cycles()
-        return result
+        result = await run_in_threadpool(client.find_cycles, bookmarks, instance=instance)
+        return json_response(result)
     except Exception as e:
         logger.error(f"Error during cycle analysis: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error during cycle analysis: {str(e)}")
 
+# Rankings by the synced generations they were computed at
+rankings = RankingCache()
+
+@app.get("/modules/ranking")
+def module_ranking(
+    bookmarks=Depends(read_bookmarks),
+    instance: Optional[str] = Query(None, description="Only rank by the dependencies of this instance"),
+    limit: int = Query(100, ge=1, le=100000, description="Number of modules to return"),
+):
+    """
+    Modules ranked by how much depends on them, to prioritise upgrade
+    testing: PageRank, in-degree and number of transitive dependents over
+    DEPENDS_ON.  Rankings are cached until an instance is ingested again or
+    garbage collected.
+
+    This is a plain function so that FastAPI runs the ranking on its thread
+    pool rather than on the event loop.
+    """
+    try:
+        client = get_neo4j_client()
+        ranking = client.rank_modules(bookmarks, instance=instance, cache=rankings, limit=limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error during module ranking: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error during module ranking: {str(e)}")
+
+    return json_response(dict(ranking, instance=instance))
+
+@app.get("/history")
+async def list_history(
+    instance: Optional[str] = Query(None, description="Only list this instance's ingests"),
+    since: Optional[str] = Query(None, description="Only list ingests at or after this time"),
+    until: Optional[str] = Query(None, description="Only list ingests at or before this time"),
+    limit: int = Query(100, ge=1, le=10000),
+):
+    """
+    The recorded ingests, newest first, with the number of modules and
+    dependencies each one added, removed or changed
+    """
+    deltas = await run_in_threadpool(
+        require_history().list,
+        instance=instance,
+        since=parse_timestamp(since) if since else None,
+        until=parse_timestamp(until) if until else None,
+        limit=limit,
+    )
+    return json_response({ "deltas": [ with_time(delta) for delta in deltas ] })
+
+@app.get("/history/{seq}")
+async def get_history_delta(seq: int):
+    """The full delta recorded for one ingest of one instance"""
+    delta = await run_in_threadpool(require_history().delta, seq)
+
+    if delta is None:
+        raise HTTPException(status_code=404, detail=f"No delta {seq}")
+
+    return json_response(with_time(delta))
+
+@app.get("/admin/gc")
+async def gc_progress():
+    """Progress of the running or last stale-module garbage collection"""
+    return garbage_collector.progress()
+
+@app.post("/admin/gc", status_code=202)
+async def start_gc():
+    """
+    Start a garbage collection of modules and dependencies that instances no
+    longer report.  Poll GET /admin/gc for its progress.
+    """
+    started = garbage_collector.trigger()
+    return { "started": started, "progress": garbage_collector.progress() }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,12 @@
+"""
+Performance benchmarks for the sync service and the Flask API.
+
+    python -m benchmarks --instances 10 --modules 2000 --density 0.002 --output bench.json
+
+By default Neo4j is replaced by `FakeDriver`, so the numbers cover the Python
+side alone (validation, batching, serialization, cycle detection) and are
+stable enough to track between commits.  `--backend neo4j` runs the same
+suite against the database configured in `.env`, e.g. a local container:
+
+    docker run -p 7687:7687 -e NEO4J_AUTH=neo4j/password neo4j:5
+"""
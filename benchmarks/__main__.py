@@ -0,0 +1,38 @@
+import argparse
+import json
+import logging
+import sys
+
+from benchmarks.suite import run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Run the performance benchmarks")
+    parser.add_argument("--instances", type=int, default=5, help="Odoo instances in the fleet")
+    parser.add_argument("--modules", type=int, default=500, help="modules in the shared catalogue")
+    parser.add_argument("--density", type=float, default=0.01, help="probability of each possible dependency")
+    parser.add_argument("--cycles", type=int, default=0, help="dependency cycles to inject")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backend", choices=("fake", "neo4j"), default="fake")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    options = parser.parse_args(argv)
+
+    # One log line per request would drown the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    report = run(options.instances, options.modules, options.density, options.cycles,
+        options.repeat, options.backend, options.seed)
+    output = json.dumps(report, indent=2)
+
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+A stand-in for the Neo4j driver that answers every query in memory.
+
+Queries are answered by a `responder(cypher, params)` returning a list of
+dicts, one per record; by default every query returns no records.  Each call
+is counted, so benchmarks can also report how many round trips an operation
+made.
+"""
+from neo4j import Bookmarks, Record
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._records = [ Record(row.items()) for row in rows ]
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def single(self):
+        return self._records[0] if self._records else None
+
+    def data(self):
+        return [ dict(record) for record in self._records ]
+
+    def consume(self):
+        return None
+
+
+class FakeTransaction:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, cypher, parameters=None, **kwparameters):
+        return self.driver._answer(cypher, dict(parameters or {}, **kwparameters))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeSession(FakeTransaction):
+    def __init__(self, driver, **config):
+        super().__init__(driver)
+        self.config = config
+
+    def execute_read(self, work, *args, **kwargs):
+        return work(FakeTransaction(self.driver), *args, **kwargs)
+
+    execute_write = execute_read
+
+    def begin_transaction(self):
+        return FakeTransaction(self.driver)
+
+    def last_bookmarks(self):
+        return Bookmarks.from_raw_values([ "FB:fake:{0}".format(self.driver.queries) ])
+
+    def close(self):
+        pass
+
+
+class FakeDriver:
+    def __init__(self, responder=None):
+        self.responder = responder or (lambda cypher, params: [])
+        self.queries = 0
+
+    def _answer(self, cypher, params):
+        self.queries += 1
+        return FakeResult(self.responder(cypher, params))
+
+    def session(self, **config):
+        return FakeSession(self, **config)
+
+    def verify_connectivity(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,80 @@
+"""
+Synthetic Odoo fleets: `instances` instances drawing from a shared catalogue
+of `modules` modules.
+"""
+import random
+
+CATEGORIES = ("Sales", "Inventory", "Accounting", "Website", "Human Resources", "Technical")
+
+
+def generate_fleet(instances=5, modules=500, density=0.01, coverage=0.8, cycles=0, seed=42):
+    """
+    Build an /ingest request body.
+
+    Module `i` depends on each earlier module with probability `density`, so
+    the catalogue is acyclic apart from `cycles` back edges added on purpose.
+    Each instance deploys a random `coverage` share of the catalogue, plus the
+    dependencies of whatever it deploys, and reports the edges between them.
+    """
+    rng = random.Random(seed)
+    names = [ "module_{0:05d}".format(i) for i in range(modules) ]
+    depends = { name: set() for name in names }
+
+    for i in range(1, modules):
+        # Always depend on something, like every Odoo module depends on base
+        depends[names[i]].add(names[rng.randrange(i)])
+
+        for j in range(i):
+            if rng.random() < density:
+                depends[names[i]].add(names[j])
+
+    for _ in range(cycles):
+        low, high = sorted(rng.sample(range(modules), 2))
+        depends[names[low]].add(names[high])
+
+    payload = []
+
+    for n in range(instances):
+        deployed = { name for name in names if rng.random() < coverage }
+        pending = list(deployed)
+
+        while pending:
+            for dependency in depends[pending.pop()]:
+                if dependency not in deployed:
+                    deployed.add(dependency)
+                    pending.append(dependency)
+
+        nodes = [
+            {
+                "id": name,
+                "name": name,
+                "version": "17.0.1.{0}".format(rng.randrange(10)),
+                "category": rng.choice(CATEGORIES),
+            }
+            for name in sorted(deployed)
+        ]
+        edges = [
+            { "from": name, "to": dependency }
+            for name in sorted(deployed) for dependency in sorted(depends[name])
+        ]
+
+        payload.append({
+            "instance": "odoo{0}".format(n + 1),
+            "status": "success",
+            "data": { "nodes": nodes, "edges": edges },
+        })
+
+    return { "instances_data": payload }
+
+
+def fleet_edges(fleet):
+    """
+    The (source, target, instance) triples of a fleet, as /analyse reads them.
+    """
+    edges = {}
+
+    for instance in fleet["instances_data"]:
+        for edge in instance["data"]["edges"]:
+            edges[(edge["from"], edge["to"])] = instance["instance"]
+
+    return [ (source, target, instance) for (source, target), instance in edges.items() ]
@@ -0,0 +1,146 @@
+"""
+Before/after report for the removal of DEPLOYED_BY mirrors.
+
+"Before" writes a fleet the way older releases did: every DEPLOYS is
+followed by its (Module)-[:DEPLOYED_BY]->(Instance) mirror.  "After" writes
+it with the current IngestWriter.  The report compares relationship counts,
+an estimate of relationship store size, and ingest throughput.
+
+Against the fake backend the counts come from the plan itself, and the
+timings measure client-side cost and round trips only.  With
+`--backend neo4j` the fleet is written to the configured database and
+migrated with `collapse_deployed_by`, and the counts are read back from it.
+
+    python -m benchmarks.mirrors --instances 10 --modules 2000
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.fake_driver import FakeDriver
+from benchmarks.fleet import generate_fleet
+from benchmarks.suite import summarize, timed
+from api.dao.schema import collapse_deployed_by
+from api.dao.sessions import read_session, write_session
+from api.ingest import IngestPlan, IngestWriter
+
+# Size of a relationship record in the record store; mirrors carry no
+# properties, so this is all they cost on disk apart from chain updates
+RELATIONSHIP_RECORD_BYTES = 34
+
+RELATIONSHIP_TYPES = ("DEPLOYS", "DEPLOYED_BY", "DEPENDS_ON")
+
+MERGE_MIRRORS = """
+    UNWIND $rows AS row
+    MATCH (m:Module {id: row.id})
+    MATCH (i:Instance {name: row.instance})
+    MERGE (m)-[:DEPLOYED_BY]->(i)
+"""
+
+
+class MirroringWriter(IngestWriter):
+    """
+    The writer as it was while DEPLOYS were mirrored.
+    """
+    def write(self, plan):
+        report = super().write(plan)
+        self._write_all(MERGE_MIRRORS, [ row for row in plan.all_rows() if "id" in row ])
+
+        return report
+
+
+def planned_counts(plan, mirrors):
+    deploys = sum(1 for row in plan.all_rows() if "id" in row)
+
+    return {
+        "DEPLOYS": deploys,
+        "DEPLOYED_BY": deploys if mirrors else 0,
+        "DEPENDS_ON": sum(1 for row in plan.all_rows() if "from" in row),
+    }
+
+
+def stored_counts(driver):
+    # Counts of a single relationship type come from the count store
+    with read_session(driver) as session:
+        return {
+            name: session.run("MATCH ()-[r:`{0}`]->() RETURN count(r) AS count".format(name)).single()["count"]
+            for name in RELATIONSHIP_TYPES
+        }
+
+
+def store_size(counts):
+    return {
+        "relationships": counts,
+        "estimated_bytes": sum(counts.values()) * RELATIONSHIP_RECORD_BYTES,
+    }
+
+
+def throughput(driver, writer, plan, repeat):
+    def write():
+        with write_session(driver) as session:
+            writer(session).write(plan)
+
+    # Rows of the payload per second, the same work for both writers
+    return summarize(timed(write, repeat), items=plan.rows)
+
+
+def run(instances=5, modules=500, density=0.01, repeat=10, backend="fake", seed=42):
+    fleet = generate_fleet(instances, modules, density, seed=seed)
+    plan = IngestPlan(fleet["instances_data"])
+
+    if backend == "fake":
+        driver = FakeDriver()
+    else:
+        from api.neo4j import _create_driver
+        from config import NEO4J_PASSWORD, NEO4J_URI, NEO4J_USERNAME
+
+        driver = _create_driver(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
+
+    before = throughput(driver, MirroringWriter, plan, repeat)
+
+    if backend == "fake":
+        before_counts = planned_counts(plan, mirrors=True)
+        after_counts = planned_counts(plan, mirrors=False)
+        migration = { "removed": before_counts["DEPLOYED_BY"], "created": 0 }
+    else:
+        before_counts = stored_counts(driver)
+        migration = collapse_deployed_by(driver)
+        after_counts = stored_counts(driver)
+
+    after = throughput(driver, IngestWriter, plan, repeat)
+    before_size, after_size = store_size(before_counts), store_size(after_counts)
+
+    return {
+        "meta": { "backend": backend, "instances": instances, "modules": modules, "density": density, "repeat": repeat },
+        "migration": migration,
+        "store": {
+            "before": before_size,
+            "after": after_size,
+            "saved_bytes": before_size["estimated_bytes"] - after_size["estimated_bytes"],
+        },
+        "ingest": {
+            "before": before,
+            "after": after,
+            "speedup": round(after["items_per_s"] / before["items_per_s"], 2),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.mirrors", description="Report the cost of DEPLOYED_BY mirrors")
+    parser.add_argument("--instances", type=int, default=5, help="Odoo instances in the fleet")
+    parser.add_argument("--modules", type=int, default=500, help="modules in the shared catalogue")
+    parser.add_argument("--density", type=float, default=0.01, help="probability of each possible dependency")
+    parser.add_argument("--repeat", type=int, default=10, help="timed ingests per writer")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backend", choices=("fake", "neo4j"), default="fake")
+    options = parser.parse_args(argv)
+
+    print(json.dumps(run(options.instances, options.modules, options.density, options.repeat,
+        options.backend, options.seed), indent=2))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
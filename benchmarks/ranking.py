@@ -0,0 +1,62 @@
+"""
+Timings of the module ranking behind `/modules/ranking`, on a synthetic
+catalogue of `modules` modules leaning on a core, like an Odoo catalogue:
+every module depends on three earlier ones, most often on the first few.
+
+The report separates the PageRank computation from the transitive
+dependent counts of the `limit` modules returned, and times a whole ranking.
+
+    python -m benchmarks.ranking --modules 100000
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from benchmarks.suite import summarize, timed
+from api.ranking import Ranking, Reachability, rank_modules
+
+
+def catalogue(modules=100000, seed=42):
+    """
+    The `(module, dependency)` pairs of the catalogue.  Module 0 is the core
+    that every other module depends on, directly or not.
+    """
+    rng = np.random.default_rng(seed)
+    sources = np.repeat(np.arange(1, modules), 3)
+    targets = (rng.random(len(sources)) ** 4 * sources).astype(np.int64)
+
+    return list(zip(sources.tolist(), targets.tolist()))
+
+
+def run(modules=100000, limit=100, repeat=5, seed=42):
+    edges = catalogue(modules, seed)
+    ranking = Ranking(edges)
+    nodes = ranking.order[:limit]
+
+    return {
+        "meta": { "modules": modules, "dependencies": len(edges), "limit": limit, "repeat": repeat, "seed": seed },
+        "results": {
+            "pagerank": summarize(timed(lambda: Ranking(edges), repeat), items=modules),
+            "transitive_dependents": summarize(timed(lambda: Reachability(ranking.matrix).counts(nodes), repeat)),
+            "rank_modules": summarize(timed(lambda: rank_modules(edges, limit=limit), repeat), items=modules),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ranking", description="Time the module ranking")
+    parser.add_argument("--modules", type=int, default=100000, help="modules in the catalogue")
+    parser.add_argument("--limit", type=int, default=100, help="modules returned, with transitive dependents")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per measure")
+    parser.add_argument("--seed", type=int, default=42)
+    options = parser.parse_args(argv)
+
+    print(json.dumps(run(options.modules, options.limit, options.repeat, options.seed), indent=2))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
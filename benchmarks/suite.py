@@ -0,0 +1,153 @@
+"""
+The benchmarks themselves.  Each returns a summary of its timings in
+milliseconds, plus a throughput where one makes sense.
+"""
+import platform
+import time
+import uuid
+from datetime import datetime, timezone
+
+from benchmarks.fake_driver import FakeDriver
+from benchmarks.fleet import fleet_edges, generate_fleet
+
+# Flask routes driven by `bench_listings`
+LISTINGS = (
+    "/api/movies/?sort=title&order=ASC&limit=24",
+    "/api/movies/?sort=imdbRating&order=DESC&limit=24",
+    "/api/genres/",
+    "/api/genres/Action/movies?sort=released&order=DESC&limit=24",
+    "/api/people/?sort=name&limit=24",
+    "/api/movies/769/ratings?limit=24",
+)
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def summarize(samples, items=None):
+    """
+    Summarize durations in seconds.  `items` is the amount of work per run,
+    for a per-second throughput.
+    """
+    summary = {
+        "runs": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+        "min_ms": round(min(samples) * 1000, 3),
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+    if items is not None:
+        summary["items_per_run"] = items
+        summary["items_per_s"] = round(items * len(samples) / sum(samples), 1)
+
+    return summary
+
+
+def timed(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+
+    return samples
+
+
+def _check(response):
+    if response.status_code != 200:
+        raise RuntimeError("{0} answered {1}: {2}".format(response.url, response.status_code, response.text[:200]))
+
+    return response
+
+
+def sync_client(backend, fleet):
+    """
+    A test client for the sync service with its rate limits lifted.  With the
+    fake backend, /analyse reads the fleet's own edges.
+    """
+    from starlette.testclient import TestClient
+
+    import app as sync_app
+    from api.dao.neo4j_client import Neo4jClient
+
+    if backend == "fake":
+        edges = [ { "source": s, "target": t, "instance": i } for s, t, i in fleet_edges(fleet) ]
+
+        def respond(cypher, params):
+            return edges if "DEPENDS_ON" in cypher and "AS source" in cypher else []
+
+        sync_app.neo4j_client = Neo4jClient(driver=FakeDriver(respond))
+
+    sync_app.rate_limiter.rate = sync_app.rate_limiter.burst = 1e12
+    sync_app.admission.timeout = None
+
+    return TestClient(sync_app.app)
+
+
+def flask_client(backend):
+    from api import create_app
+
+    app = create_app({ "DAO_BACKEND": "fixtures" } if backend == "fake" else {})
+
+    return app.test_client()
+
+
+def bench_ingest(client, fleet, repeat):
+    rows = sum(len(i["data"]["nodes"]) + len(i["data"]["edges"]) for i in fleet["instances_data"])
+    # A fresh key per request, or repeats would be answered from the
+    # idempotency store without writing anything
+    samples = timed(lambda: _check(client.post("/ingest", json=fleet, headers={ "Idempotency-Key": uuid.uuid4().hex })), repeat)
+
+    return summarize(samples, items=rows)
+
+
+def bench_analyse(client, repeat):
+    return summarize(timed(lambda: _check(client.get("/analyse")), repeat))
+
+
+def bench_listings(client, repeat):
+    return {
+        path: summarize(timed(lambda: _check(client.get(path)), repeat))
+        for path in LISTINGS
+    }
+
+
+def run(instances=5, modules=500, density=0.01, cycles=0, repeat=20, backend="fake", seed=42):
+    """
+    Run the whole suite and return a JSON-serializable report.
+    """
+    fleet = generate_fleet(instances, modules, density, cycles=cycles, seed=seed)
+    sync = sync_client(backend, fleet)
+    ingest_repeat = max(1, repeat // 4)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "backend": backend,
+            "instances": instances,
+            "modules": modules,
+            "density": density,
+            "cycles": cycles,
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": {
+            "ingest": bench_ingest(sync, fleet, ingest_repeat),
+            "analyse": bench_analyse(sync, repeat),
+            "listings": bench_listings(flask_client(backend), repeat),
+        },
+    }
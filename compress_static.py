@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+import gzip
+import mimetypes
+import os
+import sys
+
+from api.assets import PUBLIC_DIR, is_precompressed
+from api.middleware.compression import is_compressible
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def main(root=PUBLIC_DIR):
+    """
+    Write `.gz` (and, when the brotli package is installed, `.br`) siblings
+    next to every textual file in public/, at maximum compression, for the
+    static file handler to send as-is.  Run as part of the build; variants
+    that would not be smaller than the original are skipped.
+    """
+    written = 0
+
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if is_precompressed(name):
+                continue
+
+            if not is_compressible(mimetypes.guess_type(name)[0]) and not name.endswith(".map"):
+                continue
+
+            path = os.path.join(directory, name)
+
+            with open(path, "rb") as f:
+                data = f.read()
+
+            variants = { ".gz": gzip.compress(data, compresslevel=9, mtime=0) }
+
+            if brotli is not None:
+                variants[".br"] = brotli.compress(data, quality=11)
+
+            for suffix, body in variants.items():
+                if len(body) >= len(data):
+                    continue
+
+                with open(path + suffix, "wb") as f:
+                    f.write(body)
+
+                written += 1
+
+    print(f"Wrote {written} precompressed files under {root}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
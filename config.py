@@ -9,5 +9,95 @@ NEO4J_URI = os.getenv('NEO4J_URI', 'neo4j://localhost:7687')
 NEO4J_USERNAME = os.getenv('NEO4J_USERNAME', 'neo4j')
 NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD', 'neo')
 
+# Run the hot listing queries when the Flask app starts, to warm Neo4j's plan cache
+NEO4J_WARMUP = os.getenv('NEO4J_WARMUP', 'false').lower() in ('1', 'true', 'yes')
+
+# Number of users whose latest write bookmarks are kept for read-your-writes
+BOOKMARK_CACHE_SIZE = int(os.getenv('BOOKMARK_CACHE_SIZE', 10000))
+
+# DAO backend for the Flask API: "neo4j", or "fixtures" to serve api/data.py
+DAO_BACKENDS = ('neo4j', 'fixtures')
+DAO_BACKEND = os.getenv('DAO_BACKEND', 'neo4j')
+
+# JSON serializer for API responses: "auto" uses orjson when it is installed
+JSON_SERIALIZER = os.getenv('JSON_SERIALIZER', 'auto')
+
+# Responses smaller than COMPRESS_MIN_SIZE bytes are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))
+
+# Cache lifetimes, in seconds, for content-hashed assets in public/ and for
+# everything else there (index.html)
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', 31536000))
+INDEX_MAX_AGE = int(os.getenv('INDEX_MAX_AGE', 60))
+
+# Number of records fetched from Neo4j per round trip when a list is streamed
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 100))
+
 # No authentication required - using admin access via Neo4j credentials only
-SALT_ROUNDS = int(os.getenv('SALT_ROUNDS', 10))
\ No newline at end of file
+SALT_ROUNDS = int(os.getenv('SALT_ROUNDS', 10))
+
+# Password hashing runs on a bounded process pool, off the request threads
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', 2))
+HASH_QUEUE = int(os.getenv('HASH_QUEUE', 32))
+
+# Per-client token bucket on the sync service's /ingest and /analyse
+RATE_LIMIT_RATE = float(os.getenv('RATE_LIMIT_RATE', 1.0))
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', 10))
+RATE_LIMIT_CLIENTS = int(os.getenv('RATE_LIMIT_CLIENTS', 10000))
+
+# At most ADMISSION_CONCURRENCY of those requests run at once, ADMISSION_QUEUE
+# more wait up to ADMISSION_TIMEOUT seconds, and writes with bodies under
+# ADMISSION_SMALL_REQUEST bytes skip the queue
+ADMISSION_CONCURRENCY = int(os.getenv('ADMISSION_CONCURRENCY', 4))
+ADMISSION_QUEUE = int(os.getenv('ADMISSION_QUEUE', 32))
+ADMISSION_TIMEOUT = float(os.getenv('ADMISSION_TIMEOUT', 30))
+ADMISSION_SMALL_REQUEST = int(os.getenv('ADMISSION_SMALL_REQUEST', 65536))
+
+# Ingest writes rows in UNWIND batches of INGEST_BATCH_SIZE; modules with at
+# least HUB_DEGREE dependents in a payload get dedicated, serialized batches
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 1000))
+HUB_DEGREE = int(os.getenv('HUB_DEGREE', 25))
+
+# Concurrent ingests are written together, in shared batches: a write waits
+# up to GROUP_COMMIT_WINDOW_MS for more requests, or until GROUP_COMMIT_MAX_ROWS
+# rows are queued.  0 writes every request on its own.
+GROUP_COMMIT_WINDOW_MS = float(os.getenv('GROUP_COMMIT_WINDOW_MS', 5))
+GROUP_COMMIT_MAX_ROWS = int(os.getenv('GROUP_COMMIT_MAX_ROWS', 5000))
+
+# With SPOOL_DIR set, /ingest appends payloads to a durable spool there and a
+# background drainer replays them into Neo4j, SPOOL_DRAIN_BATCH payloads at a
+# time, backing off from SPOOL_RETRY_MS while writes fail.  /ingest waits up
+# to SPOOL_WAIT_MS for its payload to be replayed before answering 202.
+SPOOL_DIR = os.getenv('SPOOL_DIR', '')
+SPOOL_SEGMENT_BYTES = int(os.getenv('SPOOL_SEGMENT_BYTES', 64 * 1024 * 1024))
+SPOOL_DRAIN_BATCH = int(os.getenv('SPOOL_DRAIN_BATCH', 64))
+SPOOL_RETRY_MS = float(os.getenv('SPOOL_RETRY_MS', 500))
+SPOOL_WAIT_MS = float(os.getenv('SPOOL_WAIT_MS', 2000))
+
+# Responses to ingests are kept by Idempotency-Key (or payload digest) for
+# IDEMPOTENCY_TTL seconds, IDEMPOTENCY_CACHE_SIZE keys at most, and also
+# appended to IDEMPOTENCY_FILE when it is set, to survive restarts
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000))
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_FILE = os.getenv('IDEMPOTENCY_FILE', '')
+
+# Stale modules and dependencies are collected every GC_INTERVAL seconds (0
+# disables the schedule; POST /admin/gc still runs it), skipping instances
+# ingested in the last GC_GRACE seconds.  Deletes are committed GC_BATCH_SIZE
+# rows at a time, and progress is updated every GC_CHUNK_BATCHES batches.
+GC_INTERVAL = float(os.getenv('GC_INTERVAL', 3600))
+GC_GRACE = int(os.getenv('GC_GRACE', 600))
+GC_BATCH_SIZE = int(os.getenv('GC_BATCH_SIZE', 1000))
+GC_CHUNK_BATCHES = int(os.getenv('GC_CHUNK_BATCHES', 10))
+
+# With HISTORY_DIR set, every ingest is also recorded there as a delta so that
+# /analyse?at= and /history can reconstruct past graphs.  A full checkpoint is
+# written once the changes since the last add up to HISTORY_CHECKPOINT_RATIO
+# times the size of the graph.
+HISTORY_DIR = os.getenv('HISTORY_DIR', '')
+HISTORY_CHECKPOINT_RATIO = float(os.getenv('HISTORY_CHECKPOINT_RATIO', 0.5))
+
+# /modules/ranking keeps the rankings of the RANKING_CACHE_SIZE most recently
+# requested graphs, each identified by the synced generations it was computed at
+RANKING_CACHE_SIZE = int(os.getenv('RANKING_CACHE_SIZE', 32))
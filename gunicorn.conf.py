@@ -0,0 +1,19 @@
+# Serve the Flask API with gunicorn:
+#
+#   gunicorn "api:create_app()"
+#
+# The application, its Neo4j driver and the warm-up queries are loaded once
+# in the master; workers fork from it and open their own connection pool.
+import os
+
+bind = "0.0.0.0:" + os.getenv("PORT", "3000")
+workers = int(os.getenv("WEB_CONCURRENCY", 4))
+threads = int(os.getenv("WEB_THREADS", 4))
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Open the worker's first connection before it accepts requests
+    from api.neo4j import verify_connections
+
+    verify_connections()
@@ -27,7 +27,6 @@ def main():
         client.run("""
             MERGE (m:Module {id: 'module-1'})
             ON CREATE SET m.name = 'Core Module', 
-                          m.version = '1.0.0',
                           m.created = timestamp()
             RETURN m
         """)
@@ -35,7 +34,6 @@ def main():
         client.run("""
             MERGE (m:Module {id: 'module-2'})
             ON CREATE SET m.name = 'Auth Module', 
-                          m.version = '0.9.5',
                           m.created = timestamp()
             RETURN m
         """)
@@ -45,15 +43,15 @@ def main():
         client.run("""
             MATCH (i:Instance {name: 'prod-instance-1'})
             MATCH (m:Module {id: 'module-1'})
-            MERGE (i)-[:DEPLOYS]->(m)
-            MERGE (m)-[:DEPLOYED_BY]->(i)
+            MERGE (i)-[d:DEPLOYS]->(m)
+            SET d.version = '1.0.0'
         """)
         
         client.run("""
             MATCH (i:Instance {name: 'prod-instance-1'})
             MATCH (m:Module {id: 'module-2'})
-            MERGE (i)-[:DEPLOYS]->(m)
-            MERGE (m)-[:DEPLOYED_BY]->(i)
+            MERGE (i)-[d:DEPLOYS]->(m)
+            SET d.version = '0.9.5'
         """)
         print("Created Instance-Module relationships")
         
@@ -3,6 +3,8 @@
 import sys
 from config import NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD
 from api.dao.neo4j_client import Neo4jClient
+from api.dao.schema import collapse_deployed_by, strip_module_properties
+from api.search import ensure_fulltext_indexes
 
 def main():
     """
@@ -15,7 +17,20 @@ def main():
         client = Neo4jClient(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
         
         # Create schema (constraints and indexes)
-        client.create_schema()
+        created = client.create_schema()
+        print("Created: {0}".format(", ".join(created) if created else "nothing, schema is up to date"))
+
+        # Drop the DEPLOYED_BY mirrors written by older releases
+        collapsed = collapse_deployed_by(client.driver)
+        print("Removed {0} DEPLOYED_BY mirrors, created {1} missing DEPLOYS".format(
+            collapsed["removed"], collapsed["created"]))
+
+        # Drop the per-instance properties older releases wrote on Module nodes
+        stripped = strip_module_properties(client.driver)
+        print("Removed {0} per-instance properties from Module nodes".format(stripped))
+
+        # Create the full-text indexes used by the people and movie searches
+        ensure_fulltext_indexes(client.driver)
         
         print("Schema created successfully!")
         
@@ -25,15 +25,40 @@ function healthcheck() {
     curl -s http://localhost:${SERVICE_PORT}/health | json_pp
 }
 
+function new_key() {
+    # /proc/sys/kernel/random/uuid is Linux-only; uuidgen covers macOS and
+    # util-linux, Python everything else
+    if [ -r /proc/sys/kernel/random/uuid ]; then
+        cat /proc/sys/kernel/random/uuid
+    elif command -v uuidgen > /dev/null 2>&1; then
+        uuidgen
+    else
+        python3 -c 'import uuid; print(uuid.uuid4())'
+    fi
+}
+
+function retry_options() {
+    # --retry-all-errors needs curl 7.71 or newer; older versions only retry
+    # timeouts and transient HTTP errors
+    if curl --help all 2> /dev/null | grep -q -- '--retry-all-errors'; then
+        echo "--retry 3 --retry-all-errors"
+    else
+        echo "--retry 3"
+    fi
+}
+
 function ingest_data() {
     echo "Fetching module dependency data from graph_sync service..."
     # Get data from graph_sync
     GRAPH_DATA=$(curl -s http://localhost:8000/trigger)
     
-    # Send to neo4j_sync
+    # Send to neo4j_sync; retries reuse the key, so the service writes the
+    # payload at most once
+    IDEMPOTENCY_KEY=$(new_key)
     echo "Ingesting data to Neo4j..."
-    curl -s -X POST http://localhost:${SERVICE_PORT}/ingest \
+    curl -s $(retry_options) -X POST http://localhost:${SERVICE_PORT}/ingest \
         -H "Content-Type: application/json" \
+        -H "Idempotency-Key: ${IDEMPOTENCY_KEY}" \
         -d "{\"instances_data\": ${GRAPH_DATA}}" | json_pp
 }
 
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+import sys
+from config import NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD
+from api.dao.neo4j_client import Neo4jClient
+from api.dao.genres import GenreDAO
+from api.dao.ratings import RatingDAO
+
+def main():
+    """
+    Recompute the precomputed statistics stored on Genre nodes
+    (movie counts and representative posters) and Movie nodes
+    (rating count, sum, mean and histogram) from scratch.
+    """
+    print("Rebuilding statistics...")
+
+    try:
+        # Create Neo4j client
+        client = Neo4jClient(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
+
+        genres = GenreDAO(client.driver).rebuild()
+
+        print(f"Rebuilt statistics for {genres} genres")
+
+        movies = RatingDAO(client.driver).rebuild()
+
+        print(f"Rebuilt rating aggregates for {movies} movies")
+
+        # Close the client
+        client.close()
+
+        return 0
+    except Exception as e:
+        print(f"Error rebuilding statistics: {e}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
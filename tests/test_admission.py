@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from starlette.testclient import TestClient
+
+from api.middleware.admission import AdmissionController, AdmissionMiddleware, RateLimiter, Rejected, TokenBucket
+
+def test_token_bucket_refills():
+    bucket = TokenBucket(rate=2, burst=2, now=0)
+
+    assert bucket.take(0) == 0
+    assert bucket.take(0) == 0
+    assert bucket.take(0) == pytest.approx(0.5)
+    assert bucket.take(0.5) == 0
+
+def test_limits_are_per_client():
+    limiter = RateLimiter(rate=1, burst=1)
+
+    assert limiter.check("ci-1", now=0) == 0
+    assert limiter.check("ci-1", now=0) > 0
+    assert limiter.check("ci-2", now=0) == 0
+    assert limiter.stats()["rejected"] == 1
+
+def test_queue_is_served_by_priority():
+    async def scenario():
+        controller = AdmissionController(limit=1, queue_size=2, timeout=5)
+        order = []
+
+        await controller.acquire(1)
+
+        async def wait(priority, name):
+            await controller.acquire(priority)
+            order.append(name)
+
+        ingest = asyncio.ensure_future(wait(1, "ingest"))
+        analyse = asyncio.ensure_future(wait(0, "analyse"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(Rejected):
+            await controller.acquire(0)
+
+        controller.release(0.1)
+        await analyse
+        controller.release(0.1)
+        await ingest
+        controller.release(0.1)
+
+        return order, controller.stats()
+
+    order, stats = asyncio.run(scenario())
+
+    assert order == [ "analyse", "ingest" ]
+    assert stats["active"] == 0
+    assert stats["rejected"] == 1
+
+async def ok(scope, receive, send):
+    await send({ "type": "http.response.start", "status": 200, "headers": [] })
+    await send({ "type": "http.response.body", "body": b"ok" })
+
+def test_rate_limited_requests_get_retry_after():
+    app = AdmissionMiddleware(ok, RateLimiter(rate=0.1, burst=1), AdmissionController())
+    client = TestClient(app)
+
+    assert client.get("/analyse").status_code == 200
+    response = client.get("/analyse")
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "10"
+    assert client.get("/health").status_code == 200
+    assert client.get("/analyse", headers={ "X-Client-Id": "other" }).status_code == 200
+
+def test_small_requests_bypass_the_queue():
+    controller = AdmissionController(limit=1)
+    app = AdmissionMiddleware(ok, RateLimiter(rate=100, burst=100), controller, small_request=1024)
+
+    assert TestClient(app).post("/ingest", content=b"{}").status_code == 200
+    assert controller.stats()["bypassed"] == 1
+    assert controller.stats()["admitted"] == 0
+
+def test_reads_and_empty_bodies_are_always_admitted():
+    controller = AdmissionController(limit=1)
+    app = AdmissionMiddleware(ok, RateLimiter(rate=100, burst=100), controller, small_request=1024)
+    http = TestClient(app)
+
+    assert http.get("/analyse", headers={ "Content-Length": "0" }).status_code == 200
+    assert http.post("/ingest", content=b"").status_code == 200
+    assert controller.stats()["bypassed"] == 0
+    assert controller.stats()["admitted"] == 2
@@ -0,0 +1,112 @@
+import asyncio
+from contextlib import contextmanager
+
+from neo4j import Bookmarks
+from starlette.testclient import TestClient
+
+import app as sync_app
+from benchmarks.fake_driver import FakeDriver
+from api.dao.neo4j_client import Neo4jClient
+from api.analysis import find_cycles, strongly_connected_components
+
+def test_acyclic_graph():
+    result = find_cycles([ ("sale", "base", "odoo1"), ("stock", "base", "odoo1") ])
+
+    assert result["has_cycles"] is False
+    assert result["cycles"] == []
+    assert result["message"] == "No dependency cycles found."
+
+def test_one_cycle_per_component():
+    result = find_cycles([
+        ("a", "b", "odoo1"), ("b", "c", "odoo1"), ("c", "a", "odoo2"),
+        ("b", "a", "odoo1"),
+        ("x", "x", "odoo3"),
+        ("d", "a", "odoo4"),
+    ])
+
+    assert result["cycles"] == [ ["a", "b", "a"], ["x", "x"] ]
+    assert result["affected_instances"] == [ "odoo1", "odoo2", "odoo3" ]
+
+def test_long_chains_do_not_recurse():
+    chain = [ (i, i + 1) for i in range(50000) ] + [ (50000, 0) ]
+
+    assert len(max(strongly_connected_components(chain), key=len)) == 50001
+
+class FakeResult:
+    def consume(self):
+        pass
+
+    def data(self):
+        return []
+
+class FakeSession:
+    def run(self, cypher, params=None, **kwparams):
+        return FakeResult()
+
+    def execute_write(self, work):
+        return work(self)
+
+    def last_bookmarks(self):
+        return Bookmarks.from_raw_values(["FB:ingested"])
+
+class FakeClient:
+    def __init__(self):
+        self.seen = None
+
+    def create_schema(self):
+        pass
+
+    @contextmanager
+    def write_session(self):
+        yield FakeSession()
+
+    def find_cycles(self, bookmarks=None, instance=None):
+        self.seen = bookmarks
+        self.instance = instance
+        try:
+            asyncio.get_running_loop()
+            self.on_event_loop = True
+        except RuntimeError:
+            self.on_event_loop = False
+        return find_cycles([])
+
+def test_ingest_bookmark_is_accepted_by_analyse(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(sync_app, "neo4j_client", client)
+    http = TestClient(sync_app.app)
+
+    ingested = http.post("/ingest", json={ "instances_data": [
+        { "instance": "odoo1", "status": "success", "data": { "nodes": [ { "id": "base" } ], "edges": [] } }
+    ] })
+    bookmark = ingested.json()["bookmark"]
+
+    assert ingested.headers["X-Bookmark"] == bookmark
+    assert http.get("/analyse", params={ "bookmark": bookmark }).json()["has_cycles"] is False
+    assert client.seen.raw_values == frozenset(["FB:ingested"])
+
+    http.get("/analyse", headers={ "X-Bookmark": bookmark })
+    assert client.seen.raw_values == frozenset(["FB:ingested"])
+
+def test_analyse_can_be_limited_to_an_instance(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(sync_app, "neo4j_client", client)
+
+    TestClient(sync_app.app).get("/analyse", params={ "instance": "odoo2" })
+
+    assert client.instance == "odoo2"
+    assert client.on_event_loop is False
+
+def test_one_instance_is_read_through_the_relationship_index():
+    statements = []
+
+    def responder(cypher, params):
+        statements.append((cypher, params))
+        return [ { "source": "sale", "target": "base", "instance": "odoo2" } ]
+
+    client = Neo4jClient(driver=FakeDriver(responder))
+    client.find_cycles(instance="odoo2")
+    client.find_cycles()
+
+    assert "[r:DEPENDS_ON {instance: $instance}]" in statements[0][0]
+    assert statements[0][1] == { "instance": "odoo2" }
+    assert "$instance" not in statements[1][0]
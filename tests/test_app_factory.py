@@ -0,0 +1,39 @@
+import pytest
+
+from api import create_app
+from api import neo4j as driver_registry
+
+class FakeDriver:
+    def __init__(self, *args):
+        self.args = args
+
+def test_fixture_backend_needs_no_driver():
+    app = create_app({ "DAO_BACKEND": "fixtures" })
+    client = app.test_client()
+
+    assert app.driver is None
+    assert client.get("/api/movies/?limit=2").status_code == 200
+    assert client.get("/").status_code == 200
+
+def test_workers_get_their_own_driver_after_fork(monkeypatch):
+    monkeypatch.setattr(driver_registry, "_create_driver", FakeDriver)
+    monkeypatch.setattr(driver_registry, "_drivers", {})
+    monkeypatch.setattr(driver_registry, "_inherited", [])
+
+    app = create_app({ "DAO_BACKEND": "fixtures" })
+    inherited = FakeDriver("bolt://localhost", "neo4j", "neo")
+    driver_registry._drivers[inherited.args] = inherited
+    driver_registry._apps.add(app)
+    app.driver = inherited
+
+    # What os.register_at_fork runs in a forked worker
+    driver_registry._after_fork_in_child()
+
+    assert app.driver is not inherited
+    assert app.driver.args == inherited.args
+    assert driver_registry._drivers[inherited.args] is app.driver
+    assert inherited in driver_registry._inherited
+
+def test_unknown_dao_backend_fails_at_startup():
+    with pytest.raises(ValueError, match="DAO_BACKEND must be one of neo4j, fixtures, not 'fixture'"):
+        create_app({ "DAO_BACKEND": "fixture" })
@@ -0,0 +1,41 @@
+from benchmarks.fleet import fleet_edges, generate_fleet
+from benchmarks.suite import percentile, run
+from api.analysis import find_cycles
+
+def test_fleet_is_acyclic_unless_asked():
+    assert not find_cycles(fleet_edges(generate_fleet(3, 200, 0.02)))["has_cycles"]
+    assert find_cycles(fleet_edges(generate_fleet(3, 200, 0.02, coverage=1, cycles=2)))["has_cycles"]
+
+def test_instances_deploy_their_dependencies():
+    for instance in generate_fleet(4, 100, 0.05, coverage=0.3)["instances_data"]:
+        deployed = { node["id"] for node in instance["data"]["nodes"] }
+
+        assert all(edge["to"] in deployed for edge in instance["data"]["edges"])
+
+def test_percentile_interpolates():
+    assert percentile([ 1, 2, 3, 4 ], 0.5) == 2.5
+    assert percentile([ 5 ], 0.99) == 5
+
+def test_suite_runs_against_the_fake_backend():
+    report = run(instances=2, modules=50, repeat=2)
+
+    assert report["results"]["ingest"]["items_per_s"] > 0
+    assert report["results"]["analyse"]["runs"] == 2
+    assert all(s["runs"] == 2 for s in report["results"]["listings"].values())
+
+def test_mirror_report_counts_the_removed_relationships():
+    from benchmarks.mirrors import run as mirrors
+
+    report = mirrors(instances=2, modules=50, repeat=1)
+
+    assert report["store"]["after"]["relationships"]["DEPLOYED_BY"] == 0
+    assert report["migration"]["removed"] == report["store"]["before"]["relationships"]["DEPLOYS"]
+    assert report["store"]["saved_bytes"] > 0
+
+def test_ranking_report_times_each_measure():
+    from benchmarks.ranking import run as ranking
+
+    report = ranking(modules=500, limit=10, repeat=1)
+
+    assert report["meta"]["dependencies"] == 3 * 499
+    assert set(report["results"]) == { "pagerank", "transitive_dependents", "rank_modules" }
@@ -0,0 +1,78 @@
+import gzip
+import json
+
+from flask import Flask
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from api.middleware.compression import CompressionMiddleware, choose_encoding, init_compression
+from api.serialization import json_array, stream_json
+
+def make_app():
+    app = Flask(__name__)
+    init_compression(app, minimum_size=64)
+
+    @app.get("/small")
+    def small():
+        return app.response_class(b"[]", mimetype="application/json")
+
+    @app.get("/large")
+    def large():
+        return stream_json({ "tmdbId": str(i), "title": "Movie %d" % i } for i in range(500))
+
+    return app
+
+def test_choose_encoding_honours_quality_values():
+    assert choose_encoding("gzip") == "gzip"
+    assert choose_encoding("gzip;q=0, identity") is None
+    assert choose_encoding(None) is None
+    assert choose_encoding("*") is not None
+
+def test_json_array_is_chunked_and_valid():
+    chunks = list(json_array(({ "i": i } for i in range(1000)), chunk_bytes=256))
+
+    assert len(chunks) > 1
+    assert json.loads(b"".join(chunks)) == [ { "i": i } for i in range(1000) ]
+
+def test_small_responses_are_not_compressed():
+    response = make_app().test_client().get("/small", headers={ "Accept-Encoding": "gzip" })
+
+    assert "Content-Encoding" not in response.headers
+    assert response.data == b"[]"
+
+def test_streamed_responses_are_compressed():
+    response = make_app().test_client().get("/large", headers={ "Accept-Encoding": "gzip" })
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert len(json.loads(gzip.decompress(response.data))) == 500
+
+def make_asgi_app():
+    def small(request):
+        return Response(b"[]", media_type="application/json")
+
+    def large(request):
+        return Response(json.dumps([ { "i": i } for i in range(500) ]), media_type="application/json",
+            headers={ "Vary": "Origin" })
+
+    app = Starlette(routes=[ Route("/small", small), Route("/large", large) ])
+    app.add_middleware(CompressionMiddleware, minimum_size=64)
+
+    return TestClient(app)
+
+def test_every_negotiable_asgi_response_varies_on_accept_encoding():
+    http = make_asgi_app()
+
+    small = http.get("/small", headers={ "Accept-Encoding": "gzip" })
+    identity = http.get("/large", headers={ "Accept-Encoding": "identity" })
+    compressed = http.get("/large", headers={ "Accept-Encoding": "gzip" })
+
+    assert "content-encoding" not in small.headers
+    assert small.headers["Vary"] == "Accept-Encoding"
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["Vary"] == "Origin, Accept-Encoding"
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.headers["Vary"] == "Origin, Accept-Encoding"
+    assert len(compressed.json()) == 500
@@ -0,0 +1,120 @@
+import pytest
+
+from benchmarks.fake_driver import FakeDriver
+from api.exceptions.badrequest import BadRequestException
+from api.exceptions.notfound import NotFoundException
+from api.dao.favorites import FavoriteDAO
+from api.dao.movies import MovieDAO
+from api.dao.people import PeopleDAO
+from api.dao.ratings import RatingDAO
+from api.dao.fixtures import (FixtureFavoriteDAO, FixtureGenreDAO,
+    FixtureMovieDAO, FixturePeopleDAO, FixtureRatingDAO)
+
+goodfellas = '769'
+pacino = '1158'
+user_id = 'fixture-user'
+
+def test_movie_pagination_and_ordering():
+    dao = FixtureMovieDAO()
+
+    first = dao.all("imdbRating", "DESC", 1, 0)
+    second = dao.all("imdbRating", "DESC", 1, 1)
+    ascending = dao.all("imdbRating", "ASC", 1, 0)
+
+    assert first[0]["title"] == "Shawshank Redemption, The"
+    assert first != second
+    assert first != ascending
+
+def test_relevance_without_a_search_orders_by_title():
+    titles = [ movie["title"] for movie in FixtureMovieDAO().all("relevance", "DESC", 3, 0) ]
+
+    assert titles and titles == sorted(titles)
+
+def test_movies_are_indexed_by_genre_and_id():
+    dao = FixtureMovieDAO()
+
+    crime = dao.get_by_genre("Crime", "title", "ASC", 100)
+
+    assert all("Crime" in [ g["name"] for g in m["genres"] ] for m in crime)
+    assert dao.find_by_id(goodfellas)["title"] == "Goodfellas"
+
+    with pytest.raises(NotFoundException):
+        dao.find_by_id("9999")
+
+def test_people_and_roles():
+    dao = FixturePeopleDAO()
+
+    assert dao.find_by_id(pacino)["actedCount"] == 3
+    assert [ p["name"] for p in dao.all("al", "name", "ASC", 10) ][0] == "Al Pacino"
+    assert len(FixtureMovieDAO().get_for_actor(pacino, "title", "ASC", 10)) == 5
+
+def test_genres_sorted_by_name():
+    output = FixtureGenreDAO().all()
+
+    assert output[0]["name"] == "Action"
+    assert FixtureGenreDAO().find("Drama")["movies"] == 4365
+
+def test_favorites_flag_movies():
+    favorites = FixtureFavoriteDAO()
+
+    assert favorites.add(user_id, goodfellas)["favorite"] is True
+    assert FixtureMovieDAO().find_by_id(goodfellas, user_id)["favorite"] is True
+    assert favorites.remove(user_id, goodfellas)["favorite"] is False
+
+    with pytest.raises(NotFoundException):
+        favorites.remove(user_id, goodfellas)
+
+def test_ratings_are_stored_in_memory():
+    dao = FixtureRatingDAO()
+
+    assert dao.add(user_id, goodfellas, 5)["rating"] == 5
+    assert len(dao.for_movie(goodfellas, "timestamp", "DESC", 100)) == 6
+
+def test_cached_orderings_are_bounded(monkeypatch):
+    monkeypatch.setattr("api.dao.fixtures.ORDER_CACHE_SIZE", 2)
+    dao = FixtureMovieDAO()
+
+    for genre in ("Crime", "Drama", "Comedy"):
+        dao.get_by_genre(genre, "title", "ASC")
+
+    assert list(dao.store._orders) == [ (("genre", "Drama"), "title", "ASC"), (("genre", "Comedy"), "title", "ASC") ]
+
+def test_favorites_are_listed_in_order():
+    favorites = FixtureFavoriteDAO()
+    user = 'listing-user'
+    movies = FixtureMovieDAO().all("title", "ASC", 3, 0)
+
+    for movie in reversed(movies):
+        favorites.add(user, movie["tmdbId"])
+
+    assert [ m["title"] for m in favorites.all(user, "title", "ASC", 10) ] == [ m["title"] for m in movies ]
+    assert [ m["title"] for m in favorites.all(user, "title", "DESC", 1, 1) ] == [ movies[1]["title"] ]
+    assert favorites.all('nobody') == []
+
+LISTINGS = [
+    (MovieDAO, FixtureMovieDAO, lambda dao, sort, order: dao.all(sort, order)),
+    (MovieDAO, FixtureMovieDAO, lambda dao, sort, order: dao.get_by_genre("Drama", sort, order)),
+    (MovieDAO, FixtureMovieDAO, lambda dao, sort, order: dao.get_for_actor(pacino, sort, order)),
+    (PeopleDAO, FixturePeopleDAO, lambda dao, sort, order: dao.all(None, sort, order)),
+    (FavoriteDAO, FixtureFavoriteDAO, lambda dao, sort, order: dao.all(user_id, sort, order)),
+    (RatingDAO, FixtureRatingDAO, lambda dao, sort, order: dao.for_movie(goodfellas, sort, order)),
+]
+
+@pytest.mark.parametrize("neo4j_dao, fixture_dao, listing", LISTINGS)
+@pytest.mark.parametrize("sort, order", [ ("password", "ASC"), ("tmdbId", "DESC"), ("title", "sideways") ])
+def test_both_backends_reject_the_same_sorts(neo4j_dao, fixture_dao, listing, sort, order):
+    if sort == "title" and neo4j_dao is PeopleDAO:
+        sort = "name"
+    if sort == "title" and neo4j_dao is RatingDAO:
+        sort = "rating"
+
+    for dao in (neo4j_dao(FakeDriver()), fixture_dao()):
+        with pytest.raises(BadRequestException):
+            listing(dao, sort, order)
+
+def test_lower_case_directions_sort_descending():
+    dao = FixtureMovieDAO()
+
+    assert dao.all("imdbRating", "desc", 3, 0) == dao.all("imdbRating", "DESC", 3, 0)
+    assert dao.all("imdbRating", "desc", 3, 0) != dao.all("imdbRating", "asc", 3, 0)
+    assert FixtureRatingDAO().for_movie(goodfellas, "rating", "desc") == FixtureRatingDAO().for_movie(goodfellas, "rating", "DESC")
@@ -0,0 +1,197 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from neo4j import Bookmarks
+
+from benchmarks.fake_driver import FakeDriver
+from api.gc import PHASES, GarbageCollector
+from api.ingest import IngestPlan, IngestWriter
+
+class CountingSession:
+    """
+    Deletes `stale[phase]` relationships and the modules of `modules` (name
+    to deployed, stamped) as the collector's statements would, at most
+    `limit` per statement.  Stamps count as old enough once a run is over.
+    """
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, cypher, grace=None, limit=None):
+        modules = self.driver.modules
+        counts = { "nodes_deleted": 0, "relationships_deleted": 0, "properties_set": 0 }
+
+        if "REMOVE m.orphaned_since" in cypher:
+            phase = "adopted"
+            chosen = [ m for m, (deployed, stamp) in modules.items() if stamp is not None and deployed ][:limit]
+            for m in chosen:
+                modules[m] = (True, None)
+            counts["properties_set"] = len(chosen)
+        elif "DETACH DELETE" in cypher:
+            phase = "modules"
+            chosen = [ m for m, (deployed, stamp) in modules.items()
+                if stamp is not None and stamp < self.driver.runs and not deployed ][:limit]
+            for m in chosen:
+                del modules[m]
+            counts["nodes_deleted"] = len(chosen)
+        elif "SET m.orphaned_since" in cypher:
+            phase = "orphaned"
+            chosen = [ m for m, (deployed, stamp) in modules.items() if stamp is None and not deployed ][:limit]
+            for m in chosen:
+                modules[m] = (False, self.driver.runs)
+            counts["properties_set"] = len(chosen)
+        else:
+            phase = "deploys" if "DEPLOYS]->(:Module)" in cypher else "depends_on"
+            deleted = min(limit, self.driver.stale[phase])
+            self.driver.stale[phase] -= deleted
+            counts["relationships_deleted"] = deleted
+
+        self.driver.statements.append((phase, cypher))
+
+        counters = SimpleNamespace(**counts)
+        return SimpleNamespace(consume=lambda: SimpleNamespace(counters=counters))
+
+    def last_bookmarks(self):
+        return Bookmarks()
+
+class Driver:
+    def __init__(self, stale, modules=None):
+        self.stale = stale
+        self.modules = modules or {}
+        self.statements = []
+        self.runs = 0
+
+    @contextmanager
+    def session(self, **config):
+        yield CountingSession(self)
+
+def test_stale_entities_are_deleted_in_bounded_chunks():
+    driver = Driver({ "deploys": 25, "depends_on": 7 })
+    collector = GarbageCollector(lambda: driver, batch=5, chunk_batches=2)
+
+    progress = collector.collect()
+
+    assert progress["state"] == "idle"
+    assert progress["deleted"] == { "deploys": 25, "depends_on": 7, "modules": 0 }
+    assert [ phase for phase, _ in driver.statements ] == [ "deploys" ] * 3 + [ "depends_on", "adopted", "modules", "orphaned" ]
+    assert all("IN TRANSACTIONS OF 5 ROWS" in cypher for _, cypher in driver.statements)
+
+def test_modules_are_deleted_a_run_after_they_are_orphaned():
+    modules = { "gone{0}".format(i): (False, None) for i in range(3) }
+    modules["merging"] = (False, None)
+    driver = Driver({ "deploys": 0, "depends_on": 0 }, modules)
+    collector = GarbageCollector(lambda: driver, batch=5, chunk_batches=2)
+
+    first = collector.collect()
+
+    # Nothing is deleted on the run that finds the modules undeployed
+    assert first["deleted"]["modules"] == 0
+    assert first["orphaned"] == 4
+    assert len(driver.modules) == 4
+
+    # The ingest that MERGEd this module commits its DEPLOYS meanwhile
+    driver.runs += 1
+    driver.modules["merging"] = (True, driver.modules["merging"][1])
+    second = collector.collect()
+
+    assert second["adopted"] == 1
+    assert second["deleted"]["modules"] == 3
+    assert driver.modules == { "merging": (True, None) }
+
+def test_relationships_are_compared_with_the_synced_generation():
+    for phase in ("deploys", "depends_on"):
+        assert "< i.synced_generation" in PHASES[phase]
+
+def test_failures_are_reported():
+    def broken():
+        raise ConnectionError("Neo4j is down")
+
+    collector = GarbageCollector(broken)
+    progress = collector.collect()
+
+    assert progress["state"] == "failed"
+    assert progress["last_error"] == "Neo4j is down"
+    assert collector.collect()["runs"] == 2
+
+def test_ingest_stamps_the_instance_generation():
+    written = []
+
+    synced = []
+
+    def respond(cypher, params):
+        if "RETURN i.name" in cypher:
+            return [ { "name": name, "generation": 4 } for name in params["rows"] ]
+        if "synced_generation" in cypher:
+            synced.extend(params["rows"])
+            return []
+        written.extend(params["rows"])
+        return []
+
+    plan = IngestPlan([
+        { "instance": "odoo1", "status": "success", "data": { "nodes": [ { "id": "sale" }, { "id": "base" } ], "edges": [ { "from": "sale", "to": "base" } ] } },
+    ])
+    report = IngestWriter(FakeDriver(respond).session()).write(plan)
+
+    assert report["generations"] == { "odoo1": 4 }
+    assert len(written) == 3
+    assert all(row["generation"] == 4 for row in written)
+    assert synced == [ { "name": "odoo1", "generation": 4 } ]
+
+class Graph:
+    """
+    The generations of an instance and of its relationships, as ingest
+    statements leave them; `fail_on` makes the first statement containing
+    it raise.
+    """
+    def __init__(self):
+        self.generation = 0
+        self.synced = None
+        self.relationships = {}
+        self.fail_on = None
+
+    def respond(self, cypher, params):
+        if self.fail_on and self.fail_on in cypher:
+            self.fail_on = None
+            raise ConnectionError("Neo4j went away")
+        if "RETURN i.name" in cypher:
+            self.generation += 1
+            return [ { "name": name, "generation": self.generation } for name in params["rows"] ]
+        if "synced_generation" in cypher:
+            self.synced = max(self.synced or 0, *(row["generation"] for row in params["rows"]))
+            return []
+        for row in params["rows"]:
+            key = row["id"] if "id" in row else (row["from"], row["to"])
+            self.relationships[key] = row["generation"]
+        return []
+
+    def stale(self):
+        # What the deploys and depends_on phases select
+        return { key for key, generation in self.relationships.items()
+            if self.synced is not None and generation < self.synced }
+
+def test_an_ingest_failing_partway_leaves_nothing_to_collect():
+    graph = Graph()
+
+    def ingest(modules, edges):
+        plan = IngestPlan([ {
+            "instance": "odoo1",
+            "status": "success",
+            "data": { "nodes": [ { "id": m } for m in modules ], "edges": [ { "from": a, "to": b } for a, b in edges ] },
+        } ])
+        IngestWriter(FakeDriver(graph.respond).session()).write(plan)
+
+    ingest([ "sale", "base" ], [ ("sale", "base") ])
+
+    # The modules of the next ingest commit, its dependencies do not
+    graph.fail_on = "DEPENDS_ON"
+    try:
+        ingest([ "sale", "base" ], [ ("sale", "base") ])
+    except ConnectionError:
+        pass
+
+    assert (graph.generation, graph.synced) == (2, 1)
+    assert graph.stale() == set()
+
+    # A complete ingest without the dependency makes it stale
+    ingest([ "sale", "base" ], [])
+
+    assert graph.stale() == { ("sale", "base") }
@@ -0,0 +1,62 @@
+import pytest
+
+from benchmarks.fake_driver import FakeDriver
+from api.dao.genres import GenreDAO
+from api.exceptions.notfound import NotFoundException
+
+def genre(**properties):
+    return { "genre": dict({ "name": "Crime", "link": "/genres/Crime", "movies": 1, "poster": None }, **properties) }
+
+def recording(rows):
+    statements = []
+
+    def responder(cypher, params):
+        statements.append((cypher, params))
+        return rows
+
+    return statements, FakeDriver(responder)
+
+def test_adding_a_movie_counts_it_and_may_take_its_poster():
+    statements, driver = recording([ genre(movies=2, poster="goodfellas.jpg") ])
+
+    result = GenreDAO(driver).add_movie("769", "Crime")
+    cypher, params = statements[0]
+
+    assert result == genre(movies=2, poster="goodfellas.jpg")["genre"]
+    assert params == { "movieId": "769", "name": "Crime" }
+    assert "MERGE (m)-[r:IN_GENRE]->(g)" in cypher
+    # Only a new relationship changes the statistics, once
+    assert "ON CREATE SET" in cypher
+    assert "g.movieCount + 1" in cypher
+    assert "m.imdbRating > g.posterRating" in cypher
+
+def test_removing_a_movie_uncounts_it_and_replaces_a_lost_poster():
+    statements, driver = recording([ genre(movies=0) ])
+
+    assert GenreDAO(driver).remove_movie("769", "Crime")["movies"] == 0
+
+    cypher, params = statements[0]
+
+    assert params == { "movieId": "769", "name": "Crime" }
+    assert "DELETE r" in cypher
+    assert "g.movieCount - 1" in cypher
+    # Only genres whose poster came from the movie look for another
+    assert "WITH g WHERE lostPoster" in cypher
+    assert "ORDER BY best.imdbRating DESC LIMIT 1" in cypher
+
+@pytest.mark.parametrize("change", [ "add_movie", "remove_movie" ])
+def test_missing_movies_or_genres_are_not_found(change):
+    _, driver = recording([])
+
+    with pytest.raises(NotFoundException):
+        getattr(GenreDAO(driver), change)("769", "Crime")
+
+def test_rebuild_recounts_one_genre_per_transaction():
+    statements, driver = recording([ { "genres": 19 } ])
+
+    assert GenreDAO(driver).rebuild() == 19
+
+    cypher, _ = statements[0]
+
+    assert "SET g.movieCount = count { (g)<-[:IN_GENRE]-(:Movie) }" in cypher
+    assert "IN TRANSACTIONS OF 1 ROWS" in cypher
@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+from neo4j.exceptions import ClientError
+
+from api.ingest import GroupCommitter
+from api.metrics import Window
+
+def instance(name, modules=2):
+    return {
+        "instance": name,
+        "status": "success",
+        "data": { "nodes": [ { "id": "m{0}".format(i) } for i in range(modules) ], "edges": [] },
+    }
+
+def test_window_reports_percentiles():
+    window = Window(size=100)
+    for value in range(1, 201):
+        window.record(value / 1000)
+
+    summary = window.summary(scale=1000)
+
+    assert summary == { "count": 200, "p50": 151.0, "p99": 200.0 }
+    assert Window().summary() == { "count": 0, "p50": None, "p99": None }
+
+def test_concurrent_requests_share_a_commit():
+    commits = []
+    ready = threading.Barrier(4)
+
+    def commit(instances_data):
+        commits.append([ i["instance"] for i in instances_data ])
+        return { "rows": len(instances_data) }, "bookmark"
+
+    committer = GroupCommitter(commit, window_ms=200)
+    results = {}
+
+    def submit(name):
+        ready.wait()
+        results[name] = committer.submit([ instance(name) ])
+
+    threads = [ threading.Thread(target=submit, args=("odoo{0}".format(n),)) for n in range(4) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(commits) == 1
+    assert sorted(commits[0]) == [ "odoo0", "odoo1", "odoo2", "odoo3" ]
+    assert all(result == ({ "rows": 4, "group": { "requests": 4, "rows": 8 } }, "bookmark") for result in results.values())
+    assert committer.stats()["requests_per_commit"]["p50"] == 4
+
+def test_max_rows_cuts_the_window_short():
+    committer = GroupCommitter(lambda data: ({}, None), window_ms=60000, max_rows=10)
+
+    report, _ = committer.submit([ instance("odoo1", modules=10) ])
+
+    assert report["group"] == { "requests": 1, "rows": 10 }
+
+def test_failures_reach_every_caller():
+    def commit(instances_data):
+        raise RuntimeError("deadlock")
+
+    committer = GroupCommitter(commit, window_ms=1)
+
+    with pytest.raises(RuntimeError):
+        committer.submit([ instance("odoo1") ])
+
+    # The committer survives the failure
+    committer.commit = lambda data: ({}, None)
+    assert committer.submit([ instance("odoo1") ])[0]["group"]["requests"] == 1
+
+def test_zero_window_commits_in_the_caller():
+    callers = []
+
+    def commit(instances_data):
+        callers.append(threading.current_thread())
+        return {}, None
+
+    GroupCommitter(commit, window_ms=0).submit([ instance("odoo1") ])
+
+    assert callers == [ threading.current_thread() ]
+
+def test_rejected_group_is_split_so_only_the_offender_fails():
+    commits = []
+    ready = threading.Barrier(3)
+
+    def commit(instances_data):
+        names = [ i["instance"] for i in instances_data ]
+        commits.append(names)
+        if "bad" in names:
+            raise ClientError("Node already exists with label `Module`")
+        return {}, None
+
+    committer = GroupCommitter(commit, window_ms=200)
+    results = {}
+
+    def submit(name):
+        ready.wait()
+        try:
+            results[name] = committer.submit([ instance(name) ])[0]["group"]["requests"]
+        except ClientError as e:
+            results[name] = e
+
+    threads = [ threading.Thread(target=submit, args=(name,)) for name in ("odoo1", "bad", "odoo2") ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(commits[0]) == [ "bad", "odoo1", "odoo2" ]
+    assert sorted(map(tuple, commits[1:])) == [ ("bad",), ("odoo1",), ("odoo2",) ]
+    assert results["odoo1"] == results["odoo2"] == 1
+    assert isinstance(results["bad"], ClientError)
+    assert committer.stats()["splits"] == 1
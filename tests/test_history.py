@@ -0,0 +1,120 @@
+import os
+import stat
+
+from api import history as history_module
+from api.history import History, apply, diff, empty_state
+from api.ingest import IngestPlan
+
+def ingest(name, modules, edges):
+    return IngestPlan([ {
+        "instance": name,
+        "status": "success",
+        "data": {
+            "nodes": [ dict(properties, id=module) for module, properties in modules.items() ],
+            "edges": [ { "from": source, "to": target } for source, target in edges ],
+        },
+    } ])
+
+def test_a_delta_only_holds_what_changed():
+    before = empty_state()
+    apply({ "odoo1": before }, diff("odoo1", empty_state(), { "base": {}, "sale": { "version": "1" } }, { ("sale", "base") }, 1, 0))
+
+    delta = diff("odoo1", before, { "base": {}, "sale": { "version": "2" }, "stock": {} }, { ("stock", "base") }, 2, 1)
+
+    assert delta["added_modules"] == { "stock": {} }
+    assert delta["removed_modules"] == []
+    assert delta["changed_modules"] == { "sale": { "set": { "version": "2" }, "unset": [] } }
+    assert delta["added_edges"] == [ ("stock", "base") ]
+    assert delta["removed_edges"] == [ ("sale", "base") ]
+
+def test_past_graphs_are_reconstructed(tmp_path, monkeypatch):
+    history = History(str(tmp_path), checkpoint_ratio=0.5)
+
+    for now, (generation, edges) in zip((100, 101, 102), enumerate([
+        [ ("a", "b") ], [ ("a", "b"), ("b", "a") ], [ ("b", "a") ],
+    ], 1)):
+        monkeypatch.setattr("api.history.time.time", lambda: now)
+        history.record(ingest("odoo1", { "a": {}, "b": {} }, edges), { "odoo1": generation })
+
+    assert history.edges_at(100) == [ ("a", "b", "odoo1") ]
+    assert history.edges_at(101) == [ ("a", "b", "odoo1"), ("b", "a", "odoo1") ]
+    assert history.edges_at(1000) == [ ("b", "a", "odoo1") ]
+    assert history.edges_at(50) == []
+    history.close()
+
+    # The same answers after a restart, from the log and checkpoints on disk
+    reopened = History(str(tmp_path))
+    assert reopened.edges_at(101) == [ ("a", "b", "odoo1"), ("b", "a", "odoo1") ]
+    assert reopened.state["odoo1"]["generation"] == 3
+    assert reopened.delta(2)["added_edges"] == [ [ "b", "a" ] ]
+    assert [ d["seq"] for d in reopened.list(limit=2) ] == [ 3, 2 ]
+    reopened.close()
+
+def test_checkpoints_follow_the_volume_of_change(tmp_path):
+    history = History(str(tmp_path), checkpoint_ratio=0.5)
+    modules = { "m{0}".format(i): {} for i in range(100) }
+
+    history.record(ingest("odoo1", modules, []), { "odoo1": 1 })
+    for generation in range(2, 12):
+        history.record(ingest("odoo1", modules, []), { "odoo1": generation })
+
+    # Unchanged ingests add empty deltas and no checkpoints
+    assert history.stats()["checkpoints"] == 1
+    assert history.list(limit=1)[0]["changes"] == 0
+
+    for generation in range(12, 20):
+        changed = dict(modules, **{ "m{0}".format(i): { "version": str(generation) } for i in range(10) })
+        history.record(ingest("odoo1", changed, []), { "odoo1": generation })
+
+    # 80 changes over a graph of 100 modules: one more checkpoint after 50
+    assert history.stats()["checkpoints"] == 2
+    assert len([ name for name in os.listdir(str(tmp_path)) if name.startswith("checkpoint-") ]) == 2
+    history.close()
+
+def test_restart_recovers_from_the_latest_checkpoint(tmp_path, monkeypatch):
+    history = History(str(tmp_path), checkpoint_ratio=0.5)
+    modules = { "m{0}".format(i): {} for i in range(10) }
+
+    history.record(ingest("odoo1", modules, []), { "odoo1": 1 })
+    history.record(ingest("odoo1", modules, [ ("m1", "m0") ]), { "odoo1": 2 })
+    history.record(ingest("odoo1", modules, [ ("m1", "m0"), ("m2", "m0") ]), { "odoo1": 3 })
+    history.close()
+
+    assert history.stats()["checkpoints"] == 1
+    decoded = []
+    decode = history_module._decode
+    monkeypatch.setattr(history_module, "_decode", lambda data: decoded.append(data) or decode(data))
+
+    reopened = History(str(tmp_path))
+
+    # Only the two deltas after the checkpoint were decompressed
+    assert len(decoded) == 2
+    assert reopened.state["odoo1"]["edges"] == { ("m1", "m0"), ("m2", "m0") }
+    assert reopened.state["odoo1"]["generation"] == 3
+    assert [ entry["changes"] for entry in reopened.list() ] == [ 1, 1, 10 ]
+    reopened.close()
+
+def test_checkpoints_are_durable_before_they_are_renamed(tmp_path, monkeypatch):
+    events = []
+    fsync, replace = os.fsync, os.replace
+
+    def recording_fsync(fd):
+        events.append(("fsync", stat.S_ISDIR(os.fstat(fd).st_mode)))
+        fsync(fd)
+
+    def recording_replace(source, target):
+        events.append(("replace", os.path.basename(target)))
+        replace(source, target)
+
+    monkeypatch.setattr(os, "fsync", recording_fsync)
+    monkeypatch.setattr(os, "replace", recording_replace)
+
+    history = History(str(tmp_path))
+    history.record(ingest("odoo1", { "a": {} }, []), { "odoo1": 1 })
+    history.close()
+
+    renamed = next(i for i, event in enumerate(events) if event[0] == "replace")
+
+    # The file, then the rename, then the directory holding it
+    assert events[renamed - 1] == ("fsync", False)
+    assert events[renamed + 1] == ("fsync", True)
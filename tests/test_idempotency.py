@@ -0,0 +1,128 @@
+import threading
+
+import pytest
+
+from api.idempotency import IdempotencyKeyReused, IdempotencyStore, payload_digest
+from api.ingest import IngestPlan
+
+def test_digest_ignores_key_order():
+    assert payload_digest([ { "a": 1, "b": 2 } ]) == payload_digest([ { "b": 2, "a": 1 } ])
+    assert payload_digest([ { "a": 1 } ]) != payload_digest([ { "a": 2 } ])
+
+def test_repeats_are_answered_from_the_store():
+    store = IdempotencyStore(path="")
+    calls = []
+
+    def work():
+        calls.append(1)
+        return 200, { "status": "success" }
+
+    assert store.run("key", work) == ((200, { "status": "success" }), False)
+    assert store.run("key", work) == ((200, { "status": "success" }), True)
+    assert len(calls) == 1
+    assert store.stats()["hits"] == 1
+
+def test_keys_reused_with_another_payload_are_refused(tmp_path):
+    path = str(tmp_path / "keys.jsonl")
+    store = IdempotencyStore(path=path)
+    first, second = payload_digest([ { "a": 1 } ]), payload_digest([ { "a": 2 } ])
+
+    store.run("key", lambda: (200, { "status": "success" }), digest=first)
+
+    with pytest.raises(IdempotencyKeyReused):
+        store.run("key", lambda: (200, {}), digest=second)
+
+    # The digest is kept across restarts
+    with pytest.raises(IdempotencyKeyReused):
+        IdempotencyStore(path=path).run("key", lambda: (200, {}), digest=second)
+
+    assert store.run("key", lambda: (200, {}), digest=first) == ((200, { "status": "success" }), True)
+    assert store.stats()["conflicts"] == 1
+
+def test_digests_are_dropped_once_their_instances_are_ingested_again(tmp_path):
+    path = str(tmp_path / "keys.jsonl")
+    store = IdempotencyStore(path=path)
+    first = [ { "instance": "odoo1", "modules": [ "sale" ] } ]
+    second = [ { "instance": "odoo1", "modules": [] } ]
+    written = []
+
+    def ingest(payload, key=None):
+        digest = payload_digest(payload)
+        return store.run(key or digest, lambda: written.append(payload) or (200, {}), digest=digest,
+            instances=[ "odoo1" ])[1]
+
+    # A retry of the same payload is answered from the store
+    assert (ingest(first), ingest(first)) == (False, True)
+
+    # The module is uninstalled, then installed again
+    assert ingest(second) is False
+    assert ingest(first) is False
+    assert written == [ first, second, first ]
+
+    # Keys sent by the client stay, and drop digests as well, also once reloaded
+    assert ingest(second, key="retry-1") is False
+    store = IdempotencyStore(path=path)
+    assert ingest(second, key="retry-1") is True
+    assert ingest(first) is False
+
+def test_concurrent_duplicates_run_once():
+    store = IdempotencyStore(path="")
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def work():
+        calls.append(1)
+        release.wait()
+        return 200, {}
+
+    threads = [ threading.Thread(target=lambda: results.append(store.run("key", work))) for _ in range(4) ]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(replayed for _, replayed in results) == [ False, True, True, True ]
+
+def test_failures_are_not_stored():
+    store = IdempotencyStore(path="")
+
+    def fail():
+        raise RuntimeError("Neo4j is down")
+
+    with pytest.raises(RuntimeError):
+        store.run("key", fail)
+
+    assert store.run("key", lambda: (200, {}))[1] is False
+
+def test_keys_persist_and_expire(tmp_path):
+    path = str(tmp_path / "keys.jsonl")
+    store = IdempotencyStore(path=path, size=2)
+    for key in ("a", "b", "c", "d", "e"):
+        store.run(key, lambda: (200, { "key": key }))
+
+    reloaded = IdempotencyStore(path=path, size=2)
+
+    assert reloaded.get("e") == [ 200, { "key": "e" } ]
+    assert reloaded.get("a") is None
+    assert IdempotencyStore(path=path, size=2, ttl=0).get("e") is None
+
+def test_duplicate_rows_within_a_payload_are_collapsed():
+    plan = IngestPlan([
+        {
+            "instance": "odoo1",
+            "status": "success",
+            "data": {
+                "nodes": [ { "id": "sale", "version": "1" }, { "id": "sale", "version": "2" } ],
+                "edges": [ { "from": "sale", "to": "base" }, { "from": "sale", "to": "base" } ],
+            },
+        },
+        { "instance": "odoo1", "status": "success", "data": { "nodes": [ { "id": "sale", "version": "2" } ], "edges": [] } },
+    ])
+
+    assert plan.duplicates == 3
+    assert plan.instances == [ "odoo1" ]
+    assert [ row["properties"]["version"] for row in plan.nodes ] == [ "2" ]
+    assert len(plan.edges) == 1
@@ -0,0 +1,68 @@
+from benchmarks.fake_driver import FakeDriver
+from api.ingest import MERGE_DEPENDENCIES, MERGE_MODULES, IngestPlan, IngestWriter
+
+def payload(instances=3, modules=10):
+    return [
+        {
+            "instance": "odoo{0}".format(n),
+            "status": "success",
+            "data": {
+                "nodes": [ { "id": "base" } ] + [ { "id": "m{0}".format(i) } for i in range(modules) ],
+                "edges": [ { "from": "m{0}".format(i), "to": "base" } for i in range(modules) ]
+                    + [ { "from": "m{0}".format(i), "to": "m{0}".format(i - 1) } for i in range(1, modules) ],
+            },
+        }
+        for n in range(instances)
+    ] + [ { "instance": "broken", "status": "error", "data": None } ]
+
+def test_hubs_are_detected_by_degree():
+    plan = IngestPlan(payload(), hub_degree=10)
+
+    assert plan.hubs == [ "base" ]
+    assert plan.skipped == [ "broken" ]
+    assert all(row["to"] != "base" for row in plan.edges)
+    assert len(plan.hub_edges["base"]) == 30
+    assert len(plan.hub_nodes["base"]) == 3
+
+def test_rows_are_written_in_a_consistent_order():
+    plan = IngestPlan(payload(), hub_degree=10)
+    keys = [ (row["from"], row["to"], row["instance"]) for row in plan.edges ]
+
+    assert keys == sorted(keys)
+
+def test_hub_writes_come_last_in_dedicated_batches():
+    writes = []
+
+    def respond(cypher, params):
+        writes.append((cypher, [ row.get("to", row.get("id")) for row in params["rows"] if isinstance(row, dict) ]))
+        return []
+
+    session = FakeDriver(respond).session()
+    report = IngestWriter(session, batch_size=8).write(IngestPlan(payload(), hub_degree=10))
+
+    hub_edge_batches = [ targets for cypher, targets in writes if cypher == MERGE_DEPENDENCIES and "base" in targets ]
+    module_batches = [ i for i, (cypher, _) in enumerate(writes) if cypher == MERGE_MODULES ]
+
+    assert all(set(targets) == { "base" } for targets in hub_edge_batches)
+    assert sum(len(targets) for targets in hub_edge_batches) == 30
+    assert writes[-1][1] == [ "base" ] * 6
+    assert max(module_batches) < min(i for i, (cypher, _) in enumerate(writes) if cypher == MERGE_DEPENDENCIES)
+    assert report["hubs"] == [ "base" ]
+    assert report["batches"] == len(writes)
+    assert report["contention"]["retries"] == 0
+
+def test_deployment_properties_stay_with_the_instance():
+    plan = IngestPlan([
+        {
+            "instance": name,
+            "status": "success",
+            "data": { "nodes": [ { "id": "sale", "name": "Sales", "category": "Sales", "version": version } ], "edges": [] },
+        }
+        for name, version in (("odoo1", "16.0.1.0"), ("odoo2", "17.0.1.2"))
+    ])
+
+    assert [ (row["instance"], row["properties"]["version"]) for row in plan.nodes ] == [
+        ("odoo1", "16.0.1.0"), ("odoo2", "17.0.1.2"),
+    ]
+    assert all(row["shared"] == { "name": "Sales" } for row in plan.nodes)
+    assert all(row["properties"].keys() == { "version", "category" } for row in plan.nodes)
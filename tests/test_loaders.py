@@ -0,0 +1,50 @@
+from api.dao.loaders import UserMovieFlagLoader
+
+user_id = '9f965bf6-7e32-4afb-893f-756f502b2c2a'
+
+class RecordingTransaction:
+    """Answers the loader's query from a fixed set of rows and counts calls"""
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def run(self, cypher, **params):
+        self.calls.append(params)
+        return [ row for row in self.rows if row["id"] in params["ids"] ]
+
+
+def test_page_is_resolved_in_one_query():
+    tx = RecordingTransaction([
+        { "id": "862", "favorite": True, "rating": 5 },
+        { "id": "769", "favorite": False, "rating": None },
+    ])
+
+    movies = [ { "tmdbId": "862" }, { "tmdbId": "769" }, { "tmdbId": "680" }, { "tmdbId": "862" } ]
+
+    UserMovieFlagLoader(user_id).merge(tx, movies)
+
+    assert len(tx.calls) == 1
+    assert tx.calls[0]["ids"] == ["862", "769", "680"]
+
+    assert movies[0] == { "tmdbId": "862", "favorite": True, "userRating": 5 }
+    assert movies[2] == { "tmdbId": "680", "favorite": False, "userRating": None }
+
+
+def test_cached_ids_are_not_requested_again():
+    tx = RecordingTransaction([ { "id": "862", "favorite": True, "rating": None } ])
+    loader = UserMovieFlagLoader(user_id)
+
+    loader.load_many(tx, ["862"])
+    flags = loader.load_many(tx, ["862"])
+
+    assert len(tx.calls) == 1
+    assert flags == { "862": (True, None) }
+
+
+def test_anonymous_user_skips_the_query():
+    tx = RecordingTransaction([])
+
+    [ movie ] = UserMovieFlagLoader(None).merge(tx, [ { "tmdbId": "862" } ])
+
+    assert tx.calls == []
+    assert movie["favorite"] is False
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+
+import bcrypt
+import pytest
+
+from benchmarks.fake_driver import FakeDriver
+from api.dao import auth
+from api.dao.auth import AuthDAO
+from api.passwords import PasswordHasher, cost_of
+
+password = "letmein"
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(rounds=4, workers=1, queue=1)
+
+    yield hasher
+
+    hasher.shutdown()
+
+def test_hash_uses_configured_cost(hasher):
+    hashed = hasher.hash(password)
+
+    assert cost_of(hashed) == 4
+    assert hasher.verify(password, hashed)
+    assert not hasher.verify("wrong", hashed)
+
+def test_needs_rehash_when_cost_changes(hasher):
+    hashed = hasher.hash(password)
+
+    assert not hasher.needs_rehash(hashed)
+
+    hasher.rounds = 5
+
+    assert hasher.needs_rehash(hashed)
+    assert cost_of(hasher.hash(password)) == 5
+
+def test_register_returns_the_created_user():
+    created = {}
+
+    def responder(cypher, params):
+        if "CREATE (u:User" in cypher:
+            created.update(params)
+            return [ { "u": { "userId": "1f0c", "email": params["email"], "name": params["name"] } } ]
+        return []
+
+    user = AuthDAO(FakeDriver(responder)).register("new@neo4j.com", password, "New User")
+
+    assert user == { "userId": "1f0c", "email": "new@neo4j.com", "name": "New User", "role": "admin" }
+    assert created["encrypted"] != password
+
+def test_current_hashes_are_read_once_and_never_written(monkeypatch):
+    monkeypatch.setattr(auth, "_current", OrderedDict())
+    stored = auth.hasher.hash(password)
+    statements = []
+
+    def responder(cypher, params):
+        statements.append(cypher)
+        return [ { "password": stored } ] if "RETURN u.password" in cypher else []
+
+    dao = AuthDAO(FakeDriver(responder))
+    dao.authenticate("current@neo4j.com", password)
+    dao.authenticate("current@neo4j.com", password)
+
+    assert len(statements) == 1
+    assert "SET u.password" not in statements[0]
+
+def test_outdated_hashes_are_upgraded_on_login(monkeypatch):
+    monkeypatch.setattr(auth, "_current", OrderedDict())
+    stored = bcrypt.hashpw(password.encode("utf8"), bcrypt.gensalt(4)).decode("utf8")
+    written = []
+
+    def responder(cypher, params):
+        if "SET u.password" in cypher:
+            written.append(params["encrypted"])
+        return [ { "password": stored } ] if "RETURN u.password" in cypher else []
+
+    AuthDAO(FakeDriver(responder)).authenticate("outdated@neo4j.com", password)
+
+    assert len(written) == 1
+    assert cost_of(written[0]) == auth.hasher.rounds
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+import api.dao.movies  # registers the movie listings
+from api.dao.queries import MOVIE_SORTS, QueryRegistry, registry
+from api.exceptions.badrequest import BadRequestException
+
+def test_one_statement_per_allowed_pair():
+    statements = { registry.get("movies.byGenre", sort, order) for sort in MOVIE_SORTS for order in ("ASC", "DESC") }
+
+    assert len(statements) == len(MOVIE_SORTS) * 2
+    assert registry.get("movies.byGenre", "title", "desc") is registry.get("movies.byGenre", "title", "DESC")
+
+@pytest.mark.parametrize("sort, order", [
+    ("title` DESC //", "ASC"),
+    ("title", "ASC, m.password"),
+    ("password", "ASC"),
+])
+def test_inputs_outside_the_whitelist_are_rejected(sort, order):
+    with pytest.raises(BadRequestException):
+        registry.get("movies.all", sort, order)
+
+def test_relevance_ties_are_broken_by_title():
+    # Without searchable terms every score is 0.0
+    assert "ORDER BY score DESC, m.title ASC" in registry.get("movies.all", "relevance", "DESC")
+    assert "ORDER BY score DESC, m.title ASC" in registry.get("movies.search", "relevance", "ASC")
+
+def test_hit_rates():
+    queries = QueryRegistry()
+    queries.register("things", "ORDER BY t.`{0}` {1}".format, ("name",))
+
+    for _ in range(3):
+        queries.get("things", "name", "ASC")
+    queries.get("things", "name", "DESC")
+
+    stats = { (s["sort"], s["order"]): s for s in queries.stats() }
+
+    assert stats[("name", "ASC")]["hits"] == 3
+    assert stats[("name", "ASC")]["hitRate"] == 0.75
+    assert stats[("name", "DESC")]["hitRate"] == 0.25
+
+def test_hit_counts_never_go_backwards():
+    queries = QueryRegistry()
+    queries.register("things", "ORDER BY t.`{0}` {1}".format, ("name",))
+    seen = []
+
+    def hit():
+        for _ in range(1000):
+            queries.get("things", "name", "ASC")
+            seen.append(queries._queries[("things", "name", "ASC")].hits)
+
+    threads = [ threading.Thread(target=hit) for _ in range(4) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert queries._queries[("things", "name", "ASC")].hits == 4000
+    assert max(seen) == 4000
+
+def test_stats_agree_with_themselves_under_load():
+    queries = QueryRegistry()
+    queries.register("things", "ORDER BY t.`{0}` {1}".format, ("name",))
+    running = threading.Event()
+    running.set()
+
+    def hit():
+        while running.is_set():
+            queries.get("things", "name", "ASC")
+            queries.get("things", "name", "DESC")
+
+    thread = threading.Thread(target=hit)
+    thread.start()
+
+    try:
+        for _ in range(200):
+            rates = [ s["hitRate"] for s in queries.stats() ]
+            assert sum(rates) == 0.0 or abs(sum(rates) - 1) < 1e-9
+    finally:
+        running.clear()
+        thread.join()
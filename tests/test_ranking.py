@@ -0,0 +1,129 @@
+import numpy as np
+from starlette.testclient import TestClient
+
+import app as sync_app
+from benchmarks.fake_driver import FakeDriver
+from benchmarks.ranking import catalogue
+from api.dao.neo4j_client import Neo4jClient
+from api.ranking import Ranking, RankingCache, Reachability, rank_modules
+
+def by_id(ranking):
+    return { module["id"]: module for module in ranking["modules"] }
+
+def test_most_depended_upon_ranks_first():
+    ranking = rank_modules([
+        ("sale", "base"), ("stock", "base"), ("account", "base"),
+        ("sale", "account"), ("sale_stock", "sale"), ("sale_stock", "stock"),
+        # The same dependency declared by another instance counts once
+        ("sale", "base"),
+    ])
+    modules = by_id(ranking)
+
+    assert [ module["id"] for module in ranking["modules"][:2] ] == [ "base", "account" ]
+    assert abs(sum(module["pagerank"] for module in ranking["modules"]) - 1) < 1e-9
+    assert ranking["converged"] is True
+    assert ranking["dependencies"] == 6
+    assert modules["base"]["in_degree"] == 3
+    assert modules["base"]["transitive_dependents"] == 4
+    assert modules["sale"]["transitive_dependents"] == 1
+    assert modules["sale_stock"]["transitive_dependents"] == 0
+
+def test_modules_in_a_cycle_depend_on_each_other():
+    modules = by_id(rank_modules([ ("a", "b"), ("b", "c"), ("c", "a"), ("d", "a"), ("c", "base") ]))
+
+    assert modules["a"]["transitive_dependents"] == 3
+    assert modules["base"]["transitive_dependents"] == 4
+    assert modules["d"]["transitive_dependents"] == 0
+
+def test_empty_graph():
+    assert rank_modules([])["modules"] == []
+
+def test_transitive_dependents_match_a_search():
+    rng = np.random.default_rng(7)
+    edges = { (int(i), int(rng.integers(i))) for i in range(1, 300) for _ in range(2) }
+    edges |= { (5, 250), (40, 41) }
+    dependents = {}
+
+    for source, target in edges:
+        dependents.setdefault(target, set()).add(source)
+
+    def search(module):
+        seen = set()
+        pending = [ module ]
+        while pending:
+            for dependent in dependents.get(pending.pop(), ()):
+                if dependent not in seen:
+                    seen.add(dependent)
+                    pending.append(dependent)
+        seen.discard(module)
+        return len(seen)
+
+    ranking = Ranking(edges)
+
+    for module in ranking.top()["modules"]:
+        assert module["transitive_dependents"] == search(module["id"])
+
+    # Counted 64 modules at a time
+    nodes = np.arange(len(ranking.ids))
+    counts = Reachability(ranking.matrix).counts(nodes, words=1)
+
+    assert counts.tolist() == [ search(ranking.ids[i]) for i in nodes ]
+
+def test_large_graph():
+    # Modules leaning on a core, like an Odoo catalogue; timings are in benchmarks.ranking
+    ranking = rank_modules(catalogue(20000), limit=100)
+
+    assert ranking["total"] == 20000
+    assert len(ranking["modules"]) == 100
+    assert ranking["modules"][0]["id"] == 0
+    assert ranking["modules"][0]["transitive_dependents"] == 19999
+
+def test_rankings_are_cached_per_generation(monkeypatch):
+    generations = { "odoo1": 3 }
+    edge_reads = []
+
+    def responder(cypher, params):
+        if "RETURN i.name AS name, i.synced_generation" in cypher:
+            return [ { "name": name, "generation": g } for name, g in generations.items() ]
+        if "count(r)" in cypher:
+            return [ { "count": 2 } ]
+        edge_reads.append(params)
+        return [
+            { "source": "sale", "target": "base", "instance": "odoo1" },
+            { "source": "stock", "target": "base", "instance": "odoo1" },
+        ]
+
+    monkeypatch.setattr(sync_app, "neo4j_client", Neo4jClient(driver=FakeDriver(responder)))
+    monkeypatch.setattr(sync_app, "rankings", RankingCache(size=4))
+    http = TestClient(sync_app.app)
+
+    first = http.get("/modules/ranking", params={ "instance": "odoo1", "limit": 1 }).json()
+    second = http.get("/modules/ranking", params={ "instance": "odoo1" }).json()
+    generations["odoo1"] = 4
+    third = http.get("/modules/ranking", params={ "instance": "odoo1" }).json()
+
+    assert first["modules"] == [ { "id": "base", "pagerank": first["modules"][0]["pagerank"], "in_degree": 2, "transitive_dependents": 2 } ]
+    assert (first["cached"], second["cached"], third["cached"]) == (False, True, False)
+    assert len(second["modules"]) == 3
+    assert second["generations"] == { "odoo1": 3 }
+    assert edge_reads == [ { "instance": "odoo1" } ] * 2
+    assert sync_app.rankings.stats() == { "keys": 2, "hits": 1, "misses": 2 }
+
+def test_version_reads_never_filter_with_a_null_check(monkeypatch):
+    statements = []
+
+    def responder(cypher, params):
+        statements.append(cypher)
+        if "count(r)" in cypher:
+            return [ { "count": 0 } ]
+        return []
+
+    client = Neo4jClient(driver=FakeDriver(responder))
+    client.rank_modules(cache=RankingCache(size=1))
+    client.rank_modules(instance="odoo1", cache=RankingCache(size=1))
+
+    counts = [ cypher for cypher in statements if "count(r)" in cypher ]
+
+    assert not any("IS NULL" in cypher for cypher in statements)
+    assert "MATCH ()-[r:DEPENDS_ON]->()" in counts[0]
+    assert "[r:DEPENDS_ON {instance: $instance}]" in counts[1]
@@ -0,0 +1,89 @@
+import math
+import re
+
+import pytest
+
+from benchmarks.fake_driver import FakeDriver
+from api.dao.ratings import HISTOGRAM_BUCKETS, RatingDAO, _bucket
+from api.exceptions.notfound import NotFoundException
+
+def bucket(rating):
+    # Evaluate the Cypher CASE _bucket renders for a literal rating
+    case = re.fullmatch(r"CASE WHEN (.+?) THEN (\d+) WHEN (.+?) THEN (\d+)\s+ELSE (.+) END",
+        _bucket(repr(rating)), re.S)
+    first, first_value, second, second_value, otherwise = case.groups()
+    names = { "toInteger": int, "ceil": math.ceil }
+
+    if eval(first, names):
+        return int(first_value)
+    if eval(second, names):
+        return int(second_value)
+    return eval(otherwise, names)
+
+def recording(rows):
+    statements = []
+
+    def responder(cypher, params):
+        statements.append((cypher, params))
+        return rows
+
+    return statements, FakeDriver(responder)
+
+@pytest.mark.parametrize("rating, expected", [
+    (0.5, 0), (1, 1), (1.5, 2), (2.6, 5), (3, 5), (4.5, 8), (5, 9), (0, 0), (7, 9),
+])
+def test_ratings_fall_in_half_star_buckets(rating, expected):
+    assert bucket(rating) == expected
+    assert 0 <= expected < HISTOGRAM_BUCKETS
+
+def test_a_first_rating_counts_the_movies_earlier_ones():
+    movie = { "tmdbId": "769", "ratingCount": 1, "rating": 4 }
+    statements, driver = recording([ { "movie": movie } ])
+
+    assert RatingDAO(driver).add("u1", "769", 4) == movie
+
+    cypher, params = statements[0]
+
+    assert params == { "userId": "u1", "movieId": "769", "rating": 4 }
+    # A movie without aggregates is counted from its RATED relationships
+    assert "THEN [ (m)<-[x:RATED]-() | x.rating ]" in cypher
+    assert "ELSE [ $rating ] END AS added" in cypher
+
+def test_a_changed_rating_takes_the_previous_one_out():
+    statements, driver = recording([ { "movie": { "tmdbId": "769" } } ])
+
+    RatingDAO(driver).add("u1", "769", 4.5)
+    cypher, _ = statements[0]
+
+    assert "WITH m, r, r.rating AS previous" in cypher
+    assert "THEN [] ELSE [ previous ] END AS removed" in cypher
+    # The old rating leaves its bucket and the new one enters another
+    assert "- size([ x IN removed WHERE {0} = i ])".format(_bucket("x")) in cypher
+    assert "+ size([ x IN added WHERE {0} = i ])".format(_bucket("x")) in cypher
+    assert bucket(3) != bucket(4.5)
+
+def test_a_movie_left_without_ratings_has_no_mean():
+    statements, driver = recording([ { "movie": { "tmdbId": "769" } } ])
+
+    RatingDAO(driver).add("u1", "769", 3)
+    cypher, _ = statements[0]
+
+    assert "m.ratingCount = coalesce(m.ratingCount, 0) + size(added) - size(removed)" in cypher
+    assert "SET m.ratingMean = CASE WHEN m.ratingCount = 0 THEN null" in cypher
+
+def test_missing_users_or_movies_are_not_found():
+    _, driver = recording([])
+
+    with pytest.raises(NotFoundException):
+        RatingDAO(driver).add("u1", "nope", 3)
+
+def test_rebuild_recounts_in_batches():
+    statements, driver = recording([ { "movies": 9125 } ])
+
+    assert RatingDAO(driver).rebuild(batch_size=250) == 9125
+
+    cypher, params = statements[0]
+
+    assert params == { "batchSize": 250 }
+    assert "IN TRANSACTIONS OF $batchSize ROWS" in cypher
+    assert "REMOVE m.ratingCount, m.ratingSum, m.ratingHistogram" in cypher
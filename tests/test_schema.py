@@ -0,0 +1,82 @@
+from benchmarks.fake_driver import FakeDriver
+from types import SimpleNamespace
+
+from neo4j import Bookmarks
+
+from api.dao.schema import CONSTRAINTS, INDEXES, create_index, migrate, pending_migrations, strip_module_properties
+
+def existing(name, entity_type, label, properties, type="RANGE", owning=None):
+    return {
+        "name": name,
+        "type": type,
+        "entityType": entity_type,
+        "labelsOrTypes": [ label ] if label else None,
+        "properties": properties,
+        "owningConstraint": owning,
+    }
+
+def test_an_empty_database_gets_everything():
+    names = [ name for name, _ in pending_migrations([]) ]
+
+    assert names == list(CONSTRAINTS) + list(INDEXES)
+
+def test_equivalent_indexes_count_whatever_their_name():
+    pending = dict(pending_migrations([
+        existing("module_id_unique", "NODE", "Module", [ "id" ], owning="module_id_unique"),
+        existing("constraint_abc", "NODE", "Instance", [ "name" ], owning="constraint_abc"),
+        existing("index_123", "RELATIONSHIP", "DEPENDS_ON", [ "instance" ]),
+        existing("rated_timestamp", "RELATIONSHIP", "RATED", [ "timestamp" ]),
+    ]))
+
+    assert "module_id_unique" not in pending
+    assert "instance_name_unique" not in pending
+    assert "depends_on_instance" not in pending
+    assert "rated_timestamp" not in pending
+    assert "module_name" in pending
+
+def test_fulltext_and_lookup_indexes_do_not_count():
+    pending = dict(pending_migrations([
+        existing("person_name_fulltext", "NODE", "Person", [ "name" ], type="FULLTEXT"),
+        existing("index_lookup", "NODE", None, None, type="LOOKUP"),
+    ]))
+
+    assert "person_name" in pending
+
+def test_relationship_indexes_use_a_relationship_pattern():
+    assert create_index("depends_on_instance", "RELATIONSHIP", "DEPENDS_ON", [ "instance" ]) == (
+        "CREATE INDEX `depends_on_instance` IF NOT EXISTS FOR ()-[e:`DEPENDS_ON`]-() ON (e.`instance`)"
+    )
+
+def test_an_up_to_date_database_costs_one_round_trip():
+    rows = [
+        existing(name, entity_type, label, properties, owning=name if name in CONSTRAINTS else None)
+        for name, (entity_type, label, properties) in { **CONSTRAINTS, **INDEXES }.items()
+    ]
+    driver = FakeDriver(lambda cypher, params: rows if "SHOW INDEXES" in cypher else [])
+
+    assert migrate(driver) == []
+    assert driver.queries == 1
+
+def test_per_instance_properties_are_stripped_from_modules():
+    statements = []
+
+    class Session:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def run(self, cypher):
+            statements.append(cypher)
+            counters = SimpleNamespace(properties_set=3)
+            return SimpleNamespace(consume=lambda: SimpleNamespace(counters=counters))
+
+        def last_bookmarks(self):
+            return Bookmarks()
+
+    driver = SimpleNamespace(session=lambda **config: Session())
+
+    assert strip_module_properties(driver, batch=50) == 3
+    assert "REMOVE m.version, m.category" in statements[0]
+    assert "IN TRANSACTIONS OF 50 ROWS" in statements[0]
@@ -3,6 +3,7 @@ import pytest
 from neo4j.exceptions import Neo4jError
 
 from api.dao.neo4j_client import Neo4jClient
+from api.dao.schema import collapse_deployed_by
 from config import NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD
 
 @pytest.fixture(scope="module")
@@ -13,6 +14,8 @@ def neo4j_client():
     client.create_schema()
     # Create test data for the tests
     client.create_test_data()
+    # Remove mirrors left by data from older releases
+    collapse_deployed_by(client.driver)
     yield client
     client.close()
 
@@ -81,12 +84,13 @@ def test_relationships_exist(neo4j_client):
     """)
     assert result.single()["count"] == 2, "Expected 2 DEPLOYS relationships"
     
-    # Check DEPLOYED_BY relationships
+    # DEPLOYED_BY mirrors are gone; DEPLOYS is read in the other direction
     result = neo4j_client.run("""
         MATCH (:Module)-[r:DEPLOYED_BY]->(:Instance {name: 'prod-instance-1'})
         RETURN count(r) as count
     """)
-    assert result.single()["count"] == 2, "Expected 2 DEPLOYED_BY relationships"
+    assert result.single()["count"] == 0, "Expected no DEPLOYED_BY relationships"
+    assert "prod-instance-1" in neo4j_client.instances_deploying("module-1")
     
     # Check DEPENDS_ON relationship with properties
     result = neo4j_client.run("""
@@ -0,0 +1,43 @@
+from api.search import PrefixIndex, fulltext_query
+
+people = [
+    ("1158", "Al Pacino", 50),
+    ("1776", "Francis Ford Coppola", 18),
+    ("1271225", "François Lallement", 1),
+    ("3", "Paula Abdul", 2),
+    ("4", "Alan Alda", 30),
+]
+
+def test_fulltext_query_prefixes_last_term():
+    assert fulltext_query("Al Pac") == "al AND pac*"
+    assert fulltext_query("Ab") == "ab*"
+
+def test_fulltext_query_ignores_syntax():
+    assert fulltext_query("  ") is None
+    assert fulltext_query("pacino~ OR (") == "pacino AND or*"
+
+def test_complete_orders_by_weight():
+    index = PrefixIndex(people)
+
+    output = index.complete("al", 10)
+
+    assert [p["name"] for p in output] == ["Al Pacino", "Alan Alda"]
+
+def test_complete_matches_any_token_and_ignores_accents():
+    index = PrefixIndex(people)
+
+    assert index.complete("pacin")[0]["tmdbId"] == "1158"
+    assert index.complete("franco")[0]["name"] == "François Lallement"
+
+def test_complete_requires_every_term():
+    index = PrefixIndex(people)
+
+    output = index.complete("fra cop")
+
+    assert [p["tmdbId"] for p in output] == ["1776"]
+
+def test_short_prefixes_use_precomputed_head():
+    index = PrefixIndex(people, head_length=2, head_size=1)
+
+    assert index.complete("a", 1) == [{"tmdbId": "1158", "name": "Al Pacino"}]
+    assert len(index.complete("a", 5)) == 3
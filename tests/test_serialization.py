@@ -0,0 +1,38 @@
+import json
+
+import pytest
+from neo4j.graph import Graph, Node
+from neo4j.time import Date, DateTime, Duration
+
+from api.serialization import default, get_serializer, register_serializer
+
+graph = Graph()
+
+def test_nodes_and_relationships_serialize_as_properties():
+    node = Node(graph, "4:1", 1, ["Module"], { "id": "base", "version": "17.0" })
+    depends_on = graph.relationship_type("DEPENDS_ON")(graph, "5:2", 2, { "instance": "odoo1" })
+
+    assert default(node) == { "id": "base", "version": "17.0" }
+    assert default(depends_on) == { "instance": "odoo1" }
+
+def test_temporal_values_use_iso_format():
+    assert default(Date(2023, 1, 15)) == "2023-01-15"
+    assert default(DateTime(2023, 1, 15, 10, 30)).startswith("2023-01-15T10:30:00")
+    assert default(Duration(days=2)) == "P2D"
+
+def test_unknown_types_are_rejected():
+    with pytest.raises(TypeError):
+        default(object())
+
+@pytest.mark.parametrize("name", ["json", "auto"])
+def test_serializers_agree(name):
+    value = { "released": Date(1990, 9, 19), "genres": ["Crime", "Drama"], "imdbRating": 8.7 }
+
+    assert json.loads(get_serializer(name)(value)) == {
+        "released": "1990-09-19", "genres": ["Crime", "Drama"], "imdbRating": 8.7
+    }
+
+def test_custom_serializer_can_be_registered():
+    register_serializer("constant", lambda value: b"{}")
+
+    assert get_serializer("constant")({ "a": 1 }) == b"{}"
@@ -0,0 +1,77 @@
+from flask import Flask
+from neo4j import READ_ACCESS, WRITE_ACCESS, Bookmarks
+
+from api.dao import sessions
+from api.dao.sessions import BookmarkStore, decode_bookmarks, encode_bookmarks, read_session, write_session
+from api.middleware.bookmarks import BOOKMARK_HEADER, init_bookmarks
+
+class FakeSession:
+    def __init__(self, **config):
+        self.config = config
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def last_bookmarks(self):
+        return Bookmarks.from_raw_values(["FB:written"])
+
+class FakeDriver:
+    def __init__(self):
+        self.sessions = []
+
+    def session(self, **config):
+        self.sessions.append(FakeSession(**config))
+        return self.sessions[-1]
+
+def test_tokens_round_trip():
+    bookmarks = Bookmarks.from_raw_values(["FB:a", "FB:b"])
+
+    assert decode_bookmarks(encode_bookmarks(bookmarks)).raw_values == bookmarks.raw_values
+    assert decode_bookmarks("not a token!") is None
+    assert encode_bookmarks(Bookmarks()) is None
+
+def test_store_is_bounded():
+    store = BookmarkStore(size=2)
+
+    for user in ("a", "b", "c"):
+        store.update(user, Bookmarks.from_raw_values([user]))
+
+    assert store.get("a") is None
+    assert store.get("c").raw_values == frozenset(["c"])
+
+def test_reads_follow_the_users_writes(monkeypatch):
+    monkeypatch.setattr(sessions, "store", BookmarkStore())
+    driver = FakeDriver()
+
+    with read_session(driver, "user") as session:
+        assert session.config["default_access_mode"] == READ_ACCESS
+        assert session.config["bookmarks"] is None
+
+    with write_session(driver, "user") as session:
+        assert session.config["default_access_mode"] == WRITE_ACCESS
+
+    assert read_session(driver, "user").config["bookmarks"].raw_values == frozenset(["FB:written"])
+    assert read_session(driver, "someone else").config["bookmarks"] is None
+
+def test_bookmarks_travel_through_headers(monkeypatch):
+    monkeypatch.setattr(sessions, "store", BookmarkStore())
+    driver = FakeDriver()
+    app = init_bookmarks(Flask(__name__))
+
+    @app.post("/write")
+    def write():
+        with write_session(driver):
+            return "ok"
+
+    @app.get("/read")
+    def read():
+        return str(sorted(read_session(driver).config["bookmarks"].raw_values))
+
+    client = app.test_client()
+    token = client.post("/write").headers[BOOKMARK_HEADER]
+
+    assert client.get("/read", headers={ BOOKMARK_HEADER: token }).data == b"['FB:written']"
+    assert BOOKMARK_HEADER not in client.get("/read", headers={ BOOKMARK_HEADER: token }).headers
@@ -0,0 +1,113 @@
+import os
+import threading
+
+import pytest
+from neo4j.exceptions import ClientError
+
+from api.spool import REJECTED, Drainer, Spool
+
+def payload(name):
+    return [ { "instance": name, "status": "success", "data": { "nodes": [ { "id": "base" } ], "edges": [] } } ]
+
+def test_records_survive_a_restart(tmp_path):
+    spool = Spool(str(tmp_path))
+    first = spool.append(payload("odoo1"))
+    spool.append(payload("odoo2"))
+    spool.commit(first)
+    spool.close()
+
+    spool = Spool(str(tmp_path))
+    records = spool.read(spool.checkpoint, 10)
+
+    assert [ p[0]["instance"] for _, p in records ] == [ "odoo2" ]
+    spool.close()
+
+def test_segments_roll_and_are_removed_once_applied(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=200)
+    positions = [ spool.append(payload("odoo{0}".format(n))) for n in range(6) ]
+
+    assert len({ segment for segment, _ in positions }) > 1
+    assert len(spool.read((1, 0), 100)) == 6
+
+    spool.commit(positions[-1])
+
+    assert spool.stats()["segments"] == 1
+    assert spool.pending_bytes() == 0
+    spool.close()
+
+def test_a_torn_tail_is_truncated(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append(payload("odoo1"))
+    spool.close()
+
+    segment = [ name for name in os.listdir(str(tmp_path)) if name.endswith(".log") ][0]
+    with open(os.path.join(str(tmp_path), segment), "ab") as f:
+        f.write(b"\x00\x00\x01\x00garbage")
+
+    spool = Spool(str(tmp_path))
+    spool.append(payload("odoo2"))
+
+    assert [ p[0]["instance"] for _, p in spool.read(spool.checkpoint, 10) ] == [ "odoo1", "odoo2" ]
+    spool.close()
+
+def test_concurrent_appends_share_fsyncs(tmp_path):
+    spool = Spool(str(tmp_path))
+    threads = [
+        threading.Thread(target=lambda: [ spool.append(payload("odoo")) for _ in range(25) ])
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert spool.appended == 200
+    assert spool.fsyncs <= 200
+    assert len(spool.read(spool.checkpoint, 1000)) == 200
+    spool.close()
+
+def test_a_directory_has_one_owner(tmp_path):
+    spool = Spool(str(tmp_path))
+
+    with pytest.raises(RuntimeError):
+        Spool(str(tmp_path))
+
+    spool.close()
+
+def test_drainer_waits_out_failures(tmp_path):
+    spool = Spool(str(tmp_path))
+    attempts = []
+
+    def replay(instances_data):
+        attempts.append([ i["instance"] for i in instances_data ])
+        if len(attempts) < 3:
+            raise ConnectionError("Neo4j is down")
+        return { "rows": len(instances_data) }, "bookmark"
+
+    drainer = Drainer(spool, replay, retry_ms=1)
+    position = spool.append(payload("odoo1"))
+    drainer.start()
+
+    assert drainer.wait(position, 5) == ({ "rows": 1 }, "bookmark")
+    assert drainer.failures == 2
+    assert spool.checkpoint == position
+    spool.close()
+
+def test_drainer_sets_aside_rejected_records(tmp_path):
+    spool = Spool(str(tmp_path))
+
+    def replay(instances_data):
+        if any(i["instance"] == "bad" for i in instances_data):
+            raise ClientError("Invalid input")
+        return {}, None
+
+    drainer = Drainer(spool, replay, retry_ms=1)
+    bad = spool.append(payload("bad"))
+    good = spool.append(payload("good"))
+    drainer.start()
+
+    assert isinstance(drainer.wait(bad, 5), ClientError)
+    assert drainer.wait(good, 5) == ({}, None)
+    assert drainer.rejected == 1
+    assert os.path.exists(os.path.join(str(tmp_path), REJECTED))
+    spool.close()
@@ -0,0 +1,49 @@
+import gzip
+
+import pytest
+from flask import Flask
+
+from api.static import cache_control, static_blueprint
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "js").mkdir()
+    (tmp_path / "index.html").write_text("<html></html>")
+    (tmp_path / "js" / "app.6697881b.js").write_text("console.log('app')")
+    (tmp_path / "js" / "app.6697881b.js.gz").write_bytes(gzip.compress(b"console.log('app')"))
+
+    app = Flask(__name__)
+    app.register_blueprint(static_blueprint(str(tmp_path)))
+
+    return app.test_client()
+
+def test_hashed_files_are_immutable():
+    assert "immutable" in cache_control("js/app.6697881b.js")
+    assert "immutable" in cache_control("js/app.6697881b.js.map")
+    assert "immutable" not in cache_control("index.html")
+
+def test_precompressed_sibling_is_served(client):
+    response = client.get("/js/app.6697881b.js", headers={ "Accept-Encoding": "gzip, br" })
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.mimetype in ("application/javascript", "text/javascript")
+    assert gzip.decompress(response.data) == b"console.log('app')"
+
+def test_original_is_served_without_accept_encoding(client):
+    response = client.get("/js/app.6697881b.js")
+
+    assert "Content-Encoding" not in response.headers
+    assert response.data == b"console.log('app')"
+
+def test_client_routes_fall_back_to_index(client):
+    response = client.get("/movies/769")
+
+    assert response.data == b"<html></html>"
+    assert "max-age=60" in response.headers["Cache-Control"]
+    assert client.get("/api/unknown").status_code == 404
+    assert client.get("/missing.js").status_code == 404
+
+def test_index_revalidates_with_etag(client):
+    etag = client.get("/").headers["ETag"]
+
+    assert client.get("/", headers={ "If-None-Match": etag }).status_code == 304